@@ -1,20 +1,11 @@
 import asyncio
-from sqlalchemy import select
-from database import SessionLocal
-from models import Game
+from admin_maintenance import abort_games, game_filters, run
 
 async def finish_all_games():
-    async with SessionLocal() as session:
-        result = await session.execute(select(Game).where(Game.status != "finished"))
-        games = result.scalars().all()
-        count = 0
-        for game in games:
-            game.status = "finished"
-            game.result = "1/2-1/2"  # Set as draw/aborted
-            count += 1
-        
-        await session.commit()
-        print(f"Successfully finished {count} active games.")
+    # Closes every unfinished game as a draw, without rating changes, in chunks
+    # (see admin_maintenance.py for filters and the other jobs)
+    count = await abort_games(game_filters(None, None, None), "1/2-1/2", chunk_size=500, dry_run=False)
+    print(f"Successfully finished {count} active games.")
 
 if __name__ == "__main__":
-    asyncio.run(finish_all_games())
+    asyncio.run(run(finish_all_games()))
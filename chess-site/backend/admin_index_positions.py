@@ -0,0 +1,57 @@
+"""
+Rebuild the opening explorer's position index (see explorer.py) from the
+packed moves of all games, in chunks like admin_maintenance.py. Move
+statistics are recounted from scratch; games finishing while this runs are
+counted by the server as usual. Games not yet packed are skipped: run
+admin_pack_moves.py first.
+
+    python admin_index_positions.py --chunk-size 500
+"""
+import argparse
+import asyncio
+from collections import Counter
+from datetime import datetime, timezone
+from sqlalchemy import delete, or_
+from database import SessionLocal
+from models import Game, PositionMove
+from admin_maintenance import Progress, chunks, count
+import explorer, move_codec
+
+
+async def index_positions(chunk_size: int, pause: float = 0.0) -> int:
+    cutoff = datetime.now(timezone.utc)
+    async with SessionLocal() as session:
+        await session.execute(delete(PositionMove))
+        await session.commit()
+
+    conditions = [Game.moves_packed.is_not(None), Game.moves_packed != b""]
+    # Finished before the rebuild started; later games are counted live
+    counted = (Game.status == "finished") & or_(Game.finished_at.is_(None), Game.finished_at < cutoff)
+    columns = (Game.id, Game.moves_packed, Game.result, counted.label("counted"))
+    progress = Progress("index-positions", await count(conditions))
+    positions = 0
+    async for rows in chunks(conditions, chunk_size, columns):
+        position_rows = []
+        counts = Counter()
+        for row in rows:
+            played = explorer.game_positions(move_codec.unpack_moves(row.moves_packed))
+            position_rows += explorer.position_rows(row.id, played)
+            if row.counted and row.result in explorer.RESULT_COLUMNS:
+                explorer.move_counts(played, row.result, counts)
+        async with SessionLocal() as session:
+            await explorer.add_positions(session, position_rows)
+            await explorer.add_move_counts(session, counts)
+            await session.commit()
+        positions += len(position_rows)
+        progress.chunk(len(rows), len(rows))
+        await asyncio.sleep(pause)
+    print(f"index-positions: {positions} positions indexed")
+    return positions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between chunks")
+    args = parser.parse_args()
+    asyncio.run(index_positions(args.chunk_size, args.pause))
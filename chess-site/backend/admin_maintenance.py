@@ -0,0 +1,284 @@
+"""
+Maintenance jobs over the games and moves tables. Every job walks the
+matching games by id in chunks and commits each chunk on its own, so rows
+are locked only briefly and an interrupted run can simply be restarted.
+
+    python admin_maintenance.py abort --status waiting active --older-than 7d --dry-run
+    python admin_maintenance.py adjudicate --older-than 3d --margin 5
+    python admin_maintenance.py purge-moves --older-than 180d --archive
+
+Filters: --status, --older-than (no activity for 30d / 12h / 90m / seconds),
+--user (games where the user plays either colour).
+
+abort and adjudicate publish game_over on each finished game's channel, so
+running servers drop their cached state (with PUBSUB_BACKEND=local; the
+in-process backend cannot reach them and their caches expire instead).
+"""
+import argparse
+import asyncio
+import json
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+import chess
+from sqlalchemy import bindparam, delete, func, insert, or_, select, update
+from database import SessionLocal
+from models import ArchivedMove, Game, Move, User
+import move_codec, pgn_export, pubsub, ratings
+
+PIECE_VALUES = {chess.PAWN: 1, chess.KNIGHT: 3, chess.BISHOP: 3, chess.ROOK: 5, chess.QUEEN: 9}
+
+
+def parse_age(text: str) -> timedelta:
+    match = re.fullmatch(r"(\d+)([dhms]?)", text.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(f"bad age {text!r}, use e.g. 30d, 12h, 90m")
+    unit = {"d": "days", "h": "hours", "m": "minutes", "s": "seconds", "": "seconds"}[match.group(2)]
+    return timedelta(**{unit: int(match.group(1))})
+
+
+def game_filters(statuses: Optional[List[str]], older_than: Optional[timedelta], user_id: Optional[int]) -> list:
+    conditions = []
+    if statuses:
+        conditions.append(Game.status.in_(statuses))
+    if older_than is not None:
+        # Last sign of life: the last move, any update, or creation
+        last_activity = func.coalesce(Game.last_move_at, Game.updated_at, Game.created_at)
+        conditions.append(last_activity < datetime.now(timezone.utc) - older_than)
+    if user_id is not None:
+        conditions.append(or_(Game.white_player_id == user_id, Game.black_player_id == user_id))
+    return conditions
+
+
+async def count(conditions: list) -> int:
+    async with SessionLocal() as session:
+        result = await session.execute(select(func.count(Game.id)).where(*conditions))
+        return result.scalar()
+
+
+async def chunks(conditions: list, chunk_size: int, columns=(Game.id,)):
+    """Yield lists of matching rows, keyset-paged by game id, each read in its own session."""
+    last_id = 0
+    while True:
+        async with SessionLocal() as session:
+            result = await session.execute(
+                select(*columns).where(*conditions, Game.id > last_id).order_by(Game.id).limit(chunk_size)
+            )
+            rows = result.all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+        yield rows
+
+
+async def announce_finished(finished: List[Tuple[int, str]], reason: str):
+    for game_id, result in finished:
+        message = json.dumps({"type": "game_over", "result": result, "reason": reason})
+        await pubsub.backend.publish(f"game:{game_id}", message)
+
+
+class Progress:
+    def __init__(self, job: str, total: int):
+        self.job = job
+        self.total = total
+        self.done = 0
+        self.changed = 0
+        self.started = time.monotonic()
+
+    def chunk(self, seen: int, changed: int):
+        self.done += seen
+        self.changed += changed
+        rate = self.done / max(time.monotonic() - self.started, 1e-9)
+        print(f"{self.job}: {self.done}/{self.total} games checked, {self.changed} changed ({rate:.0f} games/s)")
+
+
+async def abort_games(conditions: list, result: str, chunk_size: int, dry_run: bool, pause: float = 0.0) -> int:
+    """Finish matching unfinished games without a winner and without touching ratings."""
+    conditions = conditions + [Game.status != "finished"]
+    total = await count(conditions)
+    if dry_run:
+        print(f"abort: {total} games would be finished as {result}")
+        return total
+    progress = Progress("abort", total)
+    async for rows in chunks(conditions, chunk_size):
+        async with SessionLocal() as session:
+            changed = await session.execute(
+                update(Game)
+                .where(Game.id.in_([row.id for row in rows]), Game.status != "finished")
+                .values(status="finished", result=result, winner_id=None, finished_at=func.now())
+                .returning(Game.id)
+                .execution_options(synchronize_session=False)
+            )
+            finished = [(game_id, result) for game_id in changed.scalars()]
+            await session.commit()
+        await announce_finished(finished, "aborted")
+        progress.chunk(len(rows), len(finished))
+        await asyncio.sleep(pause)
+    return progress.changed
+
+
+def material(board: chess.Board, color: chess.Color) -> int:
+    return sum(len(board.pieces(piece, color)) * value for piece, value in PIECE_VALUES.items())
+
+
+def adjudicate(fen: str, margin: int) -> str:
+    board = chess.Board(fen)
+    balance = material(board, chess.WHITE) - material(board, chess.BLACK)
+    if balance >= margin:
+        return "1-0"
+    if balance <= -margin:
+        return "0-1"
+    return "1/2-1/2"
+
+
+async def adjudicate_games(conditions: list, margin: int, forced_result: Optional[str], chunk_size: int, dry_run: bool, pause: float = 0.0) -> int:
+    """
+    Decide active games: by material balance (at least margin pawns wins,
+    otherwise a draw) or a forced result, with the usual Elo update.
+    """
+    conditions = conditions + [Game.status == "active"]
+    total = await count(conditions)
+    columns = (Game.id, Game.fen, Game.white_player_id, Game.black_player_id)
+    progress = Progress("adjudicate", total)
+    tally: dict = {}
+    async for rows in chunks(conditions, chunk_size, columns):
+        decided = [(row, forced_result or adjudicate(row.fen, margin)) for row in rows]
+        if dry_run:
+            for _, result in decided:
+                tally[result] = tally.get(result, 0) + 1
+            progress.chunk(len(rows), 0)
+            continue
+
+        async with SessionLocal() as session:
+            player_ids = {row.white_player_id for row in rows} | {row.black_player_id for row in rows}
+            found = await session.execute(select(User.id, User.rating).where(User.id.in_(player_ids)))
+            current = dict(found.all())
+            deltas: dict = {}
+            finished = []
+            for row, result in decided:
+                winner_id = {"1-0": row.white_player_id, "0-1": row.black_player_id}.get(result)
+                # Only the position we looked at: a move since then leaves the game alone
+                updated = await session.execute(
+                    update(Game)
+                    .where(Game.id == row.id, Game.status == "active", Game.fen == row.fen)
+                    .values(status="finished", result=result, winner_id=winner_id, finished_at=func.now())
+                    .execution_options(synchronize_session=False)
+                )
+                if updated.rowcount != 1:
+                    continue
+                finished.append((row.id, result))
+                white, black = current.get(row.white_player_id), current.get(row.black_player_id)
+                if white is None or black is None:
+                    continue
+                score_white = {"1-0": 1, "0-1": 0}.get(result, 0.5)
+                current[row.white_player_id] = ratings.calculate_elo(white, black, score_white)
+                current[row.black_player_id] = ratings.calculate_elo(black, white, 1 - score_white)
+                deltas[row.white_player_id] = deltas.get(row.white_player_id, 0) + current[row.white_player_id] - white
+                deltas[row.black_player_id] = deltas.get(row.black_player_id, 0) + current[row.black_player_id] - black
+            rating_updates = [{"user_id": user_id, "delta": delta} for user_id, delta in deltas.items() if delta]
+            if rating_updates:
+                # Relative, so games finishing on the site meanwhile aren't overwritten
+                await session.execute(
+                    update(User.__table__).where(User.id == bindparam("user_id")).values(rating=User.rating + bindparam("delta")),
+                    rating_updates,
+                )
+            await session.commit()
+        await announce_finished(finished, "adjudicated")
+        progress.chunk(len(rows), len(finished))
+        await asyncio.sleep(pause)
+    if dry_run:
+        print(f"adjudicate: {total} games would be decided: {tally}")
+    return progress.changed
+
+
+async def purge_moves(conditions: list, archive: bool, chunk_size: int, dry_run: bool, pause: float = 0.0) -> int:
+    """
+    Delete the per-move rows of finished games whose moves are packed on the
+    game row (see move_codec), optionally copying them to moves_archive first.
+    Games without a stored PGN get one built from the packed moves, since
+    exports fall back to the move rows otherwise.
+    """
+    conditions = conditions + [Game.status == "finished", Game.moves_packed.is_not(None), Game.moves_packed != b""]
+    total = await count(conditions)
+    if dry_run:
+        async with SessionLocal() as session:
+            rows = await session.execute(
+                select(func.count(Move.id)).join(Game, Game.id == Move.game_id).where(*conditions)
+            )
+        print(f"purge-moves: {rows.scalar()} move rows of {total} games would be {'archived' if archive else 'deleted'}")
+        return total
+
+    progress = Progress("purge-moves", total)
+    removed = 0
+    async for rows in chunks(conditions, chunk_size):
+        game_ids = [row.id for row in rows]
+        async with SessionLocal() as session:
+            missing_pgn = await session.execute(
+                select(Game).where(Game.id.in_(game_ids), or_(Game.pgn.is_(None), Game.pgn == ""))
+            )
+            for game in missing_pgn.scalars():
+                white = await session.get(User, game.white_player_id) if game.white_player_id else None
+                black = await session.get(User, game.black_player_id) if game.black_player_id else None
+                _, sans = move_codec.replay(game.moves_packed)
+                game.pgn = pgn_export.build_pgn(game, sans, white and white.username, black and black.username)
+            await session.flush()
+
+            if archive:
+                columns = [Move.id, Move.game_id, Move.player_id, Move.move_san, Move.ply, Move.fen_after, Move.created_at]
+                await session.execute(
+                    insert(ArchivedMove).from_select(
+                        [column.key for column in columns], select(*columns).where(Move.game_id.in_(game_ids))
+                    )
+                )
+            deleted = await session.execute(
+                delete(Move).where(Move.game_id.in_(game_ids)).execution_options(synchronize_session=False)
+            )
+            await session.commit()
+        removed += deleted.rowcount
+        progress.chunk(len(rows), deleted.rowcount)
+        await asyncio.sleep(pause)
+    print(f"purge-moves: {removed} move rows {'archived' if archive else 'deleted'}")
+    return removed
+
+
+async def run(job):
+    await pubsub.backend.start()
+    try:
+        return await job
+    finally:
+        await pubsub.backend.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--status", nargs="+", choices=["waiting", "active", "finished"])
+    common.add_argument("--older-than", type=parse_age)
+    common.add_argument("--user", type=int, help="only games of this user id")
+    common.add_argument("--chunk-size", type=int, default=500)
+    common.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between chunks")
+    common.add_argument("--dry-run", action="store_true", help="only count what would change")
+    jobs = parser.add_subparsers(dest="job", required=True)
+
+    abort = jobs.add_parser("abort", parents=[common], help="finish stale games without rating changes")
+    abort.add_argument("--result", default="*", help='stored result, "*" (aborted) by default')
+    adjudicate_job = jobs.add_parser("adjudicate", parents=[common], help="decide active games and update ratings")
+    adjudicate_job.add_argument("--margin", type=int, default=5, help="material lead (pawns) that wins")
+    adjudicate_job.add_argument("--result", choices=["1-0", "0-1", "1/2-1/2"], help="force this result instead")
+    purge = jobs.add_parser("purge-moves", parents=[common], help="drop move rows of finished, packed games")
+    purge.add_argument("--archive", action="store_true", help="copy rows to moves_archive before deleting")
+    args = parser.parse_args()
+
+    conditions = game_filters(args.status, args.older_than, args.user)
+    if args.job == "abort":
+        job = abort_games(conditions, args.result, args.chunk_size, args.dry_run, args.pause)
+    elif args.job == "adjudicate":
+        job = adjudicate_games(conditions, args.margin, args.result, args.chunk_size, args.dry_run, args.pause)
+    else:
+        job = purge_moves(conditions, args.archive, args.chunk_size, args.dry_run, args.pause)
+    asyncio.run(run(job))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Convert games stored as one `moves` row with a full FEN per ply into the
+packed Game.moves_packed encoding (see move_codec).
+
+Every game is checked before it is written: the move log is replayed with
+python-chess, each stored fen_after must match the replay, and decoding the
+packed bytes must give back the same moves, SANs and FENs. Games that fail
+are reported and left untouched.
+
+    python admin_pack_moves.py --verify-only      # round-trip check, no writes
+    python admin_pack_moves.py                    # pack, keep fen_after
+    python admin_pack_moves.py --drop-fens        # pack and clear fen_after
+"""
+import argparse
+import asyncio
+from typing import Optional
+import chess
+from sqlalchemy import update
+from sqlalchemy.future import select
+from database import SessionLocal
+from live_games import parse_move
+from models import Game, Move
+import move_codec
+
+
+def pack_game(final_fen: str, rows: list) -> Optional[bytes]:
+    """Packed moves for a game, or None if the stored log does not round-trip."""
+    board = chess.Board()
+    sans = []
+    for row in rows:
+        try:
+            move = parse_move(board, row.move_san)
+        except ValueError:
+            return None
+        sans.append(board.san(move))
+        board.push(move)
+        if row.fen_after is not None and row.fen_after != board.fen():
+            return None
+    if board.fen() != final_fen:
+        return None
+
+    packed = move_codec.pack_moves(board.move_stack)
+    replayed, replayed_sans = move_codec.replay(packed)
+    fens = move_codec.PositionCache(max_size=1).fens(packed)
+    if move_codec.unpack_moves(packed) != board.move_stack or replayed_sans != sans or replayed.fen() != final_fen:
+        return None
+    stored = [row.fen_after for row in rows]
+    if any(fen is not None and fen != rebuilt for fen, rebuilt in zip(stored, fens)):
+        return None
+    return packed
+
+
+async def pack_all(chunk_size: int, drop_fens: bool, verify_only: bool):
+    last_id = 0
+    packed_count = failed = saved_bytes = 0
+    while True:
+        async with SessionLocal() as session:
+            result = await session.execute(
+                select(Game.id, Game.fen)
+                .where(Game.moves_packed.is_(None), Game.id > last_id)
+                .order_by(Game.id)
+                .limit(chunk_size)
+            )
+            games = result.all()
+            if not games:
+                break
+            last_id = games[-1].id
+
+            result = await session.execute(
+                select(Move.id, Move.game_id, Move.move_san, Move.fen_after)
+                .where(Move.game_id.in_([game.id for game in games]))
+                .order_by(Move.game_id, Move.id)
+            )
+            rows_by_game: dict = {game.id: [] for game in games}
+            for row in result.all():
+                rows_by_game[row.game_id].append(row)
+
+            move_updates = []
+            for game in games:
+                rows = rows_by_game[game.id]
+                packed = pack_game(game.fen, rows)
+                if packed is None:
+                    failed += 1
+                    print(f"Game {game.id}: move log does not round-trip, skipped")
+                    continue
+                packed_count += 1
+                saved_bytes += sum(len(row.fen_after or "") for row in rows)
+                if verify_only:
+                    continue
+                # The app may have packed an active game meanwhile: don't overwrite it
+                await session.execute(
+                    update(Game).where(Game.id == game.id, Game.moves_packed.is_(None)).values(moves_packed=packed)
+                )
+                for ply, row in enumerate(rows, start=1):
+                    values = {"id": row.id, "ply": ply}
+                    if drop_fens:
+                        values["fen_after"] = None
+                    move_updates.append(values)
+
+            if move_updates:
+                await session.execute(update(Move), move_updates)
+            await session.commit()
+        print(f"... up to game {last_id}: {packed_count} ok, {failed} failed")
+
+    action = "verified" if verify_only else "packed"
+    print(f"Done: {packed_count} games {action}, {failed} failed.")
+    if drop_fens and not verify_only:
+        print(f"Cleared ~{saved_bytes} bytes of fen_after (run VACUUM to reclaim the space).")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--drop-fens", action="store_true", help="clear moves.fen_after once a game is packed")
+    parser.add_argument("--verify-only", action="store_true", help="only run the round-trip check")
+    args = parser.parse_args()
+    asyncio.run(pack_all(args.chunk_size, args.drop_fens, args.verify_only))
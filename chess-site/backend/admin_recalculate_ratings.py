@@ -0,0 +1,177 @@
+"""
+Recompute every user's rating by replaying all finished games in the order
+they finished (see rating_engine), and report how far the result is from
+the stored ratings. Nothing is written without --write.
+
+    python admin_recalculate_ratings.py                                  # live formula, report only
+    python admin_recalculate_ratings.py --k 24 --rounding none --write
+    python admin_recalculate_ratings.py --system glicko2 --period 7d --csv ratings.csv
+
+Games with a 1-0, 0-1 or 1/2-1/2 result between two users are rated;
+aborted games ("*") are not. Everyone starts from --initial. The write is
+relative (rating = rating + difference), so games finishing during the run
+are not lost; the leaderboard picks the new ratings up on its next check.
+"""
+import argparse
+import asyncio
+import csv
+import time
+import numpy as np
+from sqlalchemy import bindparam, case, extract, func, select, update
+from database import SessionLocal
+from models import Game, User
+from admin_maintenance import parse_age
+from rating_engine import Elo, Glicko2
+
+
+async def load_users():
+    async with SessionLocal() as session:
+        result = await session.execute(select(User.id, User.rating).order_by(User.id))
+        rows = result.all()
+    ids = np.array([row.id for row in rows], dtype=np.int64)
+    current = np.array([row.rating if row.rating is not None else 0 for row in rows], dtype=np.int64)
+    return ids, current
+
+
+async def game_chunks(ids: np.ndarray, chunk_size: int, with_time: bool):
+    """Finished games in finishing order as (white, black, score, finished) arrays of player indices."""
+    finished_at = func.coalesce(Game.finished_at, Game.updated_at, Game.created_at)
+    # White's score in half points, so every column comes back as a number
+    half_points = case((Game.result == "1-0", 2), (Game.result == "0-1", 0), else_=1)
+    columns = [Game.white_player_id, Game.black_player_id, half_points]
+    if with_time:
+        columns.append(extract("epoch", finished_at))
+    statement = (
+        select(*columns)
+        .where(
+            Game.status == "finished",
+            Game.result.in_(["1-0", "0-1", "1/2-1/2"]),
+            Game.white_player_id.is_not(None),
+            Game.black_player_id.is_not(None),
+            Game.white_player_id != Game.black_player_id,
+        )
+        .order_by(finished_at, Game.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    async with SessionLocal() as session:
+        result = await session.stream(statement)
+        async for rows in result.partitions():
+            values = list(zip(*rows))
+            white = np.searchsorted(ids, np.array(values[0], dtype=np.int64))
+            black = np.searchsorted(ids, np.array(values[1], dtype=np.int64))
+            score = np.array(values[2], dtype=np.float64) / 2
+            finished = np.array(values[3], dtype=np.float64) if with_time else None
+            yield white, black, score, finished
+
+
+async def replay_elo(ids, initial: int, k: float, rounding: str, chunk_size: int) -> Elo:
+    engine = Elo(np.full(len(ids), initial), k, rounding)
+    async for white, black, score, _ in game_chunks(ids, chunk_size, with_time=False):
+        engine.update(white, black, score)
+    return engine
+
+
+async def replay_glicko2(ids, initial: int, period: float, tau: float, chunk_size: int) -> Glicko2:
+    engine = Glicko2(np.full(len(ids), float(initial)), tau=tau)
+    start = last_period = None
+    pending = None
+
+    def rate(white, black, score, index):
+        nonlocal last_period
+        engine.update(white, black, score, 1 if last_period is None else index - last_period)
+        last_period = index
+
+    async for white, black, score, finished in game_chunks(ids, chunk_size, with_time=True):
+        if start is None:
+            start = finished[0]
+        periods = ((finished - start) // period).astype(np.int64)
+        if pending is not None:
+            white, black, score, periods = (np.concatenate(pair) for pair in zip(pending, (white, black, score, periods)))
+        # Rate every complete period; the last one may continue in the next chunk
+        edges = [0, *(np.flatnonzero(np.diff(periods)) + 1).tolist()]
+        for begin, end in zip(edges, edges[1:]):
+            rate(white[begin:end], black[begin:end], score[begin:end], periods[begin])
+        pending = tuple(column[edges[-1]:] for column in (white, black, score, periods))
+    if pending is not None:
+        white, black, score, periods = pending
+        rate(white, black, score, periods[0])
+    return engine
+
+
+async def usernames(user_ids) -> dict:
+    async with SessionLocal() as session:
+        result = await session.execute(select(User.id, User.username).where(User.id.in_(user_ids)))
+        return dict(result.all())
+
+
+def write_csv(path: str, ids, current, new, deviations):
+    with open(path, "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["user_id", "current", "recalculated", "difference"] + (["rd"] if deviations is not None else []))
+        for i in range(len(ids)):
+            row = [int(ids[i]), int(current[i]), int(new[i]), int(new[i] - current[i])]
+            if deviations is not None:
+                row.append(round(float(deviations[i]), 1))
+            writer.writerow(row)
+
+
+async def write_back(ids, difference, chunk_size: int) -> int:
+    changed = np.flatnonzero(difference)
+    for start in range(0, len(changed), chunk_size):
+        part = changed[start:start + chunk_size]
+        async with SessionLocal() as session:
+            await session.execute(
+                update(User.__table__).where(User.id == bindparam("user_id")).values(rating=User.rating + bindparam("delta")),
+                [{"user_id": int(ids[i]), "delta": int(difference[i])} for i in part],
+            )
+            await session.commit()
+    return len(changed)
+
+
+async def recalculate(args):
+    started = time.perf_counter()
+    ids, current = await load_users()
+    if args.system == "elo":
+        engine = await replay_elo(ids, args.initial, args.k, args.rounding, args.chunk_size)
+        deviations = None
+    else:
+        engine = await replay_glicko2(ids, args.initial, args.period.total_seconds(), args.tau, args.chunk_size)
+        deviations = engine.deviations()
+    elapsed = time.perf_counter() - started
+    new = np.rint(engine.result()).astype(np.int64)
+    difference = new - current
+
+    print(f"{args.system}: {engine.games} games, {len(ids)} users in {elapsed:.1f}s ({engine.games / max(elapsed, 1e-9):.0f} games/s)")
+    moved = np.flatnonzero(difference)
+    print(f"{len(moved)} ratings differ; mean |difference| {np.abs(difference).mean() if len(ids) else 0:.1f}, max {np.abs(difference).max() if len(ids) else 0}")
+    top = moved[np.argsort(-np.abs(difference[moved]), kind="stable")][:args.top]
+    names = await usernames([int(ids[i]) for i in top]) if len(top) else {}
+    for i in top:
+        extra = f"  rd {deviations[i]:.0f}" if deviations is not None else ""
+        print(f"  {names.get(int(ids[i]), ids[i])!s:>20}: {current[i]:5d} -> {new[i]:5d} ({difference[i]:+d}){extra}")
+    if args.csv:
+        write_csv(args.csv, ids, current, new, deviations)
+        print(f"Wrote {args.csv}")
+    if args.write:
+        count = await write_back(ids, difference, args.chunk_size)
+        print(f"Updated {count} ratings.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--system", choices=["elo", "glicko2"], default="elo")
+    parser.add_argument("--initial", type=int, default=1200, help="starting rating of every user")
+    parser.add_argument("--k", type=float, default=32, help="Elo K-factor")
+    parser.add_argument("--rounding", choices=["truncate", "round", "none"], default="truncate",
+                        help="Elo rating after each game: truncated like the live code, rounded, or kept fractional")
+    parser.add_argument("--period", type=parse_age, default=parse_age("7d"), help="Glicko-2 rating period")
+    parser.add_argument("--tau", type=float, default=0.5, help="Glicko-2 volatility constraint")
+    parser.add_argument("--chunk-size", type=int, default=100000, help="games fetched per round trip")
+    parser.add_argument("--top", type=int, default=20, help="largest differences to list")
+    parser.add_argument("--csv", help="write every user's current and recalculated rating here")
+    parser.add_argument("--write", action="store_true", help="store the recalculated ratings")
+    asyncio.run(recalculate(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
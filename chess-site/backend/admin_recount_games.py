@@ -0,0 +1,26 @@
+import asyncio
+from sqlalchemy import func, inspect, or_, select, text, update
+from database import engine
+from models import Game, User
+
+def _has_games_played(sync_conn):
+    columns = inspect(sync_conn).get_columns("users")
+    return any(column["name"] == "games_played" for column in columns)
+
+async def recount_games_played():
+    async with engine.begin() as conn:
+        # Databases created before the column existed: create_all won't add it
+        if not await conn.run_sync(_has_games_played):
+            await conn.execute(text("ALTER TABLE users ADD COLUMN games_played INTEGER NOT NULL DEFAULT 0"))
+            print("Added users.games_played column.")
+
+        played = (
+            select(func.count(Game.id))
+            .where(or_(Game.white_player_id == User.id, Game.black_player_id == User.id))
+            .scalar_subquery()
+        )
+        result = await conn.execute(update(User).values(games_played=played))
+        print(f"Recounted games_played for {result.rowcount} users.")
+
+if __name__ == "__main__":
+    asyncio.run(recount_games_played())
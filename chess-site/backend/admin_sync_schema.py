@@ -0,0 +1,31 @@
+import asyncio
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn, CreateIndex
+from database import engine
+import models
+
+def _sync(sync_conn):
+    # create_all only creates missing tables; existing ones also need the
+    # columns and indexes added to models since they were created
+    models.Base.metadata.create_all(sync_conn)
+    inspector = inspect(sync_conn)
+    for table in models.Base.metadata.sorted_tables:
+        columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in columns:
+                spec = CreateColumn(column).compile(dialect=sync_conn.dialect)
+                sync_conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {spec}"))
+                print(f"Added column {table.name}.{column.name}")
+        indexes = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                sync_conn.execute(CreateIndex(index))
+                print(f"Created index {index.name}")
+
+async def sync_schema():
+    async with engine.begin() as conn:
+        await conn.run_sync(_sync)
+    print("Schema is up to date.")
+
+if __name__ == "__main__":
+    asyncio.run(sync_schema())
@@ -0,0 +1,166 @@
+"""
+Post-game analysis, run in worker processes (see analysis_queue.py). Every
+position of a game is scored by an evaluator and each move is labelled by
+how much it lost for the side that played it.
+
+Evaluators return (score, best move) for a position, the score in
+centipawns from White's point of view:
+
+- MaterialSearch: built-in alpha-beta over material and mobility, with a
+  capture-only quiescence search at the leaves.
+- UciEngine: a local UCI binary (Stockfish or similar) via chess.engine.
+"""
+from typing import List, Optional, Tuple
+import chess
+
+PIECE_VALUES = {chess.PAWN: 100, chess.KNIGHT: 320, chess.BISHOP: 330, chess.ROOK: 500, chess.QUEEN: 900, chess.KING: 0}
+MOBILITY_WEIGHT = 2
+MATE_SCORE = 10000
+# Loss (centipawns) from which a move is labelled
+LABELS = ((300, "blunder"), (100, "mistake"), (50, "inaccuracy"))
+
+
+class MaterialSearch:
+    def __init__(self, depth: int = 2, quiescence_depth: int = 4):
+        self.depth = depth
+        self.quiescence_depth = quiescence_depth
+        self.name = f"material-mobility/d{depth}"
+        self.nodes = 0
+
+    def _static(self, board: chess.Board) -> int:
+        # Side to move's point of view
+        score = 0
+        for piece_type, value in PIECE_VALUES.items():
+            pieces = board.pieces_mask(piece_type, chess.WHITE), board.pieces_mask(piece_type, chess.BLACK)
+            score += value * (chess.popcount(pieces[0]) - chess.popcount(pieces[1]))
+        mobility = board.pseudo_legal_moves.count()
+        board.turn = not board.turn
+        mobility -= board.pseudo_legal_moves.count()
+        board.turn = not board.turn
+        score = score if board.turn == chess.WHITE else -score
+        return score + MOBILITY_WEIGHT * mobility
+
+    def _ordered(self, board: chess.Board, moves) -> list:
+        # Captures of valuable pieces by cheap ones first, then promotions, then the rest
+        def key(move):
+            victim = board.piece_type_at(move.to_square) if board.is_capture(move) else None
+            attacker = board.piece_type_at(move.from_square)
+            return -(PIECE_VALUES.get(victim, 100 if victim is None and board.is_en_passant(move) else 0) * 10
+                     - PIECE_VALUES[attacker] // 10 + (800 if move.promotion else 0))
+        return sorted(moves, key=key)
+
+    def _quiescence(self, board: chess.Board, alpha: int, beta: int, depth: int) -> int:
+        self.nodes += 1
+        stand_pat = self._static(board)
+        if stand_pat >= beta or depth == 0:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+        for move in self._ordered(board, board.generate_legal_captures()):
+            board.push(move)
+            score = -self._quiescence(board, -beta, -alpha, depth - 1)
+            board.pop()
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+    def _negamax(self, board: chess.Board, depth: int, alpha: int, beta: int, ply: int) -> Tuple[int, Optional[chess.Move]]:
+        self.nodes += 1
+        if board.is_checkmate():
+            return -MATE_SCORE + ply, None
+        if board.is_stalemate() or board.is_insufficient_material():
+            return 0, None
+        if depth == 0:
+            return self._quiescence(board, alpha, beta, self.quiescence_depth), None
+        best_move = None
+        for move in self._ordered(board, board.legal_moves):
+            board.push(move)
+            score = -self._negamax(board, depth - 1, -beta, -alpha, ply + 1)[0]
+            board.pop()
+            if score > alpha or best_move is None:
+                alpha, best_move = max(alpha, score), move
+            if alpha >= beta:
+                break
+        return alpha, best_move
+
+    def analyse(self, board: chess.Board) -> Tuple[int, Optional[chess.Move]]:
+        score, best = self._negamax(board.copy(stack=False), self.depth, -MATE_SCORE - 1, MATE_SCORE + 1, 0)
+        return (score if board.turn == chess.WHITE else -score), best
+
+    def close(self):
+        pass
+
+
+class UciEngine:
+    def __init__(self, path: str, seconds: float = 0.1):
+        import chess.engine
+        self._engine = chess.engine.SimpleEngine.popen_uci(path)
+        self._limit = chess.engine.Limit(time=seconds)
+        self.name = f"uci:{self._engine.id.get('name', path)}"
+
+    def analyse(self, board: chess.Board) -> Tuple[int, Optional[chess.Move]]:
+        info = self._engine.analyse(board, self._limit)
+        pv = info.get("pv") or [None]
+        return info["score"].white().score(mate_score=MATE_SCORE), pv[0]
+
+    def close(self):
+        self._engine.quit()
+
+
+def make_evaluator(engine_path: str = "", depth: int = 2, engine_seconds: float = 0.1):
+    return UciEngine(engine_path, engine_seconds) if engine_path else MaterialSearch(depth)
+
+
+def label(loss: int) -> Optional[str]:
+    for threshold, name in LABELS:
+        if loss >= threshold:
+            return name
+    return None
+
+
+def analyze_game(sans: List[str], evaluator) -> List[dict]:
+    """One annotation per move: evaluation after it, the loss for the mover, a label and the best move."""
+    board = chess.Board()
+    scores, bests = [], []
+    for san in sans + [None]:
+        if board.is_checkmate():
+            score, best = (-MATE_SCORE if board.turn == chess.WHITE else MATE_SCORE), None
+        elif board.is_game_over():
+            score, best = 0, None
+        else:
+            score, best = evaluator.analyse(board)
+        scores.append(score)
+        bests.append(best and board.san(best))
+        if san is not None:
+            board.push_san(san)
+
+    annotations = []
+    for ply, san in enumerate(sans, start=1):
+        # Capped so that missing a mate doesn't dwarf every other loss
+        before, after = (max(-2000, min(2000, score)) for score in scores[ply - 1:ply + 1])
+        loss = max(0, before - after if ply % 2 == 1 else after - before)
+        annotations.append({
+            "ply": ply,
+            "san": san,
+            "eval": scores[ply],
+            "loss": loss,
+            "label": label(loss),
+            "best": bests[ply - 1] if bests[ply - 1] != san else None,
+        })
+    return annotations
+
+
+# Worker process state: one evaluator per process, created by the pool initializer
+_evaluator = None
+
+
+def init_worker(engine_path: str, depth: int, engine_seconds: float):
+    global _evaluator
+    _evaluator = make_evaluator(engine_path, depth, engine_seconds)
+
+
+def run_analysis(sans: List[str]) -> Tuple[str, List[dict]]:
+    """Pool entry point: the evaluator's name and the annotations."""
+    if _evaluator is None:
+        init_worker("", 2, 0.1)
+    return _evaluator.name, analyze_game(sans, _evaluator)
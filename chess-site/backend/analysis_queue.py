@@ -0,0 +1,231 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import chess
+from sqlalchemy import update
+from sqlalchemy.future import select
+import analysis, database, models, move_codec
+from config import settings
+from live_games import parse_move
+
+logger = logging.getLogger(__name__)
+
+
+def to_san(moves: list) -> list:
+    # Move rows written before input was normalized may hold UCI ("e2e4")
+    board = chess.Board()
+    sans = []
+    for text in moves:
+        move = parse_move(board, text)
+        sans.append(board.san(move))
+        board.push(move)
+    return sans
+
+
+class AnalysisQueue:
+    """
+    Finished games waiting for analysis. The game_analysis row, written when
+    the game finishes, is the durable job; the in-memory queue only hands
+    ids to the consumers and is bounded: when it is full a job just waits in
+    the table until the next sweep finds it. Jobs are claimed with a
+    conditional UPDATE, so several server processes can share the table,
+    and failed jobs are retried with a growing delay.
+    """
+
+    def __init__(self, workers: int, queue_size: int, max_attempts: int, timeout: float):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.timeout = timeout
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._queued: set = set()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._tasks: list = []
+        self._started = time.monotonic()
+        self._busy = 0.0
+        self.running = 0
+        self.done = 0
+        self.failed = 0
+        self.retried = 0
+        self.plies = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=analysis.init_worker,
+                initargs=(settings.ANALYSIS_ENGINE_PATH, settings.ANALYSIS_DEPTH, settings.ANALYSIS_ENGINE_SECONDS),
+            )
+        return self._executor
+
+    def submit(self, game_id: int) -> bool:
+        """Hand a job to the consumers now; False if it has to wait for a sweep."""
+        if not self.workers or game_id in self._queued:
+            return False
+        try:
+            self._queue.put_nowait(game_id)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self._queued.add(game_id)
+        return True
+
+    def start(self, sweep_interval: float):
+        if not self.workers:
+            return
+        # Bound to the running loop from here on
+        self._queue = asyncio.Queue(maxsize=self._queue.maxsize)
+        self._queued.clear()
+        self._tasks = [asyncio.create_task(self._consume()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._sweep(sweep_interval)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _sweep(self, interval: float):
+        while True:
+            try:
+                await self.requeue()
+            except Exception:
+                logger.exception("analysis sweep failed")
+            await asyncio.sleep(interval)
+
+    async def requeue(self):
+        now = datetime.now(timezone.utc)
+        async with database.SessionLocal() as db:
+            # Claimed by a process that died or lost the job
+            await db.execute(
+                update(models.GameAnalysis)
+                .where(models.GameAnalysis.status == "running", models.GameAnalysis.updated_at < now - timedelta(seconds=2 * self.timeout))
+                .values(status="pending", updated_at=now)
+            )
+            await db.commit()
+            free = self._queue.maxsize - self._queue.qsize()
+            if free <= 0:
+                return
+            result = await db.execute(
+                select(models.GameAnalysis.game_id)
+                .where(models.GameAnalysis.status == "pending", models.GameAnalysis.available_at <= now)
+                .order_by(models.GameAnalysis.available_at)
+                .limit(free)
+            )
+            for game_id in result.scalars():
+                self.submit(game_id)
+
+    async def _consume(self):
+        while True:
+            game_id = await self._queue.get()
+            self._queued.discard(game_id)
+            try:
+                await self._run(game_id)
+            except Exception:
+                logger.exception("analysis of game %s failed", game_id)
+
+    async def _claim(self, game_id: int) -> Optional[list]:
+        """Mark the job running and return the game's moves, or None if someone else has it."""
+        now = datetime.now(timezone.utc)
+        async with database.SessionLocal() as db:
+            result = await db.execute(
+                update(models.GameAnalysis)
+                .where(
+                    models.GameAnalysis.game_id == game_id,
+                    models.GameAnalysis.status == "pending",
+                    models.GameAnalysis.available_at <= now,
+                )
+                .values(status="running", attempts=models.GameAnalysis.attempts + 1, updated_at=now)
+            )
+            await db.commit()
+            if result.rowcount != 1:
+                return None
+            packed = await db.scalar(select(models.Game.moves_packed).filter(models.Game.id == game_id))
+            if packed:
+                return move_codec.replay(packed)[1]
+            # Never packed: the move rows, in the order they were written (older rows have no ply)
+            result = await db.execute(
+                select(models.Move.move_san).filter(models.Move.game_id == game_id).order_by(models.Move.id)
+            )
+            return list(result.scalars())
+
+    async def _run(self, game_id: int):
+        moves = await self._claim(game_id)
+        if moves is None:
+            return
+        self.running += 1
+        started = time.monotonic()
+        try:
+            sans = to_san(moves)
+            loop = asyncio.get_running_loop()
+            evaluator, annotations = await asyncio.wait_for(
+                loop.run_in_executor(self._get_executor(), analysis.run_analysis, sans), self.timeout
+            )
+        except Exception as error:
+            if isinstance(error, BrokenProcessPool):
+                # A worker died; start a fresh pool for the next job
+                self._executor = None
+            await self._fail(game_id, repr(error))
+            return
+        finally:
+            self.running -= 1
+            self._busy += time.monotonic() - started
+
+        async with database.SessionLocal() as db:
+            await db.execute(
+                update(models.GameAnalysis)
+                .where(models.GameAnalysis.game_id == game_id, models.GameAnalysis.status == "running")
+                .values(
+                    status="done", evaluator=evaluator, annotations=annotations, error=None,
+                    duration_ms=int((time.monotonic() - started) * 1000), updated_at=datetime.now(timezone.utc),
+                )
+            )
+            await db.commit()
+        self.done += 1
+        self.plies += len(moves)
+
+    async def _fail(self, game_id: int, error: str):
+        async with database.SessionLocal() as db:
+            job = await db.get(models.GameAnalysis, game_id)
+            if job is None:
+                return
+            now = datetime.now(timezone.utc)
+            if job.attempts < self.max_attempts:
+                job.status = "pending"
+                job.available_at = now + timedelta(seconds=30 * 2 ** (job.attempts - 1))
+                self.retried += 1
+            else:
+                job.status = "failed"
+                self.failed += 1
+            job.error = error[:500]
+            job.updated_at = now
+            await db.commit()
+        logger.warning("analysis of game %s failed: %s", game_id, error)
+
+    def stats(self) -> dict:
+        elapsed = max(time.monotonic() - self._started, 1e-9)
+        return {
+            "workers": self.workers,
+            "queued": self._queue.qsize(),
+            "running": self.running,
+            "done": self.done,
+            "failed": self.failed,
+            "retried": self.retried,
+            "deferred": self.rejected,
+            "games_per_minute": round(self.done / elapsed * 60, 2),
+            "plies_per_worker_second": round(self.plies / self._busy, 1) if self._busy else 0.0,
+            "seconds_per_game": round(self._busy / self.done, 3) if self.done else None,
+            "utilization": round(self._busy / (elapsed * self.workers), 3) if self.workers else 0.0,
+        }
+
+
+analysis_queue = AnalysisQueue(
+    settings.ANALYSIS_WORKERS, settings.ANALYSIS_QUEUE_SIZE, settings.ANALYSIS_MAX_ATTEMPTS, settings.ANALYSIS_TIMEOUT_SECONDS
+)
@@ -1,5 +1,8 @@
 from datetime import datetime, timedelta
 from typing import Optional
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
+import time
 from jose import JWTError, jwt
 import bcrypt  # Changed from passlib to direct bcrypt
 from fastapi import Depends, HTTPException, status
@@ -24,11 +27,71 @@ def verify_password(plain_password, hashed_password):
         plain_password = plain_password.encode('utf-8')
     return bcrypt.checkpw(plain_password, hashed_password)
 
-def get_password_hash(password):
+def get_password_hash(password, rounds: Optional[int] = None):
     if isinstance(password, str):
         password = password.encode('utf-8')
     # gensalt() generates a salt, hashpw hashes it
-    return bcrypt.hashpw(password, bcrypt.gensalt()).decode('utf-8')
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds or settings.BCRYPT_ROUNDS)).decode('utf-8')
+
+def needs_rehash(hashed_password: str) -> bool:
+    # bcrypt hashes look like $2b$<cost>$<salt+hash>
+    try:
+        return int(hashed_password.split("$")[2]) != settings.BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+class PasswordPool:
+    """
+    Runs bcrypt off the event loop in a thread or process pool. At most
+    workers + queue_size jobs are admitted; beyond that callers get a 503
+    right away instead of queueing behind a login burst.
+    """
+
+    def __init__(self, kind: str, workers: int, queue_size: int):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown password executor: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.capacity = workers + queue_size
+        self.pending = 0
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        return self._executor
+
+    async def run(self, func, *args):
+        if self.pending >= self.capacity:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.pending -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+password_pool = PasswordPool(
+    settings.PASSWORD_HASH_EXECUTOR, settings.PASSWORD_HASH_WORKERS, settings.PASSWORD_HASH_QUEUE_SIZE
+)
+
+async def hash_password(password: str) -> str:
+    return await password_pool.run(get_password_hash, password, settings.BCRYPT_ROUNDS)
+
+async def check_password(plain_password: str, hashed_password: str) -> bool:
+    return await password_pool.run(verify_password, plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -40,28 +103,65 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+class IdentityCache:
+    """Short-lived token subject -> user id map, bounded in size."""
+
+    def __init__(self, ttl: float, max_size: int = 10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: dict[str, tuple[float, int]] = {}
+
+    def get(self, username: str) -> Optional[int]:
+        entry = self._entries.get(username)
+        if entry is None:
+            return None
+        expires_at, user_id = entry
+        if expires_at < time.monotonic():
+            del self._entries[username]
+            return None
+        return user_id
+
+    def put(self, username: str, user_id: int):
+        if len(self._entries) >= self.max_size:
+            # Dicts keep insertion order, so this drops the oldest entry
+            del self._entries[next(iter(self._entries))]
+        self._entries[username] = (time.monotonic() + self.ttl, user_id)
+
+    def clear(self):
+        self._entries.clear()
+
+identity_cache = IdentityCache(settings.AUTH_CACHE_TTL_SECONDS)
+
+async def get_user_from_token(token: str, db: AsyncSession) -> Optional[models.User]:
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         if username is None:
-            raise credentials_exception
+            return None
         token_data = schemas.TokenData(username=username)
     except JWTError:
-        raise credentials_exception
-    
-    from sqlalchemy.orm import selectinload
-    result = await db.execute(
-        select(models.User)
-        .filter(models.User.username == token_data.username)
-        .options(selectinload(models.User.games_white), selectinload(models.User.games_black))
-    )
+        return None
+
+    # Warm path: a single primary-key lookup
+    user_id = identity_cache.get(token_data.username)
+    if user_id is not None:
+        user = await db.get(models.User, user_id)
+        if user is not None and user.username == token_data.username:
+            return user
+
+    result = await db.execute(select(models.User).filter(models.User.username == token_data.username))
     user = result.scalars().first()
+    if user is not None:
+        identity_cache.put(user.username, user.id)
+    return user
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(database.get_db)):
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    user = await get_user_from_token(token, db)
     if user is None:
         raise credentials_exception
     return user
@@ -0,0 +1,61 @@
+"""
+Post-game analysis throughput for different worker counts.
+
+Plays --games random games of up to --plies plies and analyses them on a
+process pool set up like analysis_queue's (one evaluator per worker
+process), for each count in --workers, reporting games per minute and
+plies per second.
+
+    python bench_analysis.py --games 16 --workers 1 2 4 --depth 2
+"""
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+import chess
+
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
+import analysis
+
+
+def random_game(rng: random.Random, plies: int) -> list:
+    board = chess.Board()
+    sans = []
+    while len(sans) < plies and not board.is_game_over():
+        move = rng.choice(list(board.legal_moves))
+        sans.append(board.san(move))
+        board.push(move)
+    return sans
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=16)
+    parser.add_argument("--plies", type=int, default=60)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--engine", default="", help="path of a UCI binary instead of the built-in search")
+    parser.add_argument("--engine-seconds", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    games = [random_game(rng, args.plies) for _ in range(args.games)]
+    plies = sum(len(game) for game in games)
+    print(f"{len(games)} games, {plies} plies, {os.cpu_count()} CPUs")
+    for workers in args.workers:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=analysis.init_worker, initargs=(args.engine, args.depth, args.engine_seconds)
+        ) as pool:
+            # Start the workers (and any engine) before timing
+            list(pool.map(analysis.run_analysis, [[]] * workers))
+            started = time.perf_counter()
+            results = list(pool.map(analysis.run_analysis, games))
+            elapsed = time.perf_counter() - started
+        print(
+            f"{workers:>3} workers: {elapsed:6.2f}s  {len(games) / elapsed * 60:7.1f} games/min  "
+            f"{plies / elapsed:7.1f} plies/s  ({results[0][0]})"
+        )
@@ -0,0 +1,110 @@
+"""
+Flag-fall accuracy of clocks.FlagScheduler with many running clocks.
+
+Schedules --clocks deadlines spread over --spread seconds, keeps
+rescheduling a share of them (moves being played) while they run down,
+and records how late each flag fires relative to its deadline. With
+--tasks the same load runs as one asyncio task per clock for comparison.
+
+    python bench_clocks.py --clocks 50000 --spread 5 --moves-per-second 5000
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
+from clocks import FlagScheduler
+
+
+def report(name: str, lateness: list, cpu: float, wall: float):
+    lateness.sort()
+    ms = [value * 1000 for value in lateness]
+    pick = lambda p: ms[min(len(ms) - 1, int(len(ms) * p))]
+    print(
+        f"{name:>9}: {len(ms)} flags  late p50={pick(0.5):6.2f}ms p99={pick(0.99):6.2f}ms "
+        f"max={ms[-1]:6.2f}ms  cpu={cpu:5.2f}s over {wall:5.2f}s"
+    )
+
+
+async def _churn(reschedule, clocks: int, rate: float, until: float, rng: random.Random):
+    # Moves: push a clock's deadline back, like a move handing the turn over
+    loop = asyncio.get_running_loop()
+    batch = max(1, int(rate / 100))
+    while loop.time() < until:
+        for _ in range(batch):
+            reschedule(rng.randrange(clocks))
+        await asyncio.sleep(0.01)
+
+
+async def run_scheduler(clocks: int, spread: float, rate: float, seed: int):
+    rng = random.Random(seed)
+    loop = asyncio.get_running_loop()
+    deadlines: dict = {}
+    lateness: list = []
+    done = asyncio.Event()
+
+    def on_flag(game_id: int):
+        lateness.append(loop.time() - deadlines.pop(game_id))
+        if not deadlines:
+            done.set()
+
+    scheduler = FlagScheduler(on_flag)
+
+    def reschedule(game_id: int):
+        if game_id in deadlines:
+            delay = rng.uniform(0.5, spread)
+            deadlines[game_id] = loop.time() + delay
+            scheduler.schedule(game_id, delay)
+
+    started, cpu = time.perf_counter(), time.process_time()
+    for game_id in range(clocks):
+        delay = rng.uniform(0.5, spread)
+        deadlines[game_id] = loop.time() + delay
+        scheduler.schedule(game_id, delay)
+    churn = asyncio.create_task(_churn(reschedule, clocks, rate, loop.time() + spread / 2, rng))
+    await done.wait()
+    churn.cancel()
+    report("scheduler", lateness, time.process_time() - cpu, time.perf_counter() - started)
+
+
+async def run_tasks(clocks: int, spread: float, rate: float, seed: int):
+    rng = random.Random(seed)
+    loop = asyncio.get_running_loop()
+    tasks: dict = {}
+    lateness: list = []
+
+    async def clock(deadline: float):
+        await asyncio.sleep(deadline - loop.time())
+        lateness.append(loop.time() - deadline)
+
+    def reschedule(game_id: int):
+        task = tasks.get(game_id)
+        if task is not None and not task.done():
+            task.cancel()
+            tasks[game_id] = asyncio.create_task(clock(loop.time() + rng.uniform(0.5, spread)))
+
+    started, cpu = time.perf_counter(), time.process_time()
+    for game_id in range(clocks):
+        tasks[game_id] = asyncio.create_task(clock(loop.time() + rng.uniform(0.5, spread)))
+    churn = asyncio.create_task(_churn(reschedule, clocks, rate, loop.time() + spread / 2, rng))
+    while any(not task.done() for task in tasks.values()):
+        await asyncio.sleep(0.1)
+    churn.cancel()
+    report("tasks", lateness, time.process_time() - cpu, time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clocks", type=int, default=50000)
+    parser.add_argument("--spread", type=float, default=5.0, help="deadlines fall within this many seconds")
+    parser.add_argument("--moves-per-second", type=float, default=5000.0)
+    parser.add_argument("--tasks", action="store_true", help="also run one task per clock")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(run_scheduler(args.clocks, args.spread, args.moves_per_second, args.seed))
+    if args.tasks:
+        asyncio.run(run_tasks(args.clocks, args.spread, args.moves_per_second, args.seed))
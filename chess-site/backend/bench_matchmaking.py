@@ -0,0 +1,132 @@
+"""
+Matchmaking queue simulation on a synthetic clock.
+
+steady: players arrive at a fixed rate with ratings ~ N(1500, 300) and
+sweeps run every --sweep seconds; reports pairing quality (rating gap),
+wait times and the peak queue size.
+
+queued: --players tickets already waiting, then timed enqueues and one
+sweep with widened windows, against a linear scan over the same queue
+(what a SELECT over open games amounts to).
+
+    python bench_matchmaking.py --players 10000 --rate 200
+"""
+import argparse
+import os
+import random
+import time
+
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
+from config import settings
+from matchmaking import MatchQueue, Ticket
+
+
+def make_queue() -> MatchQueue:
+    return MatchQueue(
+        settings.MATCHMAKING_BUCKET_WIDTH,
+        settings.MATCHMAKING_BASE_WINDOW,
+        settings.MATCHMAKING_WINDOW_GROWTH,
+        settings.MATCHMAKING_MAX_WINDOW,
+    )
+
+
+def rating(rng: random.Random) -> int:
+    return int(rng.gauss(1500, 300))
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] if values else 0.0
+
+
+def steady(players: int, rate: float, sweep_every: float, seed: int):
+    rng = random.Random(seed)
+    queue = make_queue()
+    now = 0.0
+    next_sweep = sweep_every
+    gaps, waits = [], []
+    peak = 0
+    enqueue_time = sweep_time = 0.0
+    sweeps = 0
+
+    def paired(a: Ticket, b: Ticket, at: float):
+        gaps.append(abs(a.rating - b.rating))
+        waits.append(at - a.enqueued_at)
+        waits.append(at - b.enqueued_at)
+
+    for user_id in range(players):
+        now += rng.expovariate(rate)
+        while next_sweep <= now:
+            started = time.perf_counter()
+            for a, b in queue.sweep(next_sweep):
+                paired(a, b, next_sweep)
+            sweep_time += time.perf_counter() - started
+            sweeps += 1
+            next_sweep += sweep_every
+        ticket = Ticket(user_id, rating(rng), now)
+        started = time.perf_counter()
+        opponent = queue.enqueue(ticket, now)
+        enqueue_time += time.perf_counter() - started
+        if opponent is not None:
+            paired(ticket, opponent, now)
+        peak = max(peak, len(queue))
+
+    print(f"steady: {players} players at {rate:.0f}/s, sweep every {sweep_every}s")
+    print(f"  pairs={len(gaps)} still queued={len(queue)} peak queue={peak}")
+    print(f"  rating gap p50={percentile(gaps, 0.5):.0f} p95={percentile(gaps, 0.95):.0f} max={max(gaps, default=0)}")
+    print(f"  wait p50={percentile(waits, 0.5):.2f}s p95={percentile(waits, 0.95):.2f}s")
+    print(
+        f"  enqueue {enqueue_time / players * 1e6:.1f}us/op, "
+        f"sweep {sweep_time / max(sweeps, 1) * 1e3:.2f}ms avg over {sweeps} sweeps"
+    )
+
+
+def linear_nearest(tickets: list, ticket: Ticket, window: int):
+    best = None
+    for candidate in tickets:
+        gap = abs(candidate.rating - ticket.rating)
+        if gap <= window and (best is None or gap < abs(best.rating - ticket.rating)):
+            best = candidate
+    return best
+
+
+def queued(players: int, probes: int, seed: int):
+    rng = random.Random(seed)
+    queue = make_queue()
+    tickets = [Ticket(user_id, rating(rng), 0.0) for user_id in range(players)]
+    for ticket in tickets:
+        # Fill without pairing to get a full queue to measure against
+        queue._insert(ticket)
+
+    probe_tickets = [Ticket(players + i, rating(rng), 0.0) for i in range(probes)]
+    started = time.perf_counter()
+    for ticket in probe_tickets:
+        queue._nearest(ticket, queue.window(ticket, 0.0))
+    bucketed = (time.perf_counter() - started) / probes
+
+    started = time.perf_counter()
+    for ticket in probe_tickets:
+        linear_nearest(tickets, ticket, settings.MATCHMAKING_BASE_WINDOW)
+    linear = (time.perf_counter() - started) / probes
+
+    started = time.perf_counter()
+    pairs = queue.sweep(5.0)
+    sweep = time.perf_counter() - started
+
+    print(f"queued: {players} waiting, {probes} lookups")
+    print(f"  bucketed lookup {bucketed * 1e6:8.1f}us   linear scan {linear * 1e6:8.1f}us")
+    print(f"  full sweep at +5s: {len(pairs)} pairs in {sweep * 1e3:.1f}ms, {len(queue)} left")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--players", type=int, default=10000)
+    parser.add_argument("--rate", type=float, default=200.0, help="arrivals per second (steady)")
+    parser.add_argument("--sweep", type=float, default=settings.MATCHMAKING_SWEEP_SECONDS)
+    parser.add_argument("--probes", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    steady(args.players, args.rate, args.sweep, args.seed)
+    queued(args.players, args.probes, args.seed)
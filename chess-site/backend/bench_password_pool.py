@@ -0,0 +1,80 @@
+"""
+Event-loop latency while a burst of logins verifies passwords.
+
+Compares calling bcrypt inline on the event loop (the old behaviour) with
+the bounded worker pool in auth.PasswordPool. A ticker task wakes every
+few milliseconds and records how late it was; that lateness is what every
+open WebSocket and move request experiences during the burst.
+
+    python bench_password_pool.py --logins 64 --rounds 10 --workers 4
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+os.environ.setdefault("SECRET_KEY", "bench")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+
+import auth
+
+TICK_SECONDS = 0.005
+
+async def _ticker(lags: list, stop: asyncio.Event):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + TICK_SECONDS
+        await asyncio.sleep(TICK_SECONDS)
+        lags.append(max(0.0, loop.time() - expected))
+
+async def _inline_login(password: str, hashed: str):
+    return auth.verify_password(password, hashed)
+
+async def _pool_login(pool: auth.PasswordPool, password: str, hashed: str):
+    try:
+        return await pool.run(auth.verify_password, password, hashed)
+    except auth.HTTPException:
+        return None  # rejected with 503
+
+async def run(mode: str, logins: int, hashed: str, pool: auth.PasswordPool = None):
+    lags: list = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_ticker(lags, stop))
+    await asyncio.sleep(TICK_SECONDS * 2)
+    started = time.perf_counter()
+    if mode == "inline":
+        results = await asyncio.gather(*(_inline_login("secret", hashed) for _ in range(logins)))
+    else:
+        results = await asyncio.gather(*(_pool_login(pool, "secret", hashed) for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+    lags_ms = sorted(lag * 1000 for lag in lags) or [0.0]
+    rejected = sum(1 for result in results if result is None)
+    print(
+        f"{mode:>8}: {logins} logins in {elapsed:6.2f}s  "
+        f"loop lag p50={statistics.median(lags_ms):7.2f}ms "
+        f"p99={lags_ms[int(len(lags_ms) * 0.99) - 1]:7.2f}ms max={lags_ms[-1]:7.2f}ms  "
+        f"rejected(503)={rejected}"
+    )
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=auth.settings.BCRYPT_ROUNDS)
+    parser.add_argument("--workers", type=int, default=auth.settings.PASSWORD_HASH_WORKERS)
+    parser.add_argument("--queue-size", type=int, default=auth.settings.PASSWORD_HASH_QUEUE_SIZE)
+    parser.add_argument("--executor", choices=["thread", "process"], default=auth.settings.PASSWORD_HASH_EXECUTOR)
+    args = parser.parse_args()
+
+    hashed = auth.get_password_hash("secret", rounds=args.rounds)
+    pool = auth.PasswordPool(args.executor, args.workers, args.queue_size)
+    try:
+        await run("inline", args.logins, hashed)
+        await run("pool", args.logins, hashed, pool)
+    finally:
+        pool.shutdown()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,62 @@
+"""
+Throughput of the rating_engine replays on synthetic games, without the
+database: --games random pairings among --players users, fed in chunks the
+way admin_recalculate_ratings streams them. --scalar also replays the games
+one by one with ratings.calculate_elo and checks both agree.
+
+    python bench_ratings.py --games 2000000 --players 50000 --scalar
+"""
+import argparse
+import time
+import numpy as np
+from rating_engine import Elo, Glicko2
+from ratings import calculate_elo
+
+
+def synthetic(games: int, players: int, seed: int):
+    rng = np.random.default_rng(seed)
+    # Skewed activity: a few players play much more than the rest
+    weights = rng.pareto(1.5, players) + 1
+    white = rng.choice(players, games, p=weights / weights.sum())
+    black = (white + rng.integers(1, players, games)) % players
+    score = rng.choice([0.0, 0.5, 1.0], games, p=[0.45, 0.1, 0.45])
+    return white, black, score
+
+
+def report(name: str, games: int, seconds: float):
+    print(f"{name:>8}: {games} games in {seconds:6.2f}s  {games / seconds / 1e6 * 60:7.1f}M games/min")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=2000000)
+    parser.add_argument("--players", type=int, default=50000)
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument("--periods", type=int, default=100, help="Glicko-2 rating periods the games span")
+    parser.add_argument("--scalar", action="store_true", help="also replay game by game with calculate_elo")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    white, black, score = synthetic(args.games, args.players, args.seed)
+    initial = np.full(args.players, 1200)
+
+    started = time.perf_counter()
+    elo = Elo(initial)
+    for start in range(0, args.games, args.chunk_size):
+        end = start + args.chunk_size
+        elo.update(white[start:end], black[start:end], score[start:end])
+    report("elo", args.games, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    glicko = Glicko2(initial)
+    for period in np.array_split(np.arange(args.games), args.periods):
+        glicko.update(white[period], black[period], score[period])
+    report("glicko2", args.games, time.perf_counter() - started)
+
+    if args.scalar:
+        started = time.perf_counter()
+        ratings = initial.tolist()
+        for w, b, s in zip(white.tolist(), black.tolist(), score.tolist()):
+            ratings[w], ratings[b] = calculate_elo(ratings[w], ratings[b], s), calculate_elo(ratings[b], ratings[w], 1 - s)
+        report("scalar", args.games, time.perf_counter() - started)
+        print(f"ratings differing from the vectorized replay: {int((np.array(ratings) != elo.result()).sum())}")
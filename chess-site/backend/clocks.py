@@ -0,0 +1,138 @@
+import asyncio
+import heapq
+import itertools
+from datetime import datetime, timezone
+from typing import Callable, Optional
+import chess
+import models
+
+
+def _epoch(value: Optional[datetime]) -> Optional[float]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        # SQLite hands back naive datetimes; they are stored as UTC
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class Clock:
+    """
+    Chess clock of one game. Remaining times are as of last_move_at (epoch
+    seconds), the moment the side to move started thinking; the side to
+    move is the board's, not tracked here.
+    """
+
+    __slots__ = ("increment_ms", "white_ms", "black_ms", "last_move_at")
+
+    def __init__(self, increment_ms: int, white_ms: int, black_ms: int, last_move_at: Optional[float]):
+        self.increment_ms = increment_ms
+        self.white_ms = white_ms
+        self.black_ms = black_ms
+        self.last_move_at = last_move_at
+
+    @classmethod
+    def from_game(cls, game: models.Game) -> Optional["Clock"]:
+        if not game.time_control:
+            return None
+        initial_ms = game.time_control * 1000
+        return cls(
+            (game.increment or 0) * 1000,
+            initial_ms if game.white_time_ms is None else game.white_time_ms,
+            initial_ms if game.black_time_ms is None else game.black_time_ms,
+            _epoch(game.last_move_at),
+        )
+
+    def remaining(self, color: chess.Color, now: float) -> int:
+        left = self.white_ms if color == chess.WHITE else self.black_ms
+        if self.last_move_at is None:
+            return left
+        return left - int((now - self.last_move_at) * 1000)
+
+    def punch(self, color: chess.Color, now: float):
+        """color finished its move at now: charge the time used, add the increment."""
+        left = self.remaining(color, now) + self.increment_ms
+        if color == chess.WHITE:
+            self.white_ms = left
+        else:
+            self.black_ms = left
+        self.last_move_at = now
+
+    def values(self) -> dict:
+        """Game columns for the current state."""
+        return {
+            "white_time_ms": self.white_ms,
+            "black_time_ms": self.black_ms,
+            "last_move_at": datetime.fromtimestamp(self.last_move_at, timezone.utc) if self.last_move_at else None,
+        }
+
+
+class FlagScheduler:
+    """
+    One timer for every running clock: deadlines sit in a heap and a single
+    loop.call_at handle is armed for the earliest. Rescheduling a game just
+    pushes a new entry; superseded entries are skipped when they surface,
+    and the heap is rebuilt when they outnumber the live ones.
+    """
+
+    def __init__(self, on_flag: Callable[[int], None]):
+        self.on_flag = on_flag
+        self._heap: list = []
+        self._deadlines: dict[int, float] = {}
+        self._counter = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._armed_at: Optional[float] = None
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def schedule(self, game_id: int, delay: float):
+        """Call on_flag(game_id) in delay seconds, replacing any earlier deadline."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + max(0.0, delay)
+        self._deadlines[game_id] = deadline
+        heapq.heappush(self._heap, (deadline, next(self._counter), game_id))
+        if len(self._heap) > 2 * len(self._deadlines) + 1024:
+            self._compact()
+        if self._armed_at is None or deadline < self._armed_at:
+            self._arm(loop)
+
+    def cancel(self, game_id: int):
+        self._deadlines.pop(game_id, None)
+
+    def clear(self):
+        self._deadlines.clear()
+        self._heap.clear()
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = self._armed_at = None
+
+    def _compact(self):
+        self._heap = [entry for entry in self._heap if self._deadlines.get(entry[2]) == entry[0]]
+        heapq.heapify(self._heap)
+
+    def _arm(self, loop: asyncio.AbstractEventLoop):
+        while self._heap and self._deadlines.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if self._timer is not None:
+            self._timer.cancel()
+        if not self._heap:
+            self._timer = self._armed_at = None
+            return
+        self._armed_at = self._heap[0][0]
+        self._timer = loop.call_at(self._armed_at, self._fire)
+
+    def _fire(self):
+        loop = asyncio.get_running_loop()
+        # call_at may run up to one clock tick early; count that as due
+        now = loop.time() + 0.001
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, _, game_id = heapq.heappop(self._heap)
+            if self._deadlines.get(game_id) == deadline:
+                del self._deadlines[game_id]
+                due.append(game_id)
+        self._timer = self._armed_at = None
+        self._arm(loop)
+        for game_id in due:
+            self.on_flag(game_id)
@@ -1,8 +1,100 @@
+from typing import Optional
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
     SECRET_KEY: str
     DATABASE_URL: str
+    # Optional read-only replica for listings, history and ratings pages
+    DATABASE_READ_URL: Optional[str] = None
+    # Max replication lag expected; game responses read right after a change aren't cached for this long
+    DATABASE_READ_MAX_LAG_SECONDS: float = 2.0
+
+    # Connection pool per engine (each worker process has its own), the
+    # compiled SQL cache and asyncpg's prepared statement cache per connection
+    DATABASE_POOL_SIZE: int = 10
+    DATABASE_MAX_OVERFLOW: int = 20
+    DATABASE_POOL_TIMEOUT: float = 30.0
+    DATABASE_POOL_RECYCLE: int = 1800
+    DATABASE_POOL_PRE_PING: bool = False
+    DATABASE_QUERY_CACHE_SIZE: int = 500
+    DATABASE_STATEMENT_CACHE_SIZE: int = 100
+
+    # SQL logging: "off", "sample" (SQL_LOG_SAMPLE_RATE of statements plus
+    # any slower than SQL_LOG_SLOW_MS, on the "sql" logger) or "all"
+    SQL_LOG: str = "off"
+    SQL_LOG_SAMPLE_RATE: float = 0.01
+    SQL_LOG_SLOW_MS: float = 200.0
+
+    # Log requests slower than this with their SQL statements (0 = off)
+    METRICS_SLOW_REQUEST_MS: float = 0.0
+
+    # Password hashing runs in a "thread" or "process" pool; requests beyond
+    # workers + queue size get a 503 instead of waiting
+    PASSWORD_HASH_EXECUTOR: str = "thread"
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_QUEUE_SIZE: int = 64
+    # bcrypt cost factor; stored hashes with a different cost are upgraded at login
+    BCRYPT_ROUNDS: int = 12
+
+    # How long a token subject -> user id resolution is reused
+    AUTH_CACHE_TTL_SECONDS: int = 60
+
+    # Interval of the leaderboard and lobby vs database consistency check
+    LEADERBOARD_CHECK_SECONDS: int = 300
+
+    # Games whose per-ply FENs are kept after being rebuilt from packed moves
+    POSITION_CACHE_SIZE: int = 1024
+    # Serialized /games/{id} and /games/{id}/history responses kept in memory
+    RESPONSE_CACHE_SIZE: int = 2048
+    RESPONSE_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    # Cached responses of unfinished games are refreshed at least this often
+    RESPONSE_CACHE_ACTIVE_TTL_SECONDS: float = 5.0
+
+    # Matchmaking: rating buckets, search window (points, widening per second
+    # waited) and how long one long-poll request waits for a pairing.
+    # The queue lives in each worker: run it behind a single worker.
+    MATCHMAKING_BUCKET_WIDTH: int = 25
+    MATCHMAKING_BASE_WINDOW: int = 50
+    MATCHMAKING_WINDOW_GROWTH: float = 10.0
+    MATCHMAKING_MAX_WINDOW: int = 400
+    MATCHMAKING_WAIT_SECONDS: float = 25.0
+    MATCHMAKING_SWEEP_SECONDS: float = 1.0
+
+    # Post-game analysis: worker processes per server process (0 disables it),
+    # jobs buffered in memory beyond which they wait for the next sweep of the
+    # game_analysis table, retries and the per-game time limit. With
+    # ANALYSIS_ENGINE_PATH set a local UCI binary scores positions for
+    # ANALYSIS_ENGINE_SECONDS each, otherwise the built-in search to ANALYSIS_DEPTH.
+    ANALYSIS_WORKERS: int = 2
+    ANALYSIS_QUEUE_SIZE: int = 100
+    ANALYSIS_MAX_ATTEMPTS: int = 3
+    ANALYSIS_TIMEOUT_SECONDS: float = 300.0
+    ANALYSIS_SWEEP_SECONDS: float = 10.0
+    ANALYSIS_DEPTH: int = 2
+    ANALYSIS_ENGINE_PATH: str = ""
+    ANALYSIS_ENGINE_SECONDS: float = 0.1
+
+    # Move persistence: "commit" writes every move in its own transaction;
+    # "group" acknowledges a move once it is in the local journal and writes
+    # batches of moves from all games together, at most MOVE_FLUSH_MS later
+    # or once MOVE_FLUSH_BATCH moves are waiting. Unflushed moves are replayed
+    # from MOVE_JOURNAL_DIR on startup. Group mode keeps game state in this
+    # worker: run it behind a single worker.
+    MOVE_DURABILITY: str = "commit"
+    MOVE_FLUSH_MS: int = 20
+    MOVE_FLUSH_BATCH: int = 500
+    MOVE_JOURNAL_DIR: str = "move-journal"
+    MOVE_JOURNAL_FSYNC: bool = True
+
+    # WebSocket fan-out: "memory" for a single worker, "local" to share
+    # broadcasts between uvicorn workers on one host via Unix sockets
+    PUBSUB_BACKEND: str = "memory"
+    PUBSUB_SOCKET_DIR: str = "/tmp/chess-pubsub"
+    # Messages buffered per socket before a slow client is disconnected
+    WS_SEND_QUEUE_SIZE: int = 64
+    # Move broadcasts kept per game (and games kept) to resync reconnecting sockets
+    WS_RESYNC_MOVES: int = 32
+    WS_RESYNC_GAMES: int = 10000
     
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
@@ -1,10 +1,63 @@
+import logging
+import random
+import time
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker, declarative_base
 from typing import Generator
 
 from config import settings
 
-engine = create_async_engine(settings.DATABASE_URL, echo=True)
+sql_logger = logging.getLogger("sql")
+
+
+def _engine_options(url: str) -> dict:
+    options = {
+        "echo": settings.SQL_LOG == "all",
+        "query_cache_size": settings.DATABASE_QUERY_CACHE_SIZE,
+    }
+    if url.startswith("sqlite") and ":memory:" in url:
+        # In-memory SQLite uses a single shared connection, no pool to size
+        return options
+    options.update(
+        pool_size=settings.DATABASE_POOL_SIZE,
+        max_overflow=settings.DATABASE_MAX_OVERFLOW,
+        pool_timeout=settings.DATABASE_POOL_TIMEOUT,
+        pool_recycle=settings.DATABASE_POOL_RECYCLE,
+        pool_pre_ping=settings.DATABASE_POOL_PRE_PING,
+    )
+    if "+asyncpg" in url:
+        # Prepared statements kept per connection by the asyncpg dialect
+        options["connect_args"] = {"prepared_statement_cache_size": settings.DATABASE_STATEMENT_CACHE_SIZE}
+    return options
+
+
+def _sample_statements(engine, name: str):
+    """SQL_LOG=sample: log SQL_LOG_SAMPLE_RATE of the statements, plus every one slower than SQL_LOG_SLOW_MS."""
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - context._query_started) * 1000
+        if elapsed_ms >= settings.SQL_LOG_SLOW_MS:
+            sql_logger.warning("%s slow statement (%.1f ms): %s", name, elapsed_ms, statement)
+        elif random.random() < settings.SQL_LOG_SAMPLE_RATE:
+            sql_logger.info("%s (%.1f ms): %s", name, elapsed_ms, statement)
+
+
+def _create_engine(url: str, name: str):
+    engine = create_async_engine(url, **_engine_options(url))
+    if settings.SQL_LOG == "sample":
+        _sample_statements(engine, name)
+    return engine
+
+
+engine = _create_engine(settings.DATABASE_URL, "primary")
+# Read-only queries that tolerate replication lag; the primary without a replica
+read_engine = _create_engine(settings.DATABASE_READ_URL, "replica") if settings.DATABASE_READ_URL else engine
 
 SessionLocal = sessionmaker(
     bind=engine,
@@ -14,8 +67,20 @@ SessionLocal = sessionmaker(
     autoflush=False,
 )
 
+ReadSessionLocal = sessionmaker(
+    bind=read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=False,
+)
+
 Base = declarative_base()
 
 async def get_db() -> Generator:
     async with SessionLocal() as session:
         yield session
+
+async def get_read_db() -> Generator:
+    async with ReadSessionLocal() as session:
+        yield session
@@ -0,0 +1,128 @@
+"""
+Position index for the opening explorer. Positions are keyed by their
+polyglot Zobrist hash (pieces, side to move, castling rights, en passant
+file; move clocks are ignored), stored as a signed 64-bit integer.
+
+- game_positions: (game_id, ply) -> key of the position after that ply,
+  written with every move, so "which games reached this position" is an
+  index lookup.
+- position_moves: per (key, move) the number of finished games that played
+  that move there and how they ended, added when a game finishes.
+
+admin_index_positions.py rebuilds both from the packed moves of all games.
+"""
+from collections import Counter
+from typing import Iterable, List, Optional, Tuple
+import chess
+import chess.polyglot
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+import models, move_codec
+from database import engine
+
+RESULT_COLUMNS = {"1-0": "white", "1/2-1/2": "draws", "0-1": "black"}
+
+# ON CONFLICT needs the dialect's own insert()
+_insert = postgresql.insert if engine.dialect.name == "postgresql" else sqlite.insert
+
+
+def position_key(board: chess.Board) -> int:
+    key = chess.polyglot.zobrist_hash(board)
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+
+def game_positions(moves: Iterable[chess.Move]) -> List[Tuple[int, int]]:
+    """(key before the move, move code) for each ply, plus the final key at the end."""
+    board = chess.Board()
+    played = []
+    for move in moves:
+        played.append((position_key(board), move_codec.encode_move(move)))
+        board.push(move)
+    played.append((position_key(board), None))
+    return played
+
+
+def position_rows(game_id: int, played: List[Tuple[int, int]]) -> List[dict]:
+    # The position after ply n is the one before ply n + 1
+    return [{"game_id": game_id, "ply": ply, "position_key": key} for ply, (key, _) in enumerate(played[1:], start=1)]
+
+
+def move_counts(played: List[Tuple[int, int]], result: str, counts: Optional[Counter] = None) -> Counter:
+    """Add one game's (key, move) pairs, each once even if repeated, to counts[(key, move, result)]."""
+    counts = Counter() if counts is None else counts
+    for key, move in set(played[:-1]):
+        counts[key, move, result] += 1
+    return counts
+
+
+async def add_positions(db: AsyncSession, rows: List[dict]):
+    if rows:
+        await db.execute(_insert(models.GamePosition).on_conflict_do_nothing(), rows)
+
+
+async def add_move_counts(db: AsyncSession, counts: Counter):
+    rows = {}
+    for (key, move, result), games in counts.items():
+        row = rows.setdefault((key, move), {"position_key": key, "move": move, "games": 0, "white": 0, "draws": 0, "black": 0})
+        row["games"] += games
+        row[RESULT_COLUMNS[result]] += games
+    if not rows:
+        return
+    statement = _insert(models.PositionMove)
+    await db.execute(
+        statement.on_conflict_do_update(
+            index_elements=["position_key", "move"],
+            set_={
+                column: getattr(models.PositionMove, column) + getattr(statement.excluded, column)
+                for column in ("games", "white", "draws", "black")
+            },
+        ),
+        list(rows.values()),
+    )
+
+
+async def record_move(db: AsyncSession, game_id: int, ply: int, board: chess.Board):
+    """Index the position after a move, in the move's transaction."""
+    await add_positions(db, [{"game_id": game_id, "ply": ply, "position_key": position_key(board)}])
+
+
+async def record_result(db: AsyncSession, board: chess.Board, ply: int, result: str):
+    """Count a finished game's moves; skipped when the board lacks the full move history."""
+    if result not in RESULT_COLUMNS or len(board.move_stack) != ply:
+        return
+    await add_move_counts(db, move_counts(game_positions(board.move_stack), result))
+
+
+async def explore(db: AsyncSession, board: chess.Board, games_limit: int) -> dict:
+    key = position_key(board)
+    result = await db.execute(
+        select(models.PositionMove).filter(models.PositionMove.position_key == key).order_by(models.PositionMove.games.desc())
+    )
+    moves = []
+    for row in result.scalars():
+        move = move_codec.decode_move(row.move)
+        if not board.is_legal(move):
+            # A hash collision with some other position
+            continue
+        moves.append({
+            "uci": move.uci(), "san": board.san(move),
+            "games": row.games, "white": row.white, "draws": row.draws, "black": row.black,
+        })
+    result = await db.execute(
+        select(models.GamePosition.game_id)
+        .filter(models.GamePosition.position_key == key)
+        .distinct()
+        .order_by(models.GamePosition.game_id.desc())
+        .limit(games_limit)
+    )
+    return {
+        "fen": board.fen(),
+        "key": key,
+        "games": sum(move["games"] for move in moves),
+        "white": sum(move["white"] for move in moves),
+        "draws": sum(move["draws"] for move in moves),
+        "black": sum(move["black"] for move in moves),
+        "moves": moves,
+        "recent_games": list(result.scalars()),
+    }
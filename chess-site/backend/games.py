@@ -1,56 +1,194 @@
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
+from sqlalchemy import func, insert, update
 from sqlalchemy.orm import selectinload
-from typing import List
+from pydantic import TypeAdapter
+from typing import List, Optional, Tuple
+from datetime import datetime, timezone
+import asyncio
 import chess
-import chess.pgn
-import io
-import database, models, schemas, auth, ratings
+import functools
+import json
+import logging
+import time
+import database, models, schemas, auth, ratings, pubsub, pgn_export, move_codec, explorer
+from config import settings
+from live_games import LiveGame, registry, parse_move
+from clocks import FlagScheduler
+from move_journal import MoveJournal
+from leaderboard import publish_ratings
+from response_cache import response_cache
+from analysis_queue import analysis_queue
+from metrics import metrics
+from recent_moves import recent_moves
+from matchmaking import matchmaker
+from lobby import lobby, publish_added, publish_removed, CHANNEL as LOBBY_CHANNEL
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # WebSocket Manager
+class Client:
+    __slots__ = ("websocket", "queue", "task")
+
+    def __init__(self, websocket: WebSocket, queue_size: int):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.task: Optional[asyncio.Task] = None
+
+
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: dict[int, List[WebSocket]] = {}
+    """Sockets grouped by pub/sub channel ("game:{id}", "lobby")."""
+
+    def __init__(self, backend: pubsub.PubSubBackend, queue_size: int):
+        self.backend = backend
+        self.queue_size = queue_size
+        self.active_connections: dict[str, List[Client]] = {}
+        backend.subscribe(self._on_message)
 
-    async def connect(self, game_id: int, websocket: WebSocket):
+    async def start(self):
+        await self.backend.start()
+
+    async def stop(self):
+        await self.backend.stop()
+
+    async def connect(self, channel: str, websocket: WebSocket):
         await websocket.accept()
-        if game_id not in self.active_connections:
-            self.active_connections[game_id] = []
-        self.active_connections[game_id].append(websocket)
+        client = Client(websocket, self.queue_size)
+        client.task = asyncio.create_task(self._drain(channel, client))
+        if channel not in self.active_connections:
+            self.active_connections[channel] = []
+        self.active_connections[channel].append(client)
+        metrics.ws_connected(channel.split(":", 1)[0])
+        return client
 
-    def disconnect(self, game_id: int, websocket: WebSocket):
-        if game_id in self.active_connections:
-            self.active_connections[game_id].remove(websocket)
-            if not self.active_connections[game_id]:
-                del self.active_connections[game_id]
+    def disconnect(self, channel: str, websocket: WebSocket):
+        clients = self.active_connections.get(channel)
+        if not clients:
+            return
+        for client in clients:
+            if client.websocket is websocket:
+                clients.remove(client)
+                client.task.cancel()
+                metrics.ws_disconnected(channel.split(":", 1)[0])
+                break
+        if not clients:
+            del self.active_connections[channel]
 
     async def broadcast(self, game_id: int, message: str):
-        if game_id in self.active_connections:
-            for connection in self.active_connections[game_id]:
-                await connection.send_text(message)
+        # Published to every worker; each one enqueues for its own sockets
+        await self.backend.publish(f"game:{game_id}", message)
+
+    def send(self, channel: str, client: Client, message: str):
+        # Goes through the client's queue so replies never interleave with broadcasts
+        try:
+            client.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # Slow consumer: drop it rather than stall everyone else
+            metrics.ws_dropped += 1
+            self.disconnect(channel, client.websocket)
+            asyncio.create_task(self._close(client.websocket))
+
+    def deliver(self, channel: str, message: str):
+        """Enqueue for this worker's sockets on the channel."""
+        started = time.perf_counter()
+        clients = list(self.active_connections.get(channel, ()))
+        for client in clients:
+            self.send(channel, client, message)
+        metrics.broadcast(len(clients), time.perf_counter() - started)
+
+    def connection_counts(self) -> dict:
+        counts = {}
+        for channel, clients in self.active_connections.items():
+            kind = channel.split(":", 1)[0]
+            counts[kind] = counts.get(kind, 0) + len(clients)
+        return counts
+
+    def _on_message(self, channel: str, message: str):
+        if channel.startswith("game:"):
+            self.deliver(channel, message)
+
+    async def _drain(self, channel: str, client: Client):
+        try:
+            while True:
+                message = await client.queue.get()
+                await client.websocket.send_text(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            metrics.ws_send_errors += 1
+            self.disconnect(channel, client.websocket)
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await asyncio.wait_for(websocket.close(code=status.WS_1013_TRY_AGAIN_LATER), timeout=1)
+        except Exception:
+            pass
 
-manager = ConnectionManager()
+manager = ConnectionManager(pubsub.backend, settings.WS_SEND_QUEUE_SIZE)
+
+def _on_lobby_message(channel: str, message: str):
+    # Forward only deltas that changed this worker's lobby, so repeats are harmless
+    if channel == LOBBY_CHANNEL and lobby.apply(message):
+        manager.deliver(LOBBY_CHANNEL, message)
+
+pubsub.backend.subscribe(_on_lobby_message)
 
 @router.get("/games", response_model=List[schemas.GameOut])
-async def read_games(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(database.get_db)):
-    result = await db.execute(select(models.Game).filter(models.Game.status != "finished").options(selectinload(models.Game.moves)).offset(skip).limit(limit))
+async def read_games(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(database.get_read_db)):
+    result = await db.execute(
+        select(models.Game).filter(models.Game.status != "finished").options(selectinload(models.Game.moves))
+        .order_by(models.Game.created_at, models.Game.id).offset(skip).limit(limit)
+    )
     games = result.scalars().all()
     return games
 
+@router.get("/lobby", response_model=List[schemas.LobbyGame])
+async def read_lobby(skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=500)):
+    # Served from memory: waiting games are tracked by create_game/join_game
+    return lobby.page(skip, limit)
+
 @router.post("/games", response_model=schemas.GameOut)
-async def create_game(current_user: models.User = Depends(auth.get_current_user), db: AsyncSession = Depends(database.get_db)):
+async def create_game(game_in: Optional[schemas.GameCreate] = None, current_user: models.User = Depends(auth.get_current_user), db: AsyncSession = Depends(database.get_db)):
     # Create a new game, current user is White by default
-    new_game = models.Game(white_player_id=current_user.id, status="waiting")
+    game_in = game_in or schemas.GameCreate()
+    new_game = models.Game(
+        white_player_id=current_user.id, status="waiting", time_control=game_in.time_control, increment=game_in.increment
+    )
     db.add(new_game)
+    await db.execute(
+        update(models.User).where(models.User.id == current_user.id).values(games_played=models.User.games_played + 1)
+    )
     await db.commit()
     # Re-fetch with moves loaded to satisfy Pydantic serialization
     result = await db.execute(select(models.Game).filter(models.Game.id == new_game.id).options(selectinload(models.Game.moves)))
     new_game = result.scalars().first()
+    await publish_added(new_game, current_user)
     return new_game
 
+@router.post("/matchmaking", response_model=schemas.MatchmakingOut)
+async def find_match(current_user: models.User = Depends(auth.get_current_user)):
+    # Long poll: answers once paired, or with "queued" after a while so the client polls again
+    user_id = current_user.id
+    game_id = await matchmaker.join(user_id, current_user.rating)
+    if game_id is not None:
+        return schemas.MatchmakingOut(status="matched", game_id=game_id)
+    ticket = matchmaker.waiting(user_id)
+    if ticket is None:
+        return schemas.MatchmakingOut(status="left")
+    now = time.monotonic()
+    return schemas.MatchmakingOut(
+        status="queued", window=matchmaker.queue.window(ticket, now), waited_seconds=round(now - ticket.enqueued_at, 1)
+    )
+
+@router.delete("/matchmaking", response_model=schemas.MatchmakingOut)
+async def leave_matchmaking(current_user: models.User = Depends(auth.get_current_user)):
+    if not matchmaker.leave(current_user.id):
+        raise HTTPException(status_code=409, detail="Already paired, the game has started")
+    return schemas.MatchmakingOut(status="left")
+
 @router.post("/games/{game_id}/join", response_model=schemas.GameOut)
 async def join_game(game_id: int, current_user: models.User = Depends(auth.get_current_user), db: AsyncSession = Depends(database.get_db)):
     result = await db.execute(select(models.Game).filter(models.Game.id == game_id))
@@ -64,119 +202,631 @@ async def join_game(game_id: int, current_user: models.User = Depends(auth.get_c
     
     game.black_player_id = current_user.id
     game.status = "active"
+    if game.time_control:
+        # Clocks start when the second player sits down, White to move
+        game.white_time_ms = game.black_time_ms = game.time_control * 1000
+        game.last_move_at = datetime.now(timezone.utc)
+    await db.execute(
+        update(models.User).where(models.User.id == current_user.id).values(games_played=models.User.games_played + 1)
+    )
     await db.commit()
     # Re-fetch with moves loaded
     result = await db.execute(select(models.Game).filter(models.Game.id == game.id).options(selectinload(models.Game.moves)))
     game = result.scalars().first()
+    live = registry.add(game)
+    if live.clock is not None:
+        clock_scheduler.schedule(game_id, live.clock.white_ms / 1000)
     
-    await manager.broadcast(game_id, "player_joined")
+    await publish_removed(game_id)
+    await manager.broadcast(game_id, json.dumps({"type": "player_joined"}))
     
     return game
 
-@router.get("/games/{game_id}", response_model=schemas.GameOut)
-async def read_game(game_id: int, db: AsyncSession = Depends(database.get_db)):
+def _moves_from_packed(packed: bytes, white_player_id: int, black_player_id: Optional[int]) -> List[schemas.MoveOut]:
+    """Move list of a game whose move rows were purged (admin_maintenance.py purge-moves)."""
+    fens = move_codec.positions.fens(packed)
+    _, sans = move_codec.replay(packed)
+    return [
+        schemas.MoveOut(
+            id=None, move_san=san, ply=ply, created_at=None, fen_after=fens[ply - 1],
+            player_id=white_player_id if ply % 2 else black_player_id,
+        )
+        for ply, san in enumerate(sans, start=1)
+    ]
+
+async def _load_game(db: AsyncSession, game_id: int) -> Tuple[str, bytes]:
+    """Status and GameOut JSON of a game, as served by GET /games/{id}."""
     result = await db.execute(select(models.Game).filter(models.Game.id == game_id).options(selectinload(models.Game.moves)))
     game = result.scalars().first()
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
-    return game
+    out = schemas.GameOut.model_validate(game, from_attributes=True)
+    if not out.moves and game.moves_packed:
+        # Serialized as MoveBrief, so the rebuilt FENs are left out
+        out.moves = _moves_from_packed(game.moves_packed, game.white_player_id, game.black_player_id)
+    else:
+        # Rows from before ply numbers get theirs from the write order, so clients can sort by ply alone
+        out.moves.sort(key=lambda move: move.id)
+        for ply, move in enumerate(out.moves, start=1):
+            if move.ply is None:
+                move.ply = ply
+    return game.status, out.model_dump_json().encode()
+
+@router.get("/games/{game_id}", response_model=schemas.GameOut)
+async def read_game(game_id: int, request: Request, db: AsyncSession = Depends(database.get_read_db)):
+    return await response_cache.respond(request, "game", game_id, functools.partial(_load_game, db, game_id))
+
+class DuplicateMove(Exception):
+    """The move at this ply was already applied (client retry)."""
+
+    def __init__(self, seq: int, san: str):
+        self.seq = seq
+        self.san = san
+
+
+def _finish_values(live: LiveGame, winner: Optional[chess.Color]) -> Tuple[dict, float]:
+    """Game columns for a finished game and White's score; winner None is a draw."""
+    if winner == chess.WHITE:
+        return {"status": "finished", "result": "1-0", "winner_id": live.white_player_id, "finished_at": func.now()}, 1
+    if winner == chess.BLACK:
+        return {"status": "finished", "result": "0-1", "winner_id": live.black_player_id, "finished_at": func.now()}, 0
+    return {"status": "finished", "result": "1/2-1/2", "finished_at": func.now()}, 0.5
+
+
+async def _record_finish(db: AsyncSession, game_id: int, live: LiveGame, score_white: float) -> Optional[dict]:
+    """Ratings and stored PGN of a game finished in the current transaction; returns the new ratings."""
+    new_ratings = None
+    white_user = await db.get(models.User, live.white_player_id)
+    black_user = await db.get(models.User, live.black_player_id)
+
+    if white_user and black_user:
+        new_w = ratings.calculate_elo(white_user.rating, black_user.rating, score_white)
+        new_b = ratings.calculate_elo(black_user.rating, white_user.rating, 1 - score_white)
+        white_user.rating = new_w
+        black_user.rating = new_b
+        new_ratings = {white_user.id: new_w, black_user.id: new_b}
+
+    await explorer.record_result(db, live.board, live.ply, {1: "1-0", 0: "0-1"}.get(score_white, "1/2-1/2"))
+    # Picked up by the analysis workers once committed
+    db.add(models.GameAnalysis(game_id=game_id))
+
+    # Store the finished game's PGN once so exports are a plain read
+    game = await db.get(models.Game, game_id)
+    game.pgn = pgn_export.build_pgn(
+        game, live.sans, white_user and white_user.username, black_user and black_user.username
+    )
+    return new_ratings
+
+
+def _move_message(live: LiveGame, san: str, fen: str, result: Optional[str] = None) -> str:
+    # seq is the same ply, for clients that predate ply
+    message = {"type": "move", "seq": live.ply, "ply": live.ply, "san": san, "fen": fen}
+    if result is not None:
+        message["result"] = result
+    return _clock_message(message, live)
+
+
+def _clock_message(message: dict, live: LiveGame) -> str:
+    if live.clock is not None:
+        message["white_ms"] = live.clock.white_ms
+        message["black_ms"] = live.clock.black_ms
+    return json.dumps(message)
+
+
+async def apply_move(db: AsyncSession, game_id: int, user_id: int, text: str, seq: Optional[int] = None) -> schemas.MoveOut:
+    """
+    Validate and persist one move, then broadcast it. Used by both the HTTP
+    endpoint and the WebSocket protocol. seq, when given, is the ply the
+    client believes this move produces (1 for White's first move).
+    """
+    # Two attempts: if another worker moved in this game our cached board is stale,
+    # the conditional UPDATE matches nothing and we retry against a fresh board.
+    for attempt in range(2):
+        live = registry.get(game_id) if attempt == 0 else None
+        if live is None:
+            live = await registry.load(db, game_id)
+        if live is None:
+            raise HTTPException(status_code=404, detail="Game not found")
+
+        # Check if user is a player
+        is_white = live.white_player_id == user_id
+        is_black = live.black_player_id == user_id
+
+        if seq is not None and (is_white or is_black):
+            if seq <= live.ply:
+                board = live.board
+                played = live.sans[seq - 1] if seq >= 1 else None
+                if played is not None and (text == played or (len(board.move_stack) == live.ply and text == board.move_stack[seq - 1].uci())):
+                    raise DuplicateMove(seq, played)
+                raise HTTPException(status_code=409, detail="Stale move: position has already advanced")
+            if seq > live.ply + 1:
+                raise HTTPException(status_code=409, detail="Out-of-order move")
+
+        if live.status != "active":
+            raise HTTPException(status_code=400, detail="Game is not active")
+
+        if not (is_white or is_black):
+            raise HTTPException(status_code=403, detail="Not a player in this game")
+
+        board = live.board
+
+        # Check turn
+        if board.turn == chess.WHITE and not is_white:
+             raise HTTPException(status_code=400, detail="Not your turn")
+        if board.turn == chess.BLACK and not is_black:
+             raise HTTPException(status_code=400, detail="Not your turn")
+
+        now = time.time()
+        clock = live.clock
+        if clock is not None and clock.remaining(board.turn, now) <= 0:
+            # The flag fell before the move arrived; the scheduler finishes the game
+            clock_scheduler.schedule(game_id, 0)
+            raise HTTPException(status_code=400, detail="Time is up")
+
+        try:
+            chess_move = parse_move(board, text)
+        except chess.IllegalMoveError:
+            raise HTTPException(status_code=400, detail="Illegal move")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid move format")
+
+        # Apply to the cached board before awaiting, so concurrent requests on this
+        # worker validate against the updated position
+        prev_fen = board.fen()
+        san = board.san(chess_move)
+        if clock is not None:
+            clock.punch(board.turn, now)
+        board.push(chess_move)
+        live.sans.append(san)
+        new_fen = board.fen()
+        values = {"fen": new_fen}
+        if live.packed is not None:
+            live.packed = move_codec.append_move(live.packed, chess_move)
+            values["moves_packed"] = live.packed
+        if clock is not None:
+            values.update(clock.values())
+
+        # Update game status if game over
+        outcome = board.outcome()
+        if outcome is not None:
+            finish_values, score_white = _finish_values(live, outcome.winner)
+            values.update(finish_values)
+
+        if journal is not None:
+            if outcome is None:
+                break
+            # The finishing move (ratings, PGN, result) is committed directly,
+            # after the game's journaled moves are in the database
+            try:
+                await journal.flush()
+            except Exception:
+                registry.discard(game_id)
+                raise
+
+        try:
+            result = await db.execute(
+                update(models.Game)
+                .where(models.Game.id == game_id, models.Game.status == "active", models.Game.fen == prev_fen)
+                .values(**values)
+            )
+        except Exception:
+            registry.discard(game_id)
+            raise
+        if result.rowcount == 1:
+            break
+        await db.rollback()
+        # The game changed without us: neither the board nor a cached response can be trusted
+        registry.discard(game_id)
+        response_cache.invalidate(game_id)
+    else:
+        raise HTTPException(status_code=409, detail="Game was updated concurrently, please retry")
+
+    if journal is not None and outcome is None:
+        return await _journal_move(live, user_id, san, prev_fen, new_fen, board)
+
+    new_ratings = None
+    try:
+        # Save move
+        db_move = models.Move(game_id=game_id, player_id=user_id, move_san=san, ply=live.ply)
+        db.add(db_move)
+        await explorer.record_move(db, game_id, live.ply, board)
+
+        if outcome is not None:
+            new_ratings = await _record_finish(db, game_id, live, score_white)
+
+        await db.commit()
+    except Exception:
+        registry.discard(game_id)
+        raise
+
+    if new_ratings:
+        await publish_ratings(new_ratings)
+
+    if outcome is not None:
+        live.status = "finished"
+        registry.discard(game_id)
+        clock_scheduler.cancel(game_id)
+        analysis_queue.submit(game_id)
+    elif clock is not None:
+        clock_scheduler.schedule(game_id, clock.remaining(board.turn, time.time()) / 1000)
+
+    await manager.broadcast(game_id, _move_message(live, san, new_fen, values.get("result")))
+
+    return schemas.MoveOut(
+        id=db_move.id, move_san=san, ply=db_move.ply, created_at=db_move.created_at,
+        player_id=user_id, fen_after=new_fen,
+    )
+
+
+async def _journal_move(live: LiveGame, user_id: int, san: str, prev_fen: str, new_fen: str, board: chess.Board) -> schemas.MoveOut:
+    """Group mode: log the move and acknowledge it; it reaches the database (then the other clients) with the next flush."""
+    now = time.time()
+    clock = live.clock
+    record = {
+        "game_id": live.game_id, "ply": live.ply, "player_id": user_id, "san": san, "at": now,
+        "fen_before": prev_fen, "fen": new_fen, "key": explorer.position_key(board),
+        "packed": live.packed.hex() if live.packed is not None else None,
+        "clock": [clock.white_ms, clock.black_ms, clock.last_move_at] if clock is not None else None,
+    }
+    message = _move_message(live, san, new_fen)
+    # Already acknowledged if the flush has to drop it: tell the game's clients (the mover among them) to reload
+    dropped = json.dumps({
+        "type": "move_dropped", "ply": record["ply"], "san": san, "player_id": user_id,
+        "detail": "Game was updated concurrently, please retry",
+    })
+    try:
+        await journal.append(
+            record,
+            functools.partial(manager.broadcast, live.game_id, message),
+            functools.partial(manager.broadcast, live.game_id, dropped),
+        )
+    except Exception:
+        registry.discard(live.game_id)
+        raise
+    if clock is not None:
+        clock_scheduler.schedule(live.game_id, clock.remaining(board.turn, now) / 1000)
+    return schemas.MoveOut(
+        id=None, move_san=san, ply=record["ply"], created_at=datetime.fromtimestamp(now, timezone.utc),
+        player_id=user_id, fen_after=new_fen,
+    )
+
+
+async def flush_moves(records: List[dict]) -> List[dict]:
+    """
+    Write a batch of journaled moves in one transaction: one conditional
+    UPDATE per game (from the position before its first move in the batch),
+    then all move and position rows. A game whose stored position moved on
+    (a batch replayed twice, or another worker) keeps it and its moves here
+    are dropped; returns the dropped records.
+    """
+    by_game: dict = {}
+    for record in records:
+        by_game.setdefault(record["game_id"], []).append(record)
+    move_rows, position_rows, dropped = [], [], []
+    async with database.SessionLocal() as db:
+        for game_id, moves in by_game.items():
+            last = moves[-1]
+            values = {"fen": last["fen"]}
+            if last["packed"] is not None:
+                values["moves_packed"] = bytes.fromhex(last["packed"])
+            if last["clock"] is not None:
+                white_ms, black_ms, last_move_at = last["clock"]
+                values.update(
+                    white_time_ms=white_ms, black_time_ms=black_ms,
+                    last_move_at=datetime.fromtimestamp(last_move_at, timezone.utc) if last_move_at else None,
+                )
+            result = await db.execute(
+                update(models.Game)
+                .where(models.Game.id == game_id, models.Game.status == "active", models.Game.fen == moves[0]["fen_before"])
+                .values(**values)
+            )
+            if result.rowcount != 1:
+                logger.error("journaled moves %d-%d of game %s do not apply, dropped", moves[0]["ply"], last["ply"], game_id)
+                registry.discard(game_id)
+                response_cache.invalidate(game_id)
+                dropped.extend(moves)
+                continue
+            for move in moves:
+                move_rows.append({
+                    "game_id": game_id, "player_id": move["player_id"], "move_san": move["san"], "ply": move["ply"],
+                    "created_at": datetime.fromtimestamp(move["at"], timezone.utc),
+                })
+                position_rows.append({"game_id": game_id, "ply": move["ply"], "position_key": move["key"]})
+        if move_rows:
+            await db.execute(insert(models.Move), move_rows)
+        await explorer.add_positions(db, position_rows)
+        await db.commit()
+    return dropped
+
+
+journal = (
+    MoveJournal(settings.MOVE_JOURNAL_DIR, settings.MOVE_FLUSH_MS / 1000, settings.MOVE_FLUSH_BATCH, settings.MOVE_JOURNAL_FSYNC)
+    if settings.MOVE_DURABILITY == "group" else None
+)
+
+
+async def flag_game(game_id: int):
+    """Finish a game whose side to move has run out of time."""
+    if journal is not None:
+        # The position that ran out of time must be in the database first
+        await journal.flush()
+    async with database.SessionLocal() as db:
+        # Fresh from the database: a move may have landed on another worker
+        live = await registry.load(db, game_id)
+        if live is None or live.status != "active" or live.clock is None:
+            return
+        board = live.board
+        remaining = live.clock.remaining(board.turn, time.time())
+        if remaining > 0:
+            clock_scheduler.schedule(game_id, remaining / 1000)
+            return
+
+        loser = board.turn
+        # Running out of time against a lone king (or similar) is a draw
+        winner = None if board.has_insufficient_material(not loser) else not loser
+        values, score_white = _finish_values(live, winner)
+        if loser == chess.WHITE:
+            live.clock.white_ms = 0
+        else:
+            live.clock.black_ms = 0
+        values["white_time_ms"] = live.clock.white_ms
+        values["black_time_ms"] = live.clock.black_ms
+        result = await db.execute(
+            update(models.Game)
+            .where(models.Game.id == game_id, models.Game.status == "active", models.Game.fen == board.fen())
+            .values(**values)
+        )
+        if result.rowcount != 1:
+            # Moved or finished elsewhere in the meantime; whoever did it owns the clock now
+            await db.rollback()
+            registry.discard(game_id)
+            response_cache.invalidate(game_id)
+            return
+        new_ratings = await _record_finish(db, game_id, live, score_white)
+        await db.commit()
+
+    live.status = "finished"
+    registry.discard(game_id)
+    analysis_queue.submit(game_id)
+    if new_ratings:
+        await publish_ratings(new_ratings)
+    await manager.broadcast(
+        game_id, _clock_message({"type": "game_over", "result": values["result"], "reason": "timeout"}, live)
+    )
+
+
+_flag_tasks: set = set()
+
+def _on_flag(game_id: int):
+    task = asyncio.create_task(flag_game(game_id))
+    _flag_tasks.add(task)
+    task.add_done_callback(_flag_done)
+
+def _flag_done(task: asyncio.Task):
+    _flag_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("flag handling failed", exc_info=task.exception())
+
+clock_scheduler = FlagScheduler(_on_flag)
+
+def schedule_clocks():
+    """Arm flag timers for every running clock in the registry (after a restart)."""
+    now = time.time()
+    for live in registry:
+        if live.clock is not None and live.clock.last_move_at is not None:
+            clock_scheduler.schedule(live.game_id, live.clock.remaining(live.board.turn, now) / 1000)
 
 @router.post("/games/{game_id}/move", response_model=schemas.MoveOut)
 async def make_move(game_id: int, move: schemas.MoveCreate, current_user: models.User = Depends(auth.get_current_user), db: AsyncSession = Depends(database.get_db)):
-    result = await db.execute(select(models.Game).filter(models.Game.id == game_id))
-    game = result.scalars().first()
-    if not game:
+    try:
+        return await apply_move(db, game_id, current_user.id, move.san, move.seq)
+    except DuplicateMove:
+        raise HTTPException(status_code=409, detail="Duplicate move")
+
+# Primary, not the replica: a finished game without a stored PGN gets one written back
+@router.get("/games/{game_id}/pgn", response_class=PlainTextResponse)
+async def read_game_pgn(game_id: int, db: AsyncSession = Depends(database.get_db)):
+    pgn = await pgn_export.game_pgn(db, game_id)
+    if pgn is None:
         raise HTTPException(status_code=404, detail="Game not found")
-    
-    if game.status != "active":
-        raise HTTPException(status_code=400, detail="Game is not active")
+    return PlainTextResponse(pgn, media_type=pgn_export.PGN_MEDIA_TYPE)
 
-    # Check if user is a player
-    is_white = game.white_player_id == current_user.id
-    is_black = game.black_player_id == current_user.id
-    
-    if not (is_white or is_black):
-        raise HTTPException(status_code=403, detail="Not a player in this game")
+@router.get("/users/{user_id}/games.pgn")
+async def export_user_pgn(user_id: int, db: AsyncSession = Depends(database.get_read_db)):
+    if await db.get(models.User, user_id) is None:
+        raise HTTPException(status_code=404, detail="User not found")
 
-    board = chess.Board(game.fen)
-    
-    # Check turn
-    if board.turn == chess.WHITE and not is_white:
-         raise HTTPException(status_code=400, detail="Not your turn")
-    if board.turn == chess.BLACK and not is_black:
-         raise HTTPException(status_code=400, detail="Not your turn")
+    async def body():
+        # Own session: the stream outlives the request's dependencies
+        async with database.ReadSessionLocal() as db:
+            async for chunk in pgn_export.stream_user_pgn(db, user_id):
+                yield chunk
+
+    return StreamingResponse(
+        body(),
+        media_type=pgn_export.PGN_MEDIA_TYPE,
+        headers={"Content-Disposition": f'attachment; filename="user-{user_id}-games.pgn"'},
+    )
+
+@router.get("/games/{game_id}/analysis", response_model=schemas.AnalysisOut)
+async def read_game_analysis(game_id: int, db: AsyncSession = Depends(database.get_db)):
+    job = await db.get(models.GameAnalysis, game_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="No analysis for this game")
+    return schemas.AnalysisOut.model_validate(job, from_attributes=True)
+
+@router.get("/moves/journal")
+async def get_journal_stats():
+    return {"durability": settings.MOVE_DURABILITY, **(journal.stats() if journal is not None else {})}
 
+@router.get("/analysis/stats")
+async def get_analysis_stats():
+    return analysis_queue.stats()
+
+@router.get("/explorer", response_model=schemas.ExplorerOut)
+async def explore_position(fen: Optional[str] = None, moves: Optional[str] = None, games_limit: int = 10, db: AsyncSession = Depends(database.get_read_db)):
+    """Moves played from a position (a FEN, or moves from the start separated by spaces or commas) and how they scored."""
     try:
-        chess_move = board.parse_san(move.san)
+        board = chess.Board(fen) if fen else chess.Board()
     except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid FEN")
+    for text in (moves or "").replace(",", " ").split():
         try:
-             # Try UCI if SAN fails (though prompt said move validation)
-             chess_move = board.parse_uci(move.san)
+            board.push(parse_move(board, text))
         except ValueError:
-             raise HTTPException(status_code=400, detail="Invalid move format")
+            raise HTTPException(status_code=400, detail=f"Illegal move: {text}")
+    return await explorer.explore(db, board, min(max(games_limit, 0), 100))
 
-    if chess_move not in board.legal_moves:
-        raise HTTPException(status_code=400, detail="Illegal move")
-
-    board.push(chess_move)
-    new_fen = board.fen()
-    game.fen = new_fen
-    
-    # Save move
-    db_move = models.Move(game_id=game.id, player_id=current_user.id, move_san=move.san, fen_after=new_fen)
-    db.add(db_move)
-    
-    # Update game status if game over
-    if board.is_game_over():
-        game.status = "finished"
-        outcome = board.outcome()
-        if outcome.winner == chess.WHITE:
-            game.result = "1-0"
-            game.winner_id = game.white_player_id
-            score_white = 1
-            score_black = 0
-        elif outcome.winner == chess.BLACK:
-            game.result = "0-1"
-            game.winner_id = game.black_player_id
-            score_white = 0
-            score_black = 1
-        else:
-            game.result = "1/2-1/2"
-            score_white = 0.5
-            score_black = 0.5
-            
-        # Update ratings
-        # Fetch full player objects to get ratings
-        w_res = await db.execute(select(models.User).filter(models.User.id == game.white_player_id))
-        white_user = w_res.scalars().first()
-        b_res = await db.execute(select(models.User).filter(models.User.id == game.black_player_id))
-        black_user = b_res.scalars().first()
-        
-        if white_user and black_user:
-            new_w = ratings.calculate_elo(white_user.rating, black_user.rating, score_white)
-            new_b = ratings.calculate_elo(black_user.rating, white_user.rating, score_black)
-            white_user.rating = new_w
-            black_user.rating = new_b
-            
-    await db.commit()
-    await db.refresh(game)
-    
-    await manager.broadcast(game_id, f"move:{move.san}")
-    
-    return db_move
+_move_list = TypeAdapter(List[schemas.MoveOut])
 
 @router.get("/games/{game_id}/history", response_model=List[schemas.MoveOut])
-async def get_game_history(game_id: int, db: AsyncSession = Depends(database.get_db)):
-    result = await db.execute(select(models.Move).filter(models.Move.game_id == game_id).order_by(models.Move.created_at))
-    moves = result.scalars().all()
-    return moves
+async def get_game_history(game_id: int, request: Request, db: AsyncSession = Depends(database.get_read_db)):
+    async def load():
+        result = await db.execute(
+            select(models.Game.status, models.Game.moves_packed, models.Game.white_player_id, models.Game.black_player_id)
+            .filter(models.Game.id == game_id)
+        )
+        game = result.first()
+        result = await db.execute(select(models.Move).filter(models.Move.game_id == game_id).order_by(models.Move.id))
+        moves = result.scalars().all()
+        # FENs are rebuilt from the packed moves (cached) unless stored on legacy rows
+        packed = game.moves_packed if game else None
+        fens = move_codec.positions.fens(packed) if packed else ()
+        history = [
+            schemas.MoveOut(
+                id=move.id, move_san=move.move_san, ply=move.ply or ply, created_at=move.created_at, player_id=move.player_id,
+                fen_after=move.fen_after or (fens[move.ply - 1] if move.ply and move.ply <= len(fens) else None),
+            )
+            for ply, move in enumerate(moves, start=1)
+        ]
+        if not history and packed:
+            history = _moves_from_packed(packed, game.white_player_id, game.black_player_id)
+        # Unknown games keep answering an empty list, as before
+        return game and game.status, _move_list.dump_json(history)
+
+    return await response_cache.respond(request, "history", game_id, load)
+
+@router.get("/cache/stats")
+async def get_cache_stats():
+    return {"responses": response_cache.stats(), "resync": recent_moves.stats()}
+
+async def _handle_frame(client: Client, game_id: int, user_id: Optional[int], frame: dict):
+    def reply(payload: dict):
+        manager.send(f"game:{game_id}", client, json.dumps(payload))
+
+    kind = frame.get("type")
+    if kind == "ping":
+        reply({"type": "pong"})
+        return
+    if kind != "move":
+        reply({"type": "error", "detail": "Unknown message type"})
+        return
+
+    seq = frame.get("seq")
+    san = frame.get("san")
+    if not isinstance(seq, int) or not isinstance(san, str):
+        reply({"type": "error", "seq": seq, "detail": "Move needs integer seq and san"})
+        return
+    if user_id is None:
+        reply({"type": "error", "seq": seq, "detail": "Not authenticated"})
+        return
+
+    try:
+        async with database.SessionLocal() as db:
+            db_move = await apply_move(db, game_id, user_id, san, seq)
+    except DuplicateMove as dup:
+        reply({"type": "ack", "seq": dup.seq, "san": dup.san, "duplicate": True})
+        return
+    except HTTPException as exc:
+        reply({"type": "error", "seq": seq, "detail": exc.detail})
+        return
+    except Exception:
+        # Database or other server failure: report it and keep the socket open
+        logger.exception("move over WebSocket failed in game %s", game_id)
+        reply({"type": "error", "seq": seq, "detail": "Internal server error"})
+        return
+    reply({"type": "ack", "seq": seq, "san": db_move.move_san, "fen": db_move.fen_after})
+
+@router.websocket("/ws/lobby")
+async def lobby_websocket(websocket: WebSocket):
+    # A snapshot first, then "add"/"remove" deltas as games open and fill up
+    client = await manager.connect(LOBBY_CHANNEL, websocket)
+    manager.send(LOBBY_CHANNEL, client, json.dumps({"type": "snapshot", "games": lobby.snapshot()}))
+    try:
+        while True:
+            text = await websocket.receive_text()
+            try:
+                frame = json.loads(text)
+            except ValueError:
+                continue
+            if isinstance(frame, dict) and frame.get("type") == "ping":
+                manager.send(LOBBY_CHANNEL, client, json.dumps({"type": "pong"}))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        manager.disconnect(LOBBY_CHANNEL, websocket)
+
+async def _snapshot(game_id: int) -> Tuple[int, str]:
+    entry = response_cache.get("game", game_id)
+    if entry is not None:
+        body = entry.body
+    else:
+        # The primary: what a lagging replica misses might be gone from the ring buffer too
+        async with database.SessionLocal() as db:
+            _, body = await _load_game(db, game_id)
+    game = json.loads(body)
+    return len(game["moves"]), json.dumps({"type": "snapshot", "ply": len(game["moves"]), "game": game})
 
 @router.websocket("/ws/game/{game_id}")
-async def websocket_endpoint(websocket: WebSocket, game_id: int):
-    await manager.connect(game_id, websocket)
+async def websocket_endpoint(websocket: WebSocket, game_id: int, token: Optional[str] = None, last_ply: Optional[int] = None):
+    # Authenticate once at connect; sockets without a token are spectators
+    user_id = None
+    if token is not None:
+        async with database.SessionLocal() as db:
+            user = await auth.get_user_from_token(token, db)
+        if user is None:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        user_id = user.id
+
+    # Reconnect after ply last_ply: the moves since then from the ring buffer,
+    # or a snapshot of the game followed by any moves made while it loaded
+    snapshot = None
+    if last_ply is not None and recent_moves.since(game_id, last_ply) is None:
+        try:
+            last_ply, snapshot = await _snapshot(game_id)
+        except HTTPException:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+
+    channel = f"game:{game_id}"
+    client = await manager.connect(channel, websocket)
+    # No await from here on: later broadcasts are queued after these
+    if last_ply is not None:
+        missed = recent_moves.since(game_id, last_ply)
+        if snapshot is not None:
+            manager.send(channel, client, snapshot)
+            recent_moves.snapshots += 1
+        elif missed is None:
+            # Evicted from the buffer while the socket was accepted: the client refetches
+            manager.send(channel, client, json.dumps({"type": "resync"}))
+            recent_moves.resyncs += 1
+        else:
+            recent_moves.deltas += 1
+        for message in missed or ():
+            manager.send(channel, client, message)
     try:
         while True:
-            # Simple echo or heartbeat, mainly used for server push on moves
-            await websocket.receive_text()
+            text = await websocket.receive_text()
+            try:
+                frame = json.loads(text)
+            except ValueError:
+                # Plain-text heartbeat from older clients
+                continue
+            if isinstance(frame, dict):
+                await _handle_frame(client, game_id, user_id, frame)
     except WebSocketDisconnect:
-        manager.disconnect(game_id, websocket)
+        pass
+    finally:
+        # Whatever ended the loop, a dead socket must not stay registered
+        manager.disconnect(channel, websocket)
@@ -0,0 +1,155 @@
+import bisect
+import json
+import logging
+from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+import models, pubsub
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "ratings"
+
+
+class Leaderboard:
+    """
+    Users ordered by rating (highest first, then by id). Ratings map onto
+    slots of a Fenwick tree holding per-slot counts, so rank and k-th lookups
+    are O(log R) for a rating range R; each slot keeps a small sorted bucket
+    of (-rating, user_id) for the users in it.
+    """
+
+    def __init__(self, min_rating: int = -1000, max_rating: int = 5000):
+        self.min_rating = min_rating
+        self.max_rating = max_rating
+        self._size = max_rating - min_rating + 1
+        self._tree = [0] * (self._size + 1)
+        self._buckets: dict[int, list] = {}
+        self._ratings: dict[int, int] = {}
+
+    def __len__(self):
+        return len(self._ratings)
+
+    def _slot(self, rating: int) -> int:
+        # Slot 1 holds the highest rating; out-of-range ratings share the end slots
+        rating = min(max(rating, self.min_rating), self.max_rating)
+        return self.max_rating - rating + 1
+
+    def _add(self, slot: int, delta: int):
+        while slot <= self._size:
+            self._tree[slot] += delta
+            slot += slot & -slot
+
+    def _prefix(self, slot: int) -> int:
+        total = 0
+        while slot > 0:
+            total += self._tree[slot]
+            slot -= slot & -slot
+        return total
+
+    def _find(self, k: int) -> int:
+        # Smallest slot whose prefix count reaches k (1-based)
+        slot = 0
+        step = 1 << self._size.bit_length()
+        while step:
+            nxt = slot + step
+            if nxt <= self._size and self._tree[nxt] < k:
+                slot = nxt
+                k -= self._tree[nxt]
+            step >>= 1
+        return slot + 1
+
+    def clear(self):
+        self._tree = [0] * (self._size + 1)
+        self._buckets.clear()
+        self._ratings.clear()
+
+    def rating(self, user_id: int) -> Optional[int]:
+        return self._ratings.get(user_id)
+
+    def set(self, user_id: int, rating: int):
+        old = self._ratings.get(user_id)
+        if old == rating:
+            return
+        if old is not None:
+            self.remove(user_id)
+        slot = self._slot(rating)
+        bisect.insort(self._buckets.setdefault(slot, []), (-rating, user_id))
+        self._add(slot, 1)
+        self._ratings[user_id] = rating
+
+    def remove(self, user_id: int):
+        rating = self._ratings.pop(user_id, None)
+        if rating is None:
+            return
+        slot = self._slot(rating)
+        bucket = self._buckets[slot]
+        del bucket[bisect.bisect_left(bucket, (-rating, user_id))]
+        if not bucket:
+            del self._buckets[slot]
+        self._add(slot, -1)
+
+    def rank(self, user_id: int) -> Optional[int]:
+        rating = self._ratings.get(user_id)
+        if rating is None:
+            return None
+        slot = self._slot(rating)
+        return self._prefix(slot - 1) + bisect.bisect_left(self._buckets[slot], (-rating, user_id)) + 1
+
+    def page(self, offset: int, limit: int) -> List[int]:
+        ids: List[int] = []
+        offset = max(offset, 0)
+        position = offset
+        while len(ids) < limit and position < len(self._ratings):
+            slot = self._find(position + 1)
+            bucket = self._buckets[slot]
+            start = position - self._prefix(slot - 1)
+            for _, user_id in bucket[start:start + limit - len(ids)]:
+                ids.append(user_id)
+            position = offset + len(ids)
+        return ids
+
+    def around(self, user_id: int, radius: int) -> List[int]:
+        rank = self.rank(user_id)
+        if rank is None:
+            return []
+        start = max(0, rank - 1 - radius)
+        return self.page(start, rank - 1 - start + radius + 1)
+
+    async def rebuild(self, db: AsyncSession):
+        result = await db.execute(select(models.User.id, models.User.rating))
+        self.clear()
+        for user_id, rating in result.all():
+            self.set(user_id, rating)
+
+    async def check(self, db: AsyncSession) -> int:
+        """
+        Compare with the users table and rebuild on any difference (ratings
+        changed outside the app, e.g. by admin scripts). Returns the number
+        of users that disagreed.
+        """
+        result = await db.execute(select(models.User.id, models.User.rating))
+        stored = dict(result.all())
+        mismatches = sum(1 for user_id, rating in stored.items() if self._ratings.get(user_id) != rating)
+        mismatches += sum(1 for user_id in self._ratings if user_id not in stored)
+        if mismatches:
+            logger.warning("leaderboard: %d entries out of sync, rebuilding", mismatches)
+            self.clear()
+            for user_id, rating in stored.items():
+                self.set(user_id, rating)
+        return mismatches
+
+    def on_message(self, channel: str, message: str):
+        if channel != CHANNEL:
+            return
+        for user_id, rating in json.loads(message).items():
+            self.set(int(user_id), rating)
+
+
+leaderboard = Leaderboard()
+pubsub.backend.subscribe(leaderboard.on_message)
+
+
+async def publish_ratings(new_ratings: dict):
+    """Tell every worker's leaderboard about committed rating changes."""
+    await pubsub.backend.publish(CHANNEL, json.dumps(new_ratings))
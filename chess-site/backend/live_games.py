@@ -0,0 +1,125 @@
+from typing import Optional
+import chess
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+import models, move_codec
+from clocks import Clock
+
+
+def parse_move(board: chess.Board, text: str) -> chess.Move:
+    # Accept both SAN ("Nf3") and UCI ("g1f3"); both parsers reject illegal moves
+    try:
+        return board.parse_san(text)
+    except ValueError as san_error:
+        try:
+            return board.parse_uci(text)
+        except chess.InvalidMoveError:
+            raise san_error
+
+
+def replay_board(fen: str, moves_san: list) -> chess.Board:
+    """
+    Rebuild the board by replaying stored moves so the move stack (ply count,
+    repetition history) is available. Falls back to the stored FEN when the
+    move log does not lead to it.
+    """
+    board = chess.Board()
+    try:
+        for san in moves_san:
+            board.push(parse_move(board, san))
+    except ValueError:
+        return chess.Board(fen)
+    if board.fen() != fen:
+        return chess.Board(fen)
+    return board
+
+
+class LiveGame:
+    __slots__ = ("game_id", "board", "sans", "packed", "white_player_id", "black_player_id", "status", "clock")
+
+    def __init__(self, game_id: int, board: chess.Board, sans: list, packed: Optional[bytes], white_player_id: int, black_player_id: Optional[int], status: str, clock: Optional[Clock] = None):
+        self.game_id = game_id
+        self.board = board
+        # SAN of every move played so far; len(sans) is the current ply
+        self.sans = sans
+        # Game.moves_packed; None when the move log could not be packed
+        self.packed = packed
+        self.white_player_id = white_player_id
+        self.black_player_id = black_player_id
+        self.status = status
+        self.clock = clock
+
+    @property
+    def ply(self) -> int:
+        return len(self.sans)
+
+
+class LiveGameRegistry:
+    """In-memory state of active games, keyed by game id."""
+
+    def __init__(self):
+        self._games: dict[int, LiveGame] = {}
+
+    def __len__(self):
+        return len(self._games)
+
+    def __iter__(self):
+        return iter(list(self._games.values()))
+
+    def get(self, game_id: int) -> Optional[LiveGame]:
+        return self._games.get(game_id)
+
+    def add(self, game: models.Game, moves_san: list = ()) -> LiveGame:
+        board = None
+        if game.moves_packed is not None:
+            board, sans = move_codec.replay(game.moves_packed)
+            packed = game.moves_packed
+        if board is None or board.fen() != game.fen:
+            # Not converted yet (or inconsistent): fall back to the moves table
+            board = replay_board(game.fen, moves_san)
+            sans = list(moves_san)
+            complete = len(board.move_stack) == len(sans) and board.root().fen() == chess.STARTING_FEN
+            packed = move_codec.pack_moves(board.move_stack) if complete else None
+        live = LiveGame(
+            game.id, board, sans, packed, game.white_player_id, game.black_player_id, game.status, Clock.from_game(game)
+        )
+        if live.status == "active":
+            self._games[game.id] = live
+        return live
+
+    def discard(self, game_id: int):
+        self._games.pop(game_id, None)
+
+    async def _moves_san(self, db: AsyncSession, game_ids: list) -> dict:
+        moves: dict[int, list] = {game_id: [] for game_id in game_ids}
+        if game_ids:
+            result = await db.execute(
+                select(models.Move.game_id, models.Move.move_san)
+                .filter(models.Move.game_id.in_(game_ids))
+                .order_by(models.Move.game_id, models.Move.id)
+            )
+            for game_id, san in result.all():
+                moves[game_id].append(san)
+        return moves
+
+    async def load(self, db: AsyncSession, game_id: int) -> Optional[LiveGame]:
+        # Cache miss (restart, other worker, stale board): rebuild from the tables
+        result = await db.execute(select(models.Game).filter(models.Game.id == game_id))
+        game = result.scalars().first()
+        if not game:
+            self.discard(game_id)
+            return None
+        moves = await self._moves_san(db, [game_id] if game.moves_packed is None else [])
+        return self.add(game, moves.get(game_id, ()))
+
+    async def rebuild(self, db: AsyncSession):
+        self._games.clear()
+        result = await db.execute(select(models.Game).filter(models.Game.status == "active"))
+        active = result.scalars().all()
+        # Only games without packed moves need the moves table
+        moves = await self._moves_san(db, [game.id for game in active if game.moves_packed is None])
+        for game in active:
+            self.add(game, moves.get(game.id, ()))
+
+
+registry = LiveGameRegistry()
@@ -0,0 +1,109 @@
+import json
+import logging
+from datetime import datetime, timezone
+from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+import models, pubsub
+from leaderboard import leaderboard
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "lobby"
+
+
+def summary(game: models.Game, creator: Optional[models.User]) -> dict:
+    return {
+        "id": game.id,
+        "creator_id": game.white_player_id,
+        "creator_name": creator.username if creator else None,
+        "creator_rating": creator.rating if creator else None,
+        "created_at": game.created_at.isoformat() if game.created_at else None,
+        "time_control": game.time_control,
+        "increment": game.increment or 0,
+    }
+
+
+class Lobby:
+    """
+    Games waiting for an opponent, oldest first, as JSON-ready summaries.
+    Every change goes out as a delta on the "lobby" channel; each worker
+    applies it to its own copy and forwards it to its lobby sockets.
+    """
+
+    def __init__(self):
+        self._games: dict[int, dict] = {}
+
+    def __len__(self):
+        return len(self._games)
+
+    def snapshot(self) -> List[dict]:
+        return list(self._games.values())
+
+    def page(self, skip: int, limit: int) -> List[dict]:
+        now = datetime.now(timezone.utc)
+        games = []
+        skip, limit = max(skip, 0), max(limit, 0)
+        for entry in self.snapshot()[skip:skip + limit]:
+            created_at = datetime.fromisoformat(entry["created_at"]) if entry["created_at"] else None
+            if created_at is not None and created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=timezone.utc)
+            rating = leaderboard.rating(entry["creator_id"])
+            games.append({
+                **entry,
+                "creator_rating": rating if rating is not None else entry["creator_rating"],
+                "age_seconds": int((now - created_at).total_seconds()) if created_at else None,
+            })
+        return games
+
+    def apply(self, message: str) -> bool:
+        """Apply one delta; False if it changed nothing (already applied)."""
+        delta = json.loads(message)
+        if delta["type"] == "add":
+            game = delta["game"]
+            if self._games.get(game["id"]) == game:
+                return False
+            self._games[game["id"]] = game
+            return True
+        if delta["type"] == "remove":
+            return self._games.pop(delta["id"], None) is not None
+        return False
+
+    async def _load(self, db: AsyncSession) -> dict:
+        result = await db.execute(
+            select(models.Game, models.User)
+            .outerjoin(models.User, models.User.id == models.Game.white_player_id)
+            .filter(models.Game.status == "waiting")
+            .order_by(models.Game.created_at, models.Game.id)
+        )
+        return {game.id: summary(game, creator) for game, creator in result.all()}
+
+    async def rebuild(self, db: AsyncSession):
+        self._games = await self._load(db)
+
+    async def check(self, db: AsyncSession) -> List[str]:
+        """
+        Reconcile with the games table (games aborted by admin scripts never
+        publish a delta). Returns the deltas applied, for local lobby sockets.
+        """
+        stored = await self._load(db)
+        deltas = [json.dumps({"type": "remove", "id": game_id}) for game_id in self._games if game_id not in stored]
+        deltas += [
+            json.dumps({"type": "add", "game": game})
+            for game_id, game in stored.items() if game_id not in self._games
+        ]
+        if deltas:
+            logger.warning("lobby: %d entries out of sync", len(deltas))
+            self._games = stored
+        return deltas
+
+
+lobby = Lobby()
+
+
+async def publish_added(game: models.Game, creator: Optional[models.User]):
+    await pubsub.backend.publish(CHANNEL, json.dumps({"type": "add", "game": summary(game, creator)}))
+
+
+async def publish_removed(game_id: int):
+    await pubsub.backend.publish(CHANNEL, json.dumps({"type": "remove", "id": game_id}))
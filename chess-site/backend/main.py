@@ -1,16 +1,28 @@
 import sys
 import asyncio
+import logging
 
 if sys.platform == 'win32':
     asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
 
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from typing import List
+from sqlalchemy import String, tuple_, type_coerce, union_all
+from typing import List, Optional
+from datetime import datetime
+import base64
 import models, schemas, database, auth, games
+from live_games import registry
+from leaderboard import leaderboard, publish_ratings
+from lobby import lobby, CHANNEL as LOBBY_CHANNEL
+from matchmaking import matchmaker
+from analysis_queue import analysis_queue
+from metrics import metrics, MetricsMiddleware
+from config import settings
 
 app = FastAPI(title="Chess Site Backend")
 
@@ -23,14 +35,56 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(MetricsMiddleware, metrics=metrics)
+
 app.include_router(games.router)
 
+metrics.instrument_engine(database.engine)
+if database.read_engine is not database.engine:
+    metrics.instrument_engine(database.read_engine)
+
 @app.on_event("startup")
 async def startup():
     # Initialize database tables
     async with database.engine.begin() as conn:
         # In production, use Alembic for migrations
         await conn.run_sync(models.Base.metadata.create_all)
+    if games.journal is not None:
+        # Moves acknowledged but not yet written when the last run stopped
+        await games.journal.replay(games.flush_moves)
+        games.journal.start(games.flush_moves)
+    # Rebuild in-memory state of active games after a restart
+    async with database.SessionLocal() as db:
+        await registry.rebuild(db)
+        await leaderboard.rebuild(db)
+        await lobby.rebuild(db)
+    await games.manager.start()
+    games.schedule_clocks()
+    app.state.index_check = asyncio.create_task(check_indexes())
+    app.state.matchmaking = asyncio.create_task(matchmaker.run(settings.MATCHMAKING_SWEEP_SECONDS))
+    analysis_queue.start(settings.ANALYSIS_SWEEP_SECONDS)
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.index_check.cancel()
+    app.state.matchmaking.cancel()
+    await analysis_queue.stop()
+    if games.journal is not None:
+        await games.journal.stop()
+    await games.manager.stop()
+    auth.password_pool.shutdown()
+
+async def check_indexes():
+    # Catches rating and game status changes made outside this process's pub/sub (admin scripts)
+    while True:
+        await asyncio.sleep(settings.LEADERBOARD_CHECK_SECONDS)
+        try:
+            async with database.SessionLocal() as db:
+                await leaderboard.check(db)
+                for delta in await lobby.check(db):
+                    games.manager.deliver(LOBBY_CHANNEL, delta)
+        except Exception:
+            logging.getLogger(__name__).exception("in-memory index consistency check failed")
 
 @app.post("/register", response_model=schemas.UserOut)
 async def register(user: schemas.UserCreate, db: AsyncSession = Depends(database.get_db)):
@@ -42,30 +96,31 @@ async def register(user: schemas.UserCreate, db: AsyncSession = Depends(database
     if result.scalars().first():
         raise HTTPException(status_code=400, detail="Username already taken")
 
-    hashed = auth.get_password_hash(user.password)
+    hashed = await auth.hash_password(user.password)
     new_user = models.User(email=user.email, username=user.username, hashed_password=hashed)
     db.add(new_user)
     await db.commit()
-    # Eager load relationships for the response
-    from sqlalchemy.orm import selectinload
-    result = await db.execute(
-        select(models.User)
-        .filter(models.User.id == new_user.id)
-        .options(selectinload(models.User.games_white), selectinload(models.User.games_black))
-    )
-    new_user = result.scalars().first()
+    await db.refresh(new_user)
+    await publish_ratings({new_user.id: new_user.rating})
     return new_user
 
 @app.post("/login", response_model=schemas.Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(database.get_db)):
     result = await db.execute(select(models.User).filter(models.User.username == form_data.username))
     user = result.scalars().first()
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+    if not user or not await auth.check_password(form_data.password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if auth.needs_rehash(user.hashed_password):
+        # Cost factor changed since this hash was made: upgrade it transparently
+        try:
+            user.hashed_password = await auth.hash_password(form_data.password)
+            await db.commit()
+        except HTTPException:
+            pass
     access_token = auth.create_access_token(data={"sub": user.username})
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -73,28 +128,110 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSessi
 async def read_users_me(current_user: models.User = Depends(auth.get_current_user)):
     return current_user
 
+async def _users_in_order(db: AsyncSession, user_ids: List[int]) -> List[models.User]:
+    if not user_ids:
+        return []
+    result = await db.execute(select(models.User).filter(models.User.id.in_(user_ids)))
+    users = {user.id: user for user in result.scalars().all()}
+    return [users[user_id] for user_id in user_ids if user_id in users]
+
 @app.get("/ratings", response_model=List[schemas.UserOut])
-async def get_ratings(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(database.get_db)):
-    from sqlalchemy.orm import selectinload
-    result = await db.execute(
-        select(models.User)
-        .options(selectinload(models.User.games_white), selectinload(models.User.games_black))
-        .order_by(models.User.rating.desc())
-        .offset(skip)
-        .limit(limit)
+async def get_ratings(skip: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=500), db: AsyncSession = Depends(database.get_read_db)):
+    # Order comes from the in-memory leaderboard; only the page's rows are read
+    return await _users_in_order(db, leaderboard.page(skip, limit))
+
+@app.get("/ratings/rank/{user_id}", response_model=schemas.RankOut)
+async def get_rank(user_id: int):
+    rank = leaderboard.rank(user_id)
+    if rank is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    return {"user_id": user_id, "rank": rank, "rating": leaderboard.rating(user_id), "total": len(leaderboard)}
+
+@app.get("/ratings/around/{user_id}", response_model=List[schemas.RankedUserOut])
+async def get_players_around(user_id: int, radius: int = 5, db: AsyncSession = Depends(database.get_read_db)):
+    rank = leaderboard.rank(user_id)
+    if rank is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    radius = max(0, min(radius, 50))
+    user_ids = leaderboard.around(user_id, radius)
+    first_rank = rank - user_ids.index(user_id)
+    users = await _users_in_order(db, user_ids)
+    return [
+        schemas.RankedUserOut.model_validate(user, from_attributes=True).model_copy(update={"rank": first_rank + user_ids.index(user.id)})
+        for user in users
+    ]
+
+def _history_key(db: AsyncSession):
+    # SQLite keeps timestamps as text in the form they were written ("...:10"
+    # from CURRENT_TIMESTAMP, "...:10.000000" from Python), and a bound datetime
+    # would not compare equal to either: page on the stored text itself there
+    if db.bind.dialect.name == "sqlite":
+        return type_coerce(models.Game.created_at, String)
+    return models.Game.created_at
+
+def _encode_cursor(created_at, game_id: int) -> str:
+    key = created_at if isinstance(created_at, str) else created_at.isoformat()
+    return base64.urlsafe_b64encode(f"{key}|{game_id}".encode()).decode()
+
+def _decode_cursor(cursor: str, raw: bool):
+    try:
+        created_at, game_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return (created_at if raw else datetime.fromisoformat(created_at)), int(game_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/users/{user_id}/history", response_model=schemas.GameSummaryPage)
+async def get_user_history(user_id: int, limit: int = 20, cursor: Optional[str] = None, db: AsyncSession = Depends(database.get_read_db)):
+    # Games where user was white or black, newest first, without moves
+    # (fetch those per game from /games/{id}/history).
+    # One keyset branch per player column so each walks its own index,
+    # then the two pages are merged.
+    limit = max(1, min(limit, 100))
+    key = _history_key(db)
+    after = _decode_cursor(cursor, key is not models.Game.created_at) if cursor else None
+    columns = (
+        models.Game.id, models.Game.white_player_id, models.Game.black_player_id,
+        models.Game.status, models.Game.result, models.Game.winner_id, models.Game.created_at,
+        key.label("sort_key"),
     )
-    return result.scalars().all()
-
-@app.get("/users/{user_id}/history", response_model=List[schemas.GameOut])
-async def get_user_history(user_id: int, db: AsyncSession = Depends(database.get_db)):
-    # Returns games where user was white or black
-    # Note: Complex OR query in async sqlalchemy
-    from sqlalchemy import or_
-    from sqlalchemy.orm import selectinload
+
+    def branch(player_column):
+        query = select(*columns).filter(player_column == user_id)
+        if after:
+            query = query.filter(tuple_(key, models.Game.id) < tuple_(*after))
+        query = query.order_by(key.desc(), models.Game.id.desc()).limit(limit + 1)
+        return select(query.subquery())
+
+    merged = union_all(branch(models.Game.white_player_id), branch(models.Game.black_player_id)).subquery()
     result = await db.execute(
-        select(models.Game)
-        .filter(or_(models.Game.white_player_id == user_id, models.Game.black_player_id == user_id))
-        .options(selectinload(models.Game.moves))
-        .order_by(models.Game.created_at.desc())
+        select(merged).order_by(merged.c.sort_key.desc(), merged.c.id.desc()).limit(limit + 1)
     )
-    return result.scalars().all()
+    rows = result.mappings().all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1]["sort_key"], rows[-1]["id"])
+    return {"items": rows, "next_cursor": next_cursor}
+
+def _pool_gauges() -> list:
+    engines = {"primary": database.engine}
+    if database.read_engine is not database.engine:
+        engines["replica"] = database.read_engine
+    values = []
+    for name, engine in engines.items():
+        pool = engine.sync_engine.pool
+        # Only QueuePool keeps counts; in-memory SQLite has a single static connection
+        if hasattr(pool, "checkedout"):
+            values.append(({"engine": name}, pool.checkedout()))
+    return values
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Per worker: with several uvicorn workers each scrape sees one of them
+    return metrics.render({
+        "ws_connections": ("Open WebSocket connections by channel kind.", [({"kind": kind}, count) for kind, count in games.manager.connection_counts().items()]),
+        "db_pool_checked_out": ("Database connections in use.", _pool_gauges()),
+        "live_games": ("Active games held in memory.", [({}, len(registry))]),
+        "move_journal_pending": ("Moves acknowledged but not yet written to the database.", [({}, games.journal.stats()["pending"] if games.journal is not None else 0)]),
+        "analysis_queued": ("Finished games waiting in the analysis queue.", [({}, analysis_queue.stats()["queued"])]),
+    })
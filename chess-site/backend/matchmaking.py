@@ -0,0 +1,241 @@
+import asyncio
+import bisect
+import logging
+import random
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from sqlalchemy import update
+import database, models
+from config import settings
+from live_games import registry
+
+logger = logging.getLogger(__name__)
+
+
+class Ticket:
+    __slots__ = ("user_id", "rating", "enqueued_at", "last_seen", "future")
+
+    def __init__(self, user_id: int, rating: int, now: float, future: Optional[asyncio.Future] = None):
+        self.user_id = user_id
+        self.rating = rating
+        self.enqueued_at = now
+        self.last_seen = now
+        # Resolves to the game id once paired, or None if the ticket was withdrawn
+        self.future = future
+
+
+class MatchQueue:
+    """
+    Waiting players in rating buckets of bucket_width points, FIFO inside a
+    bucket. A sorted list of occupied buckets finds the nearest ones with
+    bisect, so a search costs O(log B) plus the few buckets inside the
+    player's window. The window starts at base_window points and widens by
+    window_growth points per second waited, up to max_window.
+    """
+
+    def __init__(self, bucket_width: int, base_window: int, window_growth: float, max_window: int):
+        self.bucket_width = bucket_width
+        self.base_window = base_window
+        self.window_growth = window_growth
+        self.max_window = max_window
+        self._buckets: dict[int, "OrderedDict[int, Ticket]"] = {}
+        self._occupied: List[int] = []
+        # All waiting tickets, oldest first
+        self._tickets: "OrderedDict[int, Ticket]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._tickets)
+
+    def __contains__(self, user_id: int):
+        return user_id in self._tickets
+
+    def get(self, user_id: int) -> Optional[Ticket]:
+        return self._tickets.get(user_id)
+
+    def window(self, ticket: Ticket, now: float) -> int:
+        waited = max(0.0, now - ticket.enqueued_at)
+        return min(self.max_window, int(self.base_window + self.window_growth * waited))
+
+    def _bucket(self, rating: int) -> int:
+        return rating // self.bucket_width
+
+    def _insert(self, ticket: Ticket):
+        bucket = self._bucket(ticket.rating)
+        tickets = self._buckets.get(bucket)
+        if tickets is None:
+            tickets = self._buckets[bucket] = OrderedDict()
+            bisect.insort(self._occupied, bucket)
+        tickets[ticket.user_id] = ticket
+        self._tickets[ticket.user_id] = ticket
+
+    def remove(self, user_id: int) -> Optional[Ticket]:
+        ticket = self._tickets.pop(user_id, None)
+        if ticket is None:
+            return None
+        bucket = self._bucket(ticket.rating)
+        tickets = self._buckets[bucket]
+        del tickets[user_id]
+        if not tickets:
+            del self._buckets[bucket]
+            del self._occupied[bisect.bisect_left(self._occupied, bucket)]
+        return ticket
+
+    def _nearest(self, ticket: Ticket, window: int) -> Optional[Ticket]:
+        # Walk occupied buckets outwards from the player's own; in the first
+        # bucket holding someone within the window, take whoever waited longest
+        own = self._bucket(ticket.rating)
+        lowest = self._bucket(ticket.rating - window)
+        highest = self._bucket(ticket.rating + window)
+        right = bisect.bisect_left(self._occupied, own)
+        left = right - 1
+        while True:
+            below = self._occupied[left] if left >= 0 and self._occupied[left] >= lowest else None
+            above = self._occupied[right] if right < len(self._occupied) and self._occupied[right] <= highest else None
+            if below is None and above is None:
+                return None
+            if above is not None and (below is None or above - own <= own - below):
+                bucket = above
+                right += 1
+            else:
+                bucket = below
+                left -= 1
+            for candidate in self._buckets[bucket].values():
+                if candidate.user_id != ticket.user_id and abs(candidate.rating - ticket.rating) <= window:
+                    return candidate
+
+    def enqueue(self, ticket: Ticket, now: float) -> Optional[Ticket]:
+        """Pair the ticket right away if someone fits its window; otherwise queue it."""
+        opponent = self._nearest(ticket, self.window(ticket, now))
+        if opponent is not None:
+            self.remove(opponent.user_id)
+            return opponent
+        self._insert(ticket)
+        return None
+
+    def sweep(self, now: float) -> List[Tuple[Ticket, Ticket]]:
+        """Retry the queue with the widened windows, longest waiting first."""
+        pairs = []
+        for ticket in list(self._tickets.values()):
+            if ticket.user_id not in self._tickets:
+                continue
+            opponent = self._nearest(ticket, self.window(ticket, now))
+            if opponent is not None:
+                self.remove(ticket.user_id)
+                self.remove(opponent.user_id)
+                pairs.append((ticket, opponent))
+        return pairs
+
+    def expire(self, before: float) -> List[Ticket]:
+        """Drop tickets whose owner stopped polling before the given time."""
+        stale = [ticket for ticket in self._tickets.values() if ticket.last_seen < before]
+        for ticket in stale:
+            self.remove(ticket.user_id)
+        return stale
+
+
+class Matchmaker:
+    """
+    Queue front end for the HTTP API. Clients long-poll join(): it returns
+    the game id once paired, or None when the wait times out and they
+    should poll again. Games are created with both players seated.
+    """
+
+    def __init__(self, queue: MatchQueue, wait_seconds: float):
+        self.queue = queue
+        self.wait_seconds = wait_seconds
+        # Queued or paired-but-not-yet-collected tickets by user
+        self._tickets: dict[int, Ticket] = {}
+        self.games_created = 0
+
+    async def join(self, user_id: int, rating: int) -> Optional[int]:
+        now = time.monotonic()
+        ticket = self._tickets.get(user_id)
+        if ticket is None:
+            ticket = Ticket(user_id, rating, now, asyncio.get_running_loop().create_future())
+            self._tickets[user_id] = ticket
+            opponent = self.queue.enqueue(ticket, now)
+            if opponent is not None:
+                try:
+                    await self._start(ticket, opponent)
+                except Exception:
+                    self._tickets.pop(user_id, None)
+                    raise
+        ticket.last_seen = now
+
+        try:
+            game_id = await asyncio.wait_for(asyncio.shield(ticket.future), self.wait_seconds)
+        except asyncio.TimeoutError:
+            return None
+        except Exception:
+            self._tickets.pop(user_id, None)
+            raise
+        if self._tickets.get(user_id) is ticket:
+            del self._tickets[user_id]
+        return game_id
+
+    def leave(self, user_id: int) -> bool:
+        """False if the user was already paired (the game exists)."""
+        ticket = self._tickets.get(user_id)
+        if ticket is None:
+            return True
+        if ticket.future.done():
+            return False
+        self.queue.remove(user_id)
+        del self._tickets[user_id]
+        ticket.future.set_result(None)
+        return True
+
+    def waiting(self, user_id: int) -> Optional[Ticket]:
+        return self.queue.get(user_id)
+
+    async def _start(self, first: Ticket, second: Ticket):
+        white, black = (first, second) if random.random() < 0.5 else (second, first)
+        try:
+            async with database.SessionLocal() as db:
+                game = models.Game(white_player_id=white.user_id, black_player_id=black.user_id, status="active")
+                db.add(game)
+                await db.execute(
+                    update(models.User)
+                    .where(models.User.id.in_([white.user_id, black.user_id]))
+                    .values(games_played=models.User.games_played + 1)
+                )
+                await db.commit()
+                registry.add(game)
+        except Exception as exc:
+            for ticket in (first, second):
+                if not ticket.future.done():
+                    ticket.future.set_exception(exc)
+            raise
+        self.games_created += 1
+        for ticket in (first, second):
+            if not ticket.future.done():
+                ticket.future.set_result(game.id)
+
+    async def run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for ticket in self.queue.expire(now - 2 * self.wait_seconds):
+                self._tickets.pop(ticket.user_id, None)
+                ticket.future.set_result(None)
+            # Paired tickets nobody came back for
+            for user_id, ticket in list(self._tickets.items()):
+                if ticket.future.done() and ticket.last_seen < now - 2 * self.wait_seconds:
+                    del self._tickets[user_id]
+            for first, second in self.queue.sweep(now):
+                try:
+                    await self._start(first, second)
+                except Exception:
+                    logger.exception("matchmaking: could not create game for %d and %d", first.user_id, second.user_id)
+
+
+matchmaker = Matchmaker(
+    MatchQueue(
+        settings.MATCHMAKING_BUCKET_WIDTH,
+        settings.MATCHMAKING_BASE_WINDOW,
+        settings.MATCHMAKING_WINDOW_GROWTH,
+        settings.MATCHMAKING_MAX_WINDOW,
+    ),
+    settings.MATCHMAKING_WAIT_SECONDS,
+)
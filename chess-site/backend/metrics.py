@@ -0,0 +1,249 @@
+import contextvars
+import logging
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import event
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 50)
+FANOUT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        # One count per bucket plus +Inf; made cumulative only when rendered
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestStats:
+    """Database work done on behalf of the current request."""
+
+    __slots__ = ("queries", "db_seconds", "statements")
+
+    def __init__(self, keep_statements: bool):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.statements: Optional[List[Tuple[float, str]]] = [] if keep_statements else None
+
+
+_current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+
+def _labels(**labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels.items()) + "}"
+
+
+class Metrics:
+    """
+    In-process counters and histograms: HTTP latency and queries per route,
+    every SQL statement, WebSocket connections and broadcast fan-out.
+    Everything is updated on the event loop thread (the SQLAlchemy hooks run
+    in the request's greenlet), so there is no locking.
+    """
+
+    def __init__(self, slow_request_ms: float):
+        self.slow_request_ms = slow_request_ms
+        self.started = time.time()
+        # (method, route) -> latency histogram, queries-per-request histogram, db seconds
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.queries: Dict[Tuple[str, str], Histogram] = {}
+        self.db_seconds: Dict[Tuple[str, str], float] = {}
+        self.responses: Dict[Tuple[str, str, int], int] = {}
+        self.in_flight = 0
+        self.slow_requests = 0
+        self.statements = 0
+        self.statement_seconds = 0.0
+        self.ws_connects: Dict[str, int] = {}
+        self.ws_disconnects: Dict[str, int] = {}
+        self.ws_dropped = 0
+        self.ws_messages = 0
+        self.ws_send_errors = 0
+        self.broadcasts = 0
+        self.fanout = Histogram(FANOUT_BUCKETS)
+
+    # SQL
+
+    def instrument_engine(self, engine):
+        @event.listens_for(engine.sync_engine, "before_cursor_execute")
+        def before(conn, cursor, statement, parameters, context, executemany):
+            context._metrics_started = time.perf_counter()
+
+        @event.listens_for(engine.sync_engine, "after_cursor_execute")
+        def after(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - context._metrics_started
+            self.statements += 1
+            self.statement_seconds += elapsed
+            stats = _current.get()
+            if stats is not None:
+                stats.queries += 1
+                stats.db_seconds += elapsed
+                if stats.statements is not None:
+                    stats.statements.append((elapsed, statement))
+
+    # HTTP
+
+    def start_request(self) -> contextvars.Token:
+        self.in_flight += 1
+        return _current.set(RequestStats(self.slow_request_ms > 0))
+
+    def finish_request(self, token: contextvars.Token, method: str, route: str, status_code: int, elapsed: float):
+        stats = _current.get()
+        _current.reset(token)
+        self.in_flight -= 1
+        key = (method, route)
+        latency = self.latency.get(key)
+        if latency is None:
+            latency = self.latency[key] = Histogram(LATENCY_BUCKETS)
+            self.queries[key] = Histogram(QUERY_BUCKETS)
+            self.db_seconds[key] = 0.0
+        latency.observe(elapsed)
+        self.queries[key].observe(stats.queries)
+        self.db_seconds[key] += stats.db_seconds
+        response_key = (method, route, status_code)
+        self.responses[response_key] = self.responses.get(response_key, 0) + 1
+        if self.slow_request_ms > 0 and elapsed * 1000 >= self.slow_request_ms:
+            self.slow_requests += 1
+            self._log_slow(method, route, status_code, elapsed, stats)
+
+    def _log_slow(self, method: str, route: str, status_code: int, elapsed: float, stats: RequestStats):
+        breakdown = "".join(
+            f"\n  {seconds * 1000:8.2f} ms  {' '.join(statement.split())[:200]}"
+            for seconds, statement in stats.statements
+        )
+        logger.warning(
+            "slow request %s %s -> %d: %.1f ms, %d queries, %.1f ms in the database%s",
+            method, route, status_code, elapsed * 1000, stats.queries, stats.db_seconds * 1000, breakdown,
+        )
+
+    # WebSockets
+
+    def ws_connected(self, kind: str):
+        self.ws_connects[kind] = self.ws_connects.get(kind, 0) + 1
+
+    def ws_disconnected(self, kind: str):
+        self.ws_disconnects[kind] = self.ws_disconnects.get(kind, 0) + 1
+
+    def broadcast(self, recipients: int, elapsed: float):
+        self.broadcasts += 1
+        self.ws_messages += recipients
+        self.fanout.observe(elapsed)
+
+    # Exposition
+
+    def render(self, gauges: Dict[str, Tuple[str, List[Tuple[dict, float]]]]) -> str:
+        """
+        Prometheus text format. gauges maps a metric name to its help text and
+        (labels, value) pairs, read from the live objects by the caller.
+        """
+        lines: List[str] = []
+
+        def header(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        def histogram(name: str, value: Histogram, **labels):
+            cumulative = 0
+            for bound, count in zip(value.buckets, value.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {value.count}")
+            lines.append(f"{name}_sum{_labels(**labels)} {value.sum}")
+            lines.append(f"{name}_count{_labels(**labels)} {value.count}")
+
+        header("http_request_duration_seconds", "histogram", "HTTP request latency by route.")
+        for (method, route), value in self.latency.items():
+            histogram("http_request_duration_seconds", value, method=method, route=route)
+        header("http_request_queries", "histogram", "SQL statements issued per HTTP request by route.")
+        for (method, route), value in self.queries.items():
+            histogram("http_request_queries", value, method=method, route=route)
+        header("http_request_db_seconds_total", "counter", "Time spent in SQL statements by route.")
+        for (method, route), value in self.db_seconds.items():
+            lines.append(f"http_request_db_seconds_total{_labels(method=method, route=route)} {value}")
+        header("http_responses_total", "counter", "HTTP responses by route and status code.")
+        for (method, route, status_code), value in self.responses.items():
+            lines.append(f"http_responses_total{_labels(method=method, route=route, status=status_code)} {value}")
+        header("http_requests_in_flight", "gauge", "HTTP requests being handled.")
+        lines.append(f"http_requests_in_flight {self.in_flight}")
+        header("http_slow_requests_total", "counter", "Requests slower than METRICS_SLOW_REQUEST_MS.")
+        lines.append(f"http_slow_requests_total {self.slow_requests}")
+
+        header("db_statements_total", "counter", "SQL statements executed, including outside HTTP requests.")
+        lines.append(f"db_statements_total {self.statements}")
+        header("db_statement_seconds_total", "counter", "Time spent in SQL statements.")
+        lines.append(f"db_statement_seconds_total {self.statement_seconds}")
+
+        header("ws_connects_total", "counter", "WebSocket connections accepted by channel kind.")
+        for kind, value in self.ws_connects.items():
+            lines.append(f"ws_connects_total{_labels(kind=kind)} {value}")
+        header("ws_disconnects_total", "counter", "WebSocket connections closed by channel kind.")
+        for kind, value in self.ws_disconnects.items():
+            lines.append(f"ws_disconnects_total{_labels(kind=kind)} {value}")
+        header("ws_dropped_total", "counter", "Slow consumers disconnected because their send queue was full.")
+        lines.append(f"ws_dropped_total {self.ws_dropped}")
+        header("ws_send_errors_total", "counter", "WebSocket sends that failed.")
+        lines.append(f"ws_send_errors_total {self.ws_send_errors}")
+        header("ws_broadcasts_total", "counter", "Messages fanned out to this worker's sockets.")
+        lines.append(f"ws_broadcasts_total {self.broadcasts}")
+        header("ws_messages_total", "counter", "Messages queued to sockets by broadcasts.")
+        lines.append(f"ws_messages_total {self.ws_messages}")
+        header("ws_broadcast_fanout_seconds", "histogram", "Time to queue one broadcast to every socket on its channel.")
+        histogram("ws_broadcast_fanout_seconds", self.fanout)
+
+        for name, (help_text, values) in gauges.items():
+            header(name, "gauge", help_text)
+            for labels, value in values:
+                lines.append(f"{name}{_labels(**labels)} {value}")
+        header("process_uptime_seconds", "gauge", "Seconds since this worker started.")
+        lines.append(f"process_uptime_seconds {time.time() - self.started}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Times every HTTP request and attributes its SQL statements to the matched route."""
+
+    def __init__(self, app, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        token = self.metrics.start_request()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            # Route templates only: raw paths would make a series per game id
+            self.metrics.finish_request(
+                token, scope["method"], route.path if route is not None else "unmatched",
+                status_code, time.perf_counter() - started,
+            )
+
+
+metrics = Metrics(settings.METRICS_SLOW_REQUEST_MS)
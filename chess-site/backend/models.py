@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean
+from sqlalchemy import BigInteger, Column, Integer, String, DateTime, ForeignKey, Boolean, Index, JSON, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -10,17 +10,16 @@ class User(Base):
     email = Column(String(255), unique=True, index=True, nullable=False)
     username = Column(String(50), unique=True, index=True, nullable=False)
     hashed_password = Column(String(255), nullable=False)
-    rating = Column(Integer, default=1200)
+    rating = Column(Integer, default=1200, index=True)
+    # Denormalized count of games the user is seated in, maintained by
+    # create_game/join_game so profiles never load the games themselves
+    games_played = Column(Integer, default=0, server_default="0", nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     last_active = Column(DateTime(timezone=True), onupdate=func.now())
 
     games_white = relationship("Game", back_populates="white_player", foreign_keys="Game.white_player_id")
     games_black = relationship("Game", back_populates="black_player", foreign_keys="Game.black_player_id")
 
-    @property
-    def games_played(self):
-        return len(self.games_white) + len(self.games_black)
-
 class Game(Base):
     __tablename__ = "games"
 
@@ -29,12 +28,30 @@ class Game(Base):
     black_player_id = Column(Integer, ForeignKey("users.id"), nullable=True) # Nullable if waiting for opponent
     fen = Column(String, default="rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1")
     pgn = Column(String, default="")
+    # 16-bit code per ply (see move_codec); NULL for games not yet converted
+    moves_packed = Column(LargeBinary, default=b"", nullable=True)
     status = Column(String(20), default="waiting") # waiting, active, finished
     result = Column(String(10), nullable=True) # 1-0, 0-1, 1/2-1/2
     winner_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    # Time control in seconds plus increment per move; NULL for untimed games.
+    # Remaining times are as of last_move_at, when the side to move's clock started.
+    time_control = Column(Integer, nullable=True)
+    increment = Column(Integer, default=0, server_default="0", nullable=False)
+    white_time_ms = Column(Integer, nullable=True)
+    black_time_ms = Column(Integer, nullable=True)
+    last_move_at = Column(DateTime(timezone=True), nullable=True)
+    # When the result was decided; rating replays go through games in this order
+    finished_at = Column(DateTime(timezone=True), nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # Per-player history, newest first, paged by (created_at, id); listings by status
+    __table_args__ = (
+        Index("ix_games_white_player_created", "white_player_id", "created_at", "id"),
+        Index("ix_games_black_player_created", "black_player_id", "created_at", "id"),
+        Index("ix_games_status_created", "status", "created_at", "id"),
+    )
+
     white_player = relationship("User", foreign_keys=[white_player_id], back_populates="games_white")
     black_player = relationship("User", foreign_keys=[black_player_id], back_populates="games_black")
     moves = relationship("Move", back_populates="game")
@@ -43,10 +60,67 @@ class Move(Base):
     __tablename__ = "moves"
 
     id = Column(Integer, primary_key=True, index=True)
-    game_id = Column(Integer, ForeignKey("games.id"))
+    game_id = Column(Integer, ForeignKey("games.id"), index=True)
     player_id = Column(Integer, ForeignKey("users.id"))
     move_san = Column(String(10), nullable=False)
-    fen_after = Column(String, nullable=False)
+    ply = Column(Integer, nullable=True) # 1-based index into Game.moves_packed
+    # Only set on rows written before moves were packed; rebuilt on demand otherwise
+    fen_after = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     game = relationship("Game", back_populates="moves")
+
+class ArchivedMove(Base):
+    # Rows moved out of `moves` by `admin_maintenance.py purge-moves --archive`
+    __tablename__ = "moves_archive"
+
+    id = Column(Integer, primary_key=True)
+    game_id = Column(Integer, index=True)
+    player_id = Column(Integer)
+    move_san = Column(String(10), nullable=False)
+    ply = Column(Integer, nullable=True)
+    fen_after = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True))
+
+class GamePosition(Base):
+    # Position after each ply, by polyglot Zobrist key (see explorer.py)
+    __tablename__ = "game_positions"
+
+    game_id = Column(Integer, ForeignKey("games.id"), primary_key=True)
+    ply = Column(Integer, primary_key=True)
+    position_key = Column(BigInteger, nullable=False)
+
+    __table_args__ = (
+        Index("ix_game_positions_key_game", "position_key", "game_id"),
+    )
+
+class PositionMove(Base):
+    # Finished games that played `move` (move_codec code) in this position, by result
+    __tablename__ = "position_moves"
+
+    position_key = Column(BigInteger, primary_key=True)
+    move = Column(Integer, primary_key=True)
+    games = Column(Integer, default=0, nullable=False)
+    white = Column(Integer, default=0, nullable=False)
+    draws = Column(Integer, default=0, nullable=False)
+    black = Column(Integer, default=0, nullable=False)
+
+class GameAnalysis(Base):
+    # Post-game analysis job and its result, one per finished game (see analysis_queue.py)
+    __tablename__ = "game_analysis"
+
+    game_id = Column(Integer, ForeignKey("games.id"), primary_key=True)
+    status = Column(String(20), default="pending", nullable=False) # pending, running, done, failed
+    attempts = Column(Integer, default=0, nullable=False)
+    # Not picked up again before this (retry backoff)
+    available_at = Column(DateTime(timezone=True), server_default=func.now())
+    evaluator = Column(String(100), nullable=True)
+    annotations = Column(JSON, nullable=True)
+    error = Column(String(500), nullable=True)
+    duration_ms = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        Index("ix_game_analysis_status_available", "status", "available_at"),
+    )
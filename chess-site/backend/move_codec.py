@@ -0,0 +1,93 @@
+from collections import OrderedDict
+from typing import Iterable, List, Tuple
+import chess
+
+from config import settings
+
+# One move = 16 bits, big-endian: from square (6) | to square (6) << 6 | promotion (3) << 12.
+# Promotion is the piece type minus one (knight=1 .. queen=4), 0 for none.
+MOVE_SIZE = 2
+
+
+def encode_move(move: chess.Move) -> int:
+    promotion = move.promotion - 1 if move.promotion else 0
+    return move.from_square | (move.to_square << 6) | (promotion << 12)
+
+
+def decode_move(code: int) -> chess.Move:
+    promotion = (code >> 12) & 0x7
+    return chess.Move(code & 0x3F, (code >> 6) & 0x3F, promotion + 1 if promotion else None)
+
+
+def pack_moves(moves: Iterable[chess.Move]) -> bytes:
+    return b"".join(encode_move(move).to_bytes(MOVE_SIZE, "big") for move in moves)
+
+
+def append_move(packed: bytes, move: chess.Move) -> bytes:
+    return packed + encode_move(move).to_bytes(MOVE_SIZE, "big")
+
+
+def unpack_moves(packed: bytes) -> List[chess.Move]:
+    return [decode_move(int.from_bytes(packed[i:i + MOVE_SIZE], "big")) for i in range(0, len(packed), MOVE_SIZE)]
+
+
+def ply_count(packed: bytes) -> int:
+    return len(packed) // MOVE_SIZE
+
+
+def replay(packed: bytes) -> Tuple[chess.Board, List[str]]:
+    """Board after all packed moves, plus the SAN of each move."""
+    board = chess.Board()
+    sans = []
+    for move in unpack_moves(packed):
+        sans.append(board.san(move))
+        board.push(move)
+    return board, sans
+
+
+class PositionCache:
+    """
+    LRU of rebuilt FEN lists keyed by the packed move string itself, so
+    entries never go stale. A game that gained a move since its last lookup
+    is extended from the cached prefix instead of replayed from the start.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[bytes, Tuple[str, ...]]" = OrderedDict()
+
+    def _put(self, packed: bytes, fens: Tuple[str, ...]):
+        self._entries[packed] = fens
+        self._entries.move_to_end(packed)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def fens(self, packed: bytes) -> Tuple[str, ...]:
+        """FEN after each ply: fens(packed)[i] is the position after move i + 1."""
+        fens = self._entries.get(packed)
+        if fens is not None:
+            self._entries.move_to_end(packed)
+            return fens
+
+        prefix = self._entries.get(packed[:-MOVE_SIZE]) if packed else None
+        if prefix is not None:
+            board = chess.Board(prefix[-1]) if prefix else chess.Board()
+            board.push(decode_move(int.from_bytes(packed[-MOVE_SIZE:], "big")))
+            fens = prefix + (board.fen(),)
+        else:
+            board = chess.Board()
+            rebuilt = []
+            for move in unpack_moves(packed):
+                board.push(move)
+                rebuilt.append(board.fen())
+            fens = tuple(rebuilt)
+        self._put(packed, fens)
+        return fens
+
+    def fen_after(self, packed: bytes, ply: int) -> str:
+        if ply == 0:
+            return chess.STARTING_FEN
+        return self.fens(packed)[ply - 1]
+
+
+positions = PositionCache(settings.POSITION_CACHE_SIZE)
@@ -0,0 +1,187 @@
+import asyncio
+import glob
+import json
+import logging
+import os
+import time
+from typing import Awaitable, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MoveJournal:
+    """
+    Write-behind log of moves accepted in memory but not yet in the database.
+    A move is acknowledged once its record is appended to the current segment
+    file (and fsynced, together with whatever else was appended meanwhile,
+    when fsync is on). Records go to the database in batches, at most
+    max_delay after the first one or as soon as max_batch are waiting; a
+    segment file is deleted once all its records are committed, so segments
+    found on startup hold exactly the moves a crash kept out of the database.
+    write_batch returns the records it could not apply (the game moved on
+    elsewhere); those get their on_dropped callback instead of the commit one.
+    """
+
+    def __init__(self, directory: str, max_delay: float, max_batch: int, fsync: bool):
+        self.directory = directory
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.fsync = fsync
+        self._write_batch: Optional[Callable[[List[dict]], Awaitable[List[dict]]]] = None
+        self._path: Optional[str] = None
+        self._file = None
+        self._segments = 0
+        # (record, callback run after the commit, callback run if dropped) appended to the current segment
+        self._pending: list = []
+        # Swapped-out segments whose records are not committed yet: (path, file, entries)
+        self._closed: list = []
+        self._lock: Optional[asyncio.Lock] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._sync_waiters: list = []
+        self._syncer: Optional[asyncio.Task] = None
+        self._tasks: set = set()
+        self.flushes = 0
+        self.flushed = 0
+        self.dropped = 0
+
+    def _segment_files(self) -> List[str]:
+        return sorted(glob.glob(os.path.join(self.directory, "moves-*.log")))
+
+    def _open_segment(self):
+        self._segments += 1
+        # Names sort in creation order, across restarts too
+        self._path = os.path.join(self.directory, f"moves-{time.time_ns():020d}-{os.getpid()}-{self._segments}.log")
+        self._file = open(self._path, "ab")
+
+    async def replay(self, write_batch: Callable[[List[dict]], Awaitable[List[dict]]]) -> int:
+        """Write the records of segments left by a previous run, oldest first; call before start()."""
+        replayed = 0
+        for path in self._segment_files():
+            records = []
+            with open(path, "rb") as file:
+                for line in file:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # Torn last line of a crash mid-append: that move was never acknowledged
+                        logger.warning("move journal %s: skipping unreadable record", path)
+            if records:
+                await write_batch(records)
+            os.remove(path)
+            replayed += len(records)
+        if replayed:
+            logger.warning("move journal: replayed %d moves", replayed)
+        return replayed
+
+    def start(self, write_batch: Callable[[List[dict]], Awaitable[List[dict]]]):
+        os.makedirs(self.directory, exist_ok=True)
+        self._write_batch = write_batch
+        self._lock = asyncio.Lock()
+        self._open_segment()
+
+    async def stop(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("move journal: final flush failed, moves stay in %s", self.directory)
+        if self._file is not None:
+            self._file.close()
+            if not self._pending and os.path.getsize(self._path) == 0:
+                os.remove(self._path)
+            self._file = None
+
+    async def append(
+        self,
+        record: dict,
+        callback: Optional[Callable[[], Awaitable[None]]] = None,
+        on_dropped: Optional[Callable[[], Awaitable[None]]] = None,
+    ):
+        """Log one move; returns once it would survive a crash of this process (of the host, with fsync)."""
+        self._file.write(json.dumps(record, separators=(",", ":")).encode() + b"\n")
+        self._file.flush()
+        self._pending.append((record, callback, on_dropped))
+        if len(self._pending) >= self.max_batch:
+            self._flush_soon()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_delay, self._flush_soon)
+        if self.fsync:
+            future = asyncio.get_running_loop().create_future()
+            self._sync_waiters.append((self._file, future))
+            if self._syncer is None or self._syncer.done():
+                self._syncer = asyncio.create_task(self._sync())
+            await future
+
+    async def _sync(self):
+        # One fsync per segment covers every append made while the previous one ran
+        while self._sync_waiters:
+            waiters, self._sync_waiters = self._sync_waiters, []
+            for file in {file for file, _ in waiters}:
+                error = None
+                if not file.closed:
+                    # Own descriptor: a flush may close the segment meanwhile
+                    fd = os.dup(file.fileno())
+                    try:
+                        await asyncio.to_thread(os.fsync, fd)
+                    except OSError as exc:
+                        error = exc
+                    finally:
+                        os.close(fd)
+                # A closed segment was committed to the database already
+                for waiter in (waiter for waiter_file, waiter in waiters if waiter_file is file):
+                    if error is None:
+                        waiter.set_result(None)
+                    else:
+                        waiter.set_exception(error)
+
+    def _flush_soon(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        task = asyncio.create_task(self._flush_logged())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _flush_logged(self):
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("move journal: flush failed, retrying")
+            if self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(max(self.max_delay, 1.0), self._flush_soon)
+
+    async def flush(self):
+        """Commit every record appended so far."""
+        async with self._lock:
+            if self._pending:
+                self._closed.append((self._path, self._file, self._pending))
+                self._pending = []
+                self._open_segment()
+            while self._closed:
+                path, file, entries = self._closed[0]
+                dropped = await self._write_batch([record for record, _, _ in entries])
+                self._closed.pop(0)
+                file.close()
+                os.remove(path)
+                dropped_ids = {id(record) for record in dropped}
+                self.flushes += 1
+                self.flushed += len(entries) - len(dropped_ids)
+                self.dropped += len(dropped_ids)
+                for record, committed, on_dropped in entries:
+                    callback = on_dropped if id(record) in dropped_ids else committed
+                    if callback is not None:
+                        try:
+                            await callback()
+                        except Exception:
+                            logger.exception("move journal: post-flush callback failed")
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending) + sum(len(entries) for _, _, entries in self._closed),
+            "flushes": self.flushes,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "moves_per_flush": round(self.flushed / self.flushes, 1) if self.flushes else 0.0,
+        }
@@ -0,0 +1,101 @@
+from typing import AsyncIterator, Optional
+import chess
+import chess.pgn
+from sqlalchemy import and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+from sqlalchemy.orm import aliased
+import models
+from live_games import parse_move
+
+PGN_MEDIA_TYPE = "application/x-chess-pgn"
+
+
+def build_pgn(game: models.Game, sans: list, white_name: Optional[str], black_name: Optional[str]) -> str:
+    pgn_game = chess.pgn.Game()
+    pgn_game.headers["Event"] = "CFUV Chess"
+    pgn_game.headers["Site"] = "CFUV Chess"
+    if game.created_at is not None:
+        pgn_game.headers["Date"] = game.created_at.strftime("%Y.%m.%d")
+    pgn_game.headers["Round"] = "-"
+    pgn_game.headers["White"] = white_name or "?"
+    pgn_game.headers["Black"] = black_name or "?"
+    pgn_game.headers["Result"] = game.result or "*"
+    pgn_game.headers["GameId"] = str(game.id)
+
+    board = chess.Board()
+    node = pgn_game
+    for san in sans:
+        try:
+            move = parse_move(board, san)
+        except ValueError:
+            # Corrupt move log: export what replays cleanly
+            break
+        board.push(move)
+        node = node.add_variation(move)
+
+    exporter = chess.pgn.StringExporter(headers=True, variations=False, comments=False)
+    return pgn_game.accept(exporter)
+
+
+async def game_pgn(db: AsyncSession, game_id: int) -> Optional[str]:
+    """PGN of one game; finished games get it stored so later exports are a plain read."""
+    game = await db.get(models.Game, game_id)
+    if game is None:
+        return None
+    if game.status == "finished" and game.pgn:
+        return game.pgn
+
+    result = await db.execute(
+        select(models.Move.move_san).filter(models.Move.game_id == game_id).order_by(models.Move.id)
+    )
+    sans = result.scalars().all()
+    white = await db.get(models.User, game.white_player_id) if game.white_player_id else None
+    black = await db.get(models.User, game.black_player_id) if game.black_player_id else None
+    pgn = build_pgn(game, sans, white and white.username, black and black.username)
+    if game.status == "finished":
+        game.pgn = pgn
+        await db.commit()
+    return pgn
+
+
+async def stream_user_pgn(db: AsyncSession, user_id: int, batch_size: int = 500) -> AsyncIterator[str]:
+    """
+    Every game of a user as one PGN file, read through a single server-side
+    cursor. Games with a stored PGN contribute one row; the rest are joined
+    to their moves and rebuilt as the rows for each game go by, so memory
+    stays constant regardless of the number of games.
+    """
+    white = aliased(models.User)
+    black = aliased(models.User)
+    stmt = (
+        select(
+            models.Game.id, models.Game.pgn, models.Game.result, models.Game.created_at,
+            white.username, black.username, models.Move.move_san,
+        )
+        .outerjoin(white, white.id == models.Game.white_player_id)
+        .outerjoin(black, black.id == models.Game.black_player_id)
+        .outerjoin(models.Move, and_(models.Move.game_id == models.Game.id, or_(models.Game.pgn.is_(None), models.Game.pgn == "")))
+        .filter(or_(models.Game.white_player_id == user_id, models.Game.black_player_id == user_id))
+        .order_by(models.Game.id, models.Move.id)
+        .execution_options(yield_per=batch_size)
+    )
+    result = await db.stream(stmt)
+
+    current = None
+    sans: list = []
+    async for row in result:
+        if current is not None and row.id != current.id:
+            yield _render(current, sans)
+            sans = []
+        current = row
+        if row.move_san is not None:
+            sans.append(row.move_san)
+    if current is not None:
+        yield _render(current, sans)
+
+
+def _render(row, sans: list) -> str:
+    # Rows carry the game columns build_pgn reads (id, result, created_at)
+    text = row.pgn or build_pgn(row, sans, row[4], row[5])
+    return text.rstrip("\n") + "\n\n"
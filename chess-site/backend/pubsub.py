@@ -0,0 +1,146 @@
+import abc
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Callable, List
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[str, str], None]
+
+
+class PubSubBackend(abc.ABC):
+    """
+    Delivers (channel, message) pairs to every subscribed handler in every
+    worker process. Handlers are plain callables and must not block.
+    """
+
+    def __init__(self):
+        self._handlers: List[Handler] = []
+
+    def subscribe(self, handler: Handler):
+        self._handlers.append(handler)
+
+    def _dispatch(self, channel: str, message: str):
+        for handler in self._handlers:
+            try:
+                handler(channel, message)
+            except Exception:
+                logger.exception("pubsub handler failed for channel %s", channel)
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    @abc.abstractmethod
+    async def publish(self, channel: str, message: str):
+        ...
+
+
+class InProcessPubSub(PubSubBackend):
+    """Single worker: publishing is a direct call into the local handlers."""
+
+    async def publish(self, channel: str, message: str):
+        self._dispatch(channel, message)
+
+
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, backend: "LocalSocketPubSub"):
+        self.backend = backend
+
+    def datagram_received(self, data, addr):
+        try:
+            channel, message = json.loads(data)
+        except ValueError:
+            logger.warning("pubsub: dropping malformed datagram")
+            return
+        self.backend._dispatch(channel, message)
+
+
+class LocalSocketPubSub(PubSubBackend):
+    """
+    Fan-out between uvicorn workers on one host. Every worker binds a Unix
+    datagram socket in a shared directory; publish delivers locally and sends
+    one datagram to each peer socket found there.
+    """
+
+    PEER_REFRESH_SECONDS = 1.0
+
+    def __init__(self, socket_dir: str):
+        super().__init__()
+        self.socket_dir = socket_dir
+        self.path = os.path.join(socket_dir, f"{os.getpid()}-{uuid.uuid4().hex[:8]}.sock")
+        self._transport = None
+        self._sender = None
+        self._peers: List[str] = []
+        self._peers_loaded_at = 0.0
+
+    async def start(self):
+        os.makedirs(self.socket_dir, exist_ok=True)
+        loop = asyncio.get_running_loop()
+        self._transport, _ = await loop.create_datagram_endpoint(
+            lambda: _DatagramProtocol(self), local_addr=self.path, family=socket.AF_UNIX
+        )
+        self._sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sender.setblocking(False)
+
+    async def stop(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+        if self._sender is not None:
+            self._sender.close()
+            self._sender = None
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def _peer_paths(self) -> List[str]:
+        now = time.monotonic()
+        if now - self._peers_loaded_at > self.PEER_REFRESH_SECONDS:
+            self._peers = [
+                os.path.join(self.socket_dir, name)
+                for name in os.listdir(self.socket_dir)
+                if name.endswith(".sock") and os.path.join(self.socket_dir, name) != self.path
+            ]
+            self._peers_loaded_at = now
+        return self._peers
+
+    async def publish(self, channel: str, message: str):
+        self._dispatch(channel, message)
+        if self._sender is None:
+            return
+        data = json.dumps([channel, message]).encode("utf-8")
+        for path in self._peer_paths():
+            try:
+                self._sender.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Worker exited without cleaning up its socket
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+                self._peers_loaded_at = 0.0
+            except BlockingIOError:
+                logger.warning("pubsub: peer %s is not reading, message dropped", path)
+
+
+def create_backend(name: str, socket_dir: str) -> PubSubBackend:
+    if name == "memory":
+        return InProcessPubSub()
+    if name == "local":
+        return LocalSocketPubSub(socket_dir)
+    raise ValueError(f"Unknown pubsub backend: {name}")
+
+
+# Shared by every module that needs cross-worker notifications
+backend = create_backend(settings.PUBSUB_BACKEND, settings.PUBSUB_SOCKET_DIR)
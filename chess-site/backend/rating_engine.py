@@ -0,0 +1,143 @@
+"""
+Rating replays over many games at once with NumPy. Players are dense
+indices 0..n-1 into the rating arrays; games arrive in chronological chunks
+of (white, black, score) arrays, score being White's 1 / 0.5 / 0.
+"""
+import numpy as np
+
+GLICKO_SCALE = 173.7178
+
+
+def elo_rounds(white: np.ndarray, black: np.ndarray, players: int) -> np.ndarray:
+    """
+    Round of each game: one past the last round either player was in. No
+    player appears twice in a round and every game lands after that player's
+    earlier games, so updating a whole round at once gives the same ratings
+    as going game by game.
+    """
+    last = [0] * players
+    rounds = []
+    for w, b in zip(white.tolist(), black.tolist()):
+        r = max(last[w], last[b]) + 1
+        last[w] = last[b] = r
+        rounds.append(r)
+    return np.array(rounds, dtype=np.int64)
+
+
+class Elo:
+    """
+    Elo as in ratings.calculate_elo, both players updated from their ratings
+    before the game. rounding "truncate" matches the int() of the live code;
+    "none" keeps fractional ratings between games.
+    """
+
+    def __init__(self, ratings: np.ndarray, k: float = 32, rounding: str = "truncate"):
+        self.ratings = np.asarray(ratings, dtype=np.float64).copy()
+        self.k = k
+        self._round = {"truncate": np.trunc, "round": np.round, "none": None}[rounding]
+        self.games = 0
+
+    def update(self, white: np.ndarray, black: np.ndarray, score: np.ndarray):
+        if not len(white):
+            return
+        rounds = elo_rounds(white, black, len(self.ratings))
+        order = np.argsort(rounds, kind="stable")
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(rounds)[1:])))
+        for start, end in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            games = order[start:end]
+            w, b, s = white[games], black[games], score[games]
+            rw, rb = self.ratings[w], self.ratings[b]
+            new_w = rw + self.k * (s - 1 / (1 + 10 ** ((rb - rw) / 400)))
+            new_b = rb + self.k * ((1 - s) - 1 / (1 + 10 ** ((rw - rb) / 400)))
+            if self._round is not None:
+                new_w, new_b = self._round(new_w), self._round(new_b)
+            self.ratings[w] = new_w
+            self.ratings[b] = new_b
+        self.games += len(white)
+
+    def result(self) -> np.ndarray:
+        return self.ratings
+
+
+class Glicko2:
+    """
+    Glicko-2 (Glickman, 2013) for all players at once, one rating period per
+    update: every game of the period is rated against the ratings, deviations
+    and volatilities at its start. Players idle for a period only gain
+    deviation, up to max_rd.
+    """
+
+    def __init__(self, ratings: np.ndarray, rd: float = 350.0, volatility: float = 0.06, tau: float = 0.5, max_rd: float = 350.0):
+        ratings = np.asarray(ratings, dtype=np.float64)
+        self.mu = (ratings - 1500) / GLICKO_SCALE
+        self.phi = np.full(len(ratings), rd / GLICKO_SCALE)
+        self.sigma = np.full(len(ratings), volatility)
+        self.tau = tau
+        self.max_phi = max_rd / GLICKO_SCALE
+        self.games = 0
+        self.periods = 0
+
+    def _volatility(self, phi, sigma, v, delta, epsilon: float = 1e-6) -> np.ndarray:
+        # Step 5 of the paper, Illinois iterations run for all players together
+        a = np.log(sigma ** 2)
+        tau2 = self.tau ** 2
+        spread = delta ** 2 - phi ** 2 - v
+
+        def f(x):
+            ex = np.exp(x)
+            return ex * (spread - ex) / (2 * (phi ** 2 + v + ex) ** 2) - (x - a) / tau2
+
+        large = spread > 0
+        B = np.where(large, np.log(np.where(large, spread, 1.0)), a - self.tau)
+        pending = ~large & (f(B) < 0)
+        while pending.any():
+            B = np.where(pending, B - self.tau, B)
+            pending &= f(B) < 0
+        A, fA, fB = a, f(a), f(B)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for _ in range(100):
+                open_ = np.abs(B - A) > epsilon
+                if not open_.any():
+                    break
+                C = A + (A - B) * fA / (fB - fA)
+                fC = f(C)
+                crossed = fC * fB <= 0
+                A, fA = (
+                    np.where(open_ & crossed, B, A),
+                    np.where(open_, np.where(crossed, fB, fA / 2), fA),
+                )
+                B, fB = np.where(open_, C, B), np.where(open_, fC, fB)
+        return np.exp(A / 2)
+
+    def update(self, white: np.ndarray, black: np.ndarray, score: np.ndarray, elapsed: int = 1):
+        """Rate one period; elapsed > 1 when empty periods went by since the last one."""
+        players = len(self.mu)
+        if elapsed > 1:
+            self.phi = np.minimum(np.sqrt(self.phi ** 2 + (elapsed - 1) * self.sigma ** 2), self.max_phi)
+        player = np.concatenate((white, black))
+        opponent = np.concatenate((black, white))
+        s = np.concatenate((score, 1 - score))
+
+        g = 1 / np.sqrt(1 + 3 * self.phi[opponent] ** 2 / np.pi ** 2)
+        e = 1 / (1 + np.exp(-g * (self.mu[player] - self.mu[opponent])))
+        v_inverse = np.bincount(player, g * g * e * (1 - e), minlength=players)
+        improvement = np.bincount(player, g * (s - e), minlength=players)
+
+        active = np.flatnonzero(v_inverse > 0)
+        v = 1 / v_inverse[active]
+        phi = self.phi[active]
+        sigma = self._volatility(phi, self.sigma[active], v, v * improvement[active])
+        new_phi = 1 / np.sqrt(1 / (phi ** 2 + sigma ** 2) + 1 / v)
+
+        self.phi = np.minimum(np.sqrt(self.phi ** 2 + self.sigma ** 2), self.max_phi)
+        self.phi[active] = new_phi
+        self.sigma[active] = sigma
+        self.mu[active] += new_phi ** 2 * improvement[active]
+        self.games += len(white)
+        self.periods += 1
+
+    def result(self) -> np.ndarray:
+        return self.mu * GLICKO_SCALE + 1500
+
+    def deviations(self) -> np.ndarray:
+        return self.phi * GLICKO_SCALE
@@ -0,0 +1,64 @@
+import json
+from collections import OrderedDict, deque
+from typing import List, Optional
+import pubsub
+from config import settings
+
+
+class RecentMoves:
+    """
+    The last few move broadcasts of each game, exactly as sent, so a socket
+    reconnecting after ply k gets only the moves after k. Filled from the
+    game channels, so every worker sees every game's moves. A game that ends
+    on time is dropped (its game_over message is not buffered), and at most
+    max_games games are kept, least recently moved first out.
+    """
+
+    def __init__(self, size: int, max_games: int):
+        self.size = size
+        self.max_games = max_games
+        self._games: "OrderedDict[int, deque]" = OrderedDict()
+        # Reconnects served from the buffer / with a snapshot / told to refetch
+        self.deltas = 0
+        self.snapshots = 0
+        self.resyncs = 0
+
+    def on_message(self, channel: str, message: str):
+        if not channel.startswith("game:"):
+            return
+        game_id = int(channel[5:])
+        try:
+            payload = json.loads(message)
+        except ValueError:
+            return
+        kind = payload.get("type")
+        if kind == "game_over":
+            self._games.pop(game_id, None)
+            return
+        if kind != "move" or not isinstance(payload.get("ply"), int):
+            return
+        moves = self._games.get(game_id)
+        if moves is None:
+            moves = self._games[game_id] = deque(maxlen=self.size)
+            if len(self._games) > self.max_games:
+                self._games.popitem(last=False)
+        else:
+            self._games.move_to_end(game_id)
+            if moves and payload["ply"] != moves[-1][0] + 1:
+                # Missed a broadcast: what is buffered no longer leads up to now
+                moves.clear()
+        moves.append((payload["ply"], message))
+
+    def since(self, game_id: int, ply: int) -> Optional[List[str]]:
+        """Messages of the moves after ply, or None when the buffer cannot tell (send a snapshot)."""
+        moves = self._games.get(game_id)
+        if not moves or ply < moves[0][0] - 1 or ply > moves[-1][0]:
+            return None
+        return [message for move_ply, message in moves if move_ply > ply]
+
+    def stats(self) -> dict:
+        return {"games": len(self._games), "deltas": self.deltas, "snapshots": self.snapshots, "resyncs": self.resyncs}
+
+
+recent_moves = RecentMoves(settings.WS_RESYNC_MOVES, settings.WS_RESYNC_GAMES)
+pubsub.backend.subscribe(recent_moves.on_message)
@@ -0,0 +1,170 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional, Tuple
+from fastapi import Request, Response
+import pubsub
+from config import settings
+
+JSON = "application/json"
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses weak comparison
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+class CacheEntry:
+    __slots__ = ("status", "body", "etag", "stored_at")
+
+    def __init__(self, status: str, body: bytes):
+        self.status = status
+        self.body = body
+        self.etag = make_etag(body)
+        self.stored_at = time.monotonic()
+
+
+class ResponseCache:
+    """
+    Pre-encoded JSON responses for game reads, keyed by (kind, game_id) and
+    LRU-bounded by entry count and total bytes. Finished games never change;
+    entries for other games are dropped on every message published on the
+    game's channel (moves, joins), in this worker and the others, and
+    expire after active_ttl seconds in case the game changed without one
+    (an admin job run with the in-process pub/sub backend).
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int, replica_lag: float = 0.0, active_ttl: float = 5.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.active_ttl = active_ttl
+        # Loads come from a replica: a body read this soon after the game
+        # changed may predate the change, so it is served but not stored
+        self.replica_lag = replica_lag
+        self._changed: "OrderedDict[int, float]" = OrderedDict()
+        self._entries: "OrderedDict[Tuple[str, int], CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        # Games with a load in flight -> (loads, invalidations seen), so a body
+        # read before an invalidation is not stored after it
+        self._loading: dict[int, list] = {}
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _pop(self, key: Tuple[str, int]):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry.body)
+
+    def get(self, kind: str, game_id: int) -> Optional[CacheEntry]:
+        entry = self._entries.get((kind, game_id))
+        if entry is not None and entry.status != "finished" and time.monotonic() - entry.stored_at > self.active_ttl:
+            self._pop((kind, game_id))
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end((kind, game_id))
+        self.hits += 1
+        return entry
+
+    def put(self, kind: str, game_id: int, status: str, body: bytes) -> CacheEntry:
+        entry = CacheEntry(status, body)
+        if len(body) > self.max_bytes:
+            return entry
+        key = (kind, game_id)
+        self._pop(key)
+        self._entries[key] = entry
+        self._bytes += len(body)
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted.body)
+            self.evictions += 1
+        return entry
+
+    def invalidate(self, game_id: int):
+        if game_id in self._loading:
+            self._loading[game_id][1] += 1
+        if self.replica_lag:
+            self._changed.pop(game_id, None)
+            self._changed[game_id] = time.monotonic()
+            cutoff = time.monotonic() - self.replica_lag
+            while self._changed and next(iter(self._changed.values())) < cutoff:
+                self._changed.popitem(last=False)
+        for kind in ("game", "history"):
+            if (kind, game_id) in self._entries:
+                self._pop((kind, game_id))
+                self.invalidations += 1
+
+    def _lagging(self, game_id: int) -> bool:
+        changed = self._changed.get(game_id)
+        return changed is not None and time.monotonic() - changed < self.replica_lag
+
+    def on_message(self, channel: str, message: str):
+        if channel.startswith("game:"):
+            self.invalidate(int(channel[5:]))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "not_modified": self.not_modified,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    async def respond(
+        self, request: Request, kind: str, game_id: int, load: Callable[[], Awaitable[Tuple[str, bytes]]]
+    ) -> Response:
+        """
+        Cached response for (kind, game_id). On a miss load() returns the game
+        status and JSON body; a None status (no such game) is not cached.
+        """
+        entry = self.get(kind, game_id)
+        if entry is None:
+            loading = self._loading.setdefault(game_id, [0, 0])
+            loading[0] += 1
+            seen = loading[1]
+            try:
+                status, body = await load()
+            finally:
+                loading[0] -= 1
+                if not loading[0]:
+                    del self._loading[game_id]
+            if loading[1] == seen and status is not None and not self._lagging(game_id):
+                entry = self.put(kind, game_id, status, body)
+            else:
+                entry = CacheEntry(status, body)
+
+        if entry.status == "finished":
+            headers = {"ETag": entry.etag, "Cache-Control": "public, max-age=86400, immutable"}
+        else:
+            headers = {"ETag": entry.etag, "Cache-Control": "no-cache"}
+        if etag_matches(request.headers.get("if-none-match"), entry.etag):
+            self.not_modified += 1
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry.body, media_type=JSON, headers=headers)
+
+
+response_cache = ResponseCache(
+    settings.RESPONSE_CACHE_SIZE,
+    settings.RESPONSE_CACHE_MAX_BYTES,
+    settings.DATABASE_READ_MAX_LAG_SECONDS if settings.DATABASE_READ_URL else 0.0,
+    settings.RESPONSE_CACHE_ACTIVE_TTL_SECONDS,
+)
+pubsub.backend.subscribe(response_cache.on_message)
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List
 from datetime import datetime
 
@@ -23,6 +23,15 @@ class UserOut(UserBase):
     class Config:
         orm_mode = True
 
+class RankedUserOut(UserOut):
+    rank: int = 0
+
+class RankOut(BaseModel):
+    user_id: int
+    rank: int
+    rating: int
+    total: int
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -32,22 +41,27 @@ class TokenData(BaseModel):
 
 class MoveCreate(BaseModel):
     san: str # e2e4, Nf3 etc.
+    seq: Optional[int] = None # ply this move produces; rejects duplicates/out-of-order when set
 
-class MoveOut(BaseModel):
-    id: int
+class MoveBrief(BaseModel):
+    id: Optional[int] # None for moves rebuilt from Game.moves_packed after their rows were purged
     move_san: str
-    fen_after: str
-    created_at: datetime
+    ply: Optional[int] = None
+    created_at: Optional[datetime]
     player_id: int
 
     class Config:
         orm_mode = True
 
+class MoveOut(MoveBrief):
+    fen_after: Optional[str] = None
+
 class GameBase(BaseModel):
     pass
 
 class GameCreate(GameBase):
-    pass # Just POST to create, maybe optional params later
+    time_control: Optional[int] = Field(None, gt=0, le=3 * 60 * 60) # seconds per player; None for no clock
+    increment: int = Field(0, ge=0, le=180) # seconds added after each move
 
 class GameOut(GameBase):
     id: int
@@ -57,7 +71,80 @@ class GameOut(GameBase):
     status: str
     result: Optional[str]
     created_at: datetime
-    moves: List[MoveOut] = []
+    time_control: Optional[int] = None
+    increment: int = 0
+    white_time_ms: Optional[int] = None
+    black_time_ms: Optional[int] = None
+    last_move_at: Optional[datetime] = None
+    moves: List[MoveBrief] = []
+
+    class Config:
+        orm_mode = True
+
+class LobbyGame(BaseModel):
+    id: int
+    creator_id: int
+    creator_name: Optional[str]
+    creator_rating: Optional[int]
+    created_at: Optional[datetime]
+    age_seconds: Optional[int]
+    time_control: Optional[int] = None
+    increment: int = 0
+
+class MatchmakingOut(BaseModel):
+    status: str # queued, matched, left
+    game_id: Optional[int] = None
+    window: Optional[int] = None # current rating search window while queued
+    waited_seconds: Optional[float] = None
+
+class GameSummary(BaseModel):
+    id: int
+    white_player_id: int
+    black_player_id: Optional[int]
+    status: str
+    result: Optional[str]
+    winner_id: Optional[int]
+    created_at: datetime
+
+    class Config:
+        orm_mode = True
+
+class GameSummaryPage(BaseModel):
+    items: List[GameSummary]
+    next_cursor: Optional[str] = None
+
+class ExplorerMove(BaseModel):
+    uci: str
+    san: str
+    games: int
+    white: int
+    draws: int
+    black: int
+
+class ExplorerOut(BaseModel):
+    fen: str
+    key: int
+    games: int
+    white: int
+    draws: int
+    black: int
+    moves: List[ExplorerMove]
+    recent_games: List[int]
+
+class MoveAnnotation(BaseModel):
+    ply: int
+    san: str
+    eval: int
+    loss: int
+    label: Optional[str] = None
+    best: Optional[str] = None
+
+class AnalysisOut(BaseModel):
+    game_id: int
+    status: str
+    attempts: int
+    evaluator: Optional[str] = None
+    annotations: Optional[List[MoveAnnotation]] = None
 
     class Config:
         orm_mode = True
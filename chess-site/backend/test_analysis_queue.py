@@ -0,0 +1,81 @@
+import os
+import sys
+import tempfile
+
+# Analysis jobs read the game's moves: packed moves when the game has them,
+# otherwise its move rows, which on games from before input was normalized
+# may hold UCI text. Runs against a throwaway SQLite file;
+# python test_analysis_queue.py or pytest.
+os.environ["DATABASE_URL"] = "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(prefix="analysis-"), "analysis.db")
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("ANALYSIS_WORKERS", "0")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import chess
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.future import select
+import database, main, models, move_codec
+from analysis_queue import AnalysisQueue
+
+# Fool's mate, the first two moves as raw client input
+MOVES = ["f2f3", "e7e5", "g4", "Qh4#"]
+SANS = ["f3", "e5", "g4", "Qh4#"]
+
+
+async def insert_game(packed) -> int:
+    async with database.engine.begin() as conn:
+        # Player ids nobody registers, so the other checks sharing the database don't see these games
+        result = await conn.execute(
+            text(
+                "INSERT INTO games (white_player_id, black_player_id, status, result, fen, moves_packed) "
+                "VALUES (101, 102, 'finished', '0-1', 'x', :packed)"
+            ),
+            {"packed": packed},
+        )
+        game_id = result.lastrowid
+        # Legacy rows: no ply
+        for index, move in enumerate(MOVES):
+            await conn.execute(
+                text("INSERT INTO moves (game_id, player_id, move_san) VALUES (:game_id, :player_id, :move)"),
+                {"game_id": game_id, "player_id": 101 + index % 2, "move": move},
+            )
+        await conn.execute(text("INSERT INTO game_analysis (game_id, status, attempts) VALUES (:game_id, 'pending', 0)"), {"game_id": game_id})
+    return game_id
+
+
+async def analyse(game_id: int) -> models.GameAnalysis:
+    queue = AnalysisQueue(1, 10, 3, 60)
+    try:
+        await queue._run(game_id)
+    finally:
+        await queue.stop()
+    async with database.SessionLocal() as db:
+        return await db.scalar(select(models.GameAnalysis).filter(models.GameAnalysis.game_id == game_id))
+
+
+def packed_game() -> bytes:
+    board = chess.Board()
+    for san in SANS[:3]:
+        board.push_san(san)
+    return move_codec.pack_moves(board.move_stack)
+
+
+def test_uci_move_rows_are_analysed():
+    with TestClient(main.app) as client:
+        job = client.portal.call(analyse, client.portal.call(insert_game, None))
+    assert job.status == "done", job.error
+    assert [annotation["san"] for annotation in job.annotations] == SANS
+
+
+def test_packed_moves_take_precedence_over_rows():
+    with TestClient(main.app) as client:
+        job = client.portal.call(analyse, client.portal.call(insert_game, packed_game()))
+    assert job.status == "done", job.error
+    assert [annotation["san"] for annotation in job.annotations] == SANS[:3]
+
+
+if __name__ == "__main__":
+    test_uci_move_rows_are_analysed()
+    test_packed_moves_take_precedence_over_rows()
+    print("ok")
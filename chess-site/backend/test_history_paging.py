@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+
+# Regression check for /users/{id}/history keyset paging: games created in the
+# same second must each be returned exactly once (SQLite stores
+# CURRENT_TIMESTAMP without fractional seconds). Runs against a throwaway
+# SQLite file; python test_history_paging.py or pytest.
+os.environ["DATABASE_URL"] = "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(prefix="history-"), "history.db")
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("ANALYSIS_WORKERS", "0")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+import database, main
+
+ROWS = (
+    # Both forms SQLite ends up with: CURRENT_TIMESTAMP text and Python datetimes
+    ["2026-01-01 10:00:10"] * 5 + ["2026-01-01 10:00:10.000000"] * 2 + ["2026-01-01 10:00:09"] * 3
+)
+
+
+async def insert_games():
+    async with database.engine.begin() as conn:
+        for created_at in ROWS:
+            await conn.execute(
+                text(
+                    "INSERT INTO games (white_player_id, black_player_id, status, fen, created_at) "
+                    "VALUES (1, 2, 'finished', :fen, :created_at)"
+                ),
+                {"fen": "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1", "created_at": created_at},
+            )
+
+
+def test_history_pages_through_identical_timestamps():
+    with TestClient(main.app) as client:
+        for name in ("alice", "bob"):
+            response = client.post("/register", json={"username": name, "email": f"{name}@example.com", "password": "pw"})
+            assert response.status_code == 200, response.text
+        client.portal.call(insert_games)
+
+        seen, cursor = [], None
+        for _ in range(20):
+            params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            page = client.get("/users/1/history", params=params).json()
+            seen += [game["id"] for game in page["items"]]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        assert cursor is None, "paging did not terminate"
+        assert len(seen) == len(ROWS), seen
+        assert len(seen) == len(set(seen)), seen
+
+
+if __name__ == "__main__":
+    test_history_pages_through_identical_timestamps()
+    print("ok")
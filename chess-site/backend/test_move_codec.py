@@ -0,0 +1,101 @@
+import os
+import sys
+
+# Lossless round trip of the packed move format, no database needed:
+# python test_move_codec.py or pytest.
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("DATABASE_URL", "sqlite+aiosqlite:///:memory:")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import random
+import chess
+import move_codec
+
+SPECIAL_KINDS = {
+    "kingside castling", "queenside castling", "en passant white", "en passant black",
+    "knight", "bishop", "rook", "queen",
+}
+
+
+def random_game(rng: random.Random, max_plies: int = 300) -> list:
+    board = chess.Board()
+    sans = []
+    while not board.is_game_over() and len(sans) < max_plies:
+        move = rng.choice(list(board.legal_moves))
+        sans.append(board.san(move))
+        board.push(move)
+    return sans
+
+
+def special_kinds(board: chess.Board) -> set:
+    played = chess.Board()
+    kinds = set()
+    for move in board.move_stack:
+        if played.is_castling(move):
+            kinds.add("kingside castling" if chess.square_file(move.to_square) == 6 else "queenside castling")
+        if played.is_en_passant(move):
+            kinds.add("en passant white" if played.turn == chess.WHITE else "en passant black")
+        if move.promotion:
+            kinds.add(chess.piece_name(move.promotion))
+        played.push(move)
+    return kinds
+
+
+def round_trip(sans):
+    board = chess.Board()
+    moves = []
+    for san in sans:
+        moves.append(board.push_san(san))
+    packed = move_codec.pack_moves(moves)
+    assert len(packed) == move_codec.MOVE_SIZE * len(moves)
+    assert move_codec.ply_count(packed) == len(moves)
+    assert move_codec.unpack_moves(packed) == moves
+
+    appended = b""
+    for move in moves:
+        appended = move_codec.append_move(appended, move)
+    assert appended == packed
+
+    replayed, replayed_sans = move_codec.replay(packed)
+    assert replayed_sans == list(sans)
+    assert replayed.fen() == board.fen()
+    return board
+
+
+def test_special_moves_round_trip():
+    # Random games (fixed seed) until castling both ways, en passant by both
+    # colours and promotion to every piece have all been round-tripped
+    rng = random.Random(1)
+    seen = set()
+    for _ in range(2000):
+        seen |= special_kinds(round_trip(random_game(rng)))
+        if seen == SPECIAL_KINDS:
+            break
+    assert seen == SPECIAL_KINDS, SPECIAL_KINDS - seen
+
+
+def test_every_move_code_round_trips():
+    for from_square in chess.SQUARES:
+        for to_square in chess.SQUARES:
+            for promotion in (None, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN):
+                move = chess.Move(from_square, to_square, promotion)
+                assert move_codec.decode_move(move_codec.encode_move(move)) == move
+
+
+def test_position_cache_matches_replay():
+    board = chess.Board()
+    fens = []
+    for san in random_game(random.Random(3)):
+        board.push_san(san)
+        fens.append(board.fen())
+    packed = move_codec.pack_moves(board.move_stack)
+    cache = move_codec.PositionCache(4)
+    assert list(cache.fens(packed)) == fens
+    assert cache.fen_after(packed, len(fens)) == fens[-1]
+
+
+if __name__ == "__main__":
+    test_special_moves_round_trip()
+    test_every_move_code_round_trips()
+    test_position_cache_matches_replay()
+    print("ok")
@@ -0,0 +1,146 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# The write-behind move journal (MOVE_DURABILITY=group) against a throwaway
+# SQLite file: segments left by a crash are replayed, replaying a segment
+# twice changes nothing, and moves whose game moved on elsewhere are dropped
+# without their commit callback. python test_move_journal.py or pytest.
+os.environ["DATABASE_URL"] = "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(prefix="journal-"), "journal.db")
+os.environ.setdefault("SECRET_KEY", "test")
+os.environ.setdefault("ANALYSIS_WORKERS", "0")
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import chess
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+import database, explorer, games, main, move_codec
+from move_journal import MoveJournal
+
+SANS = ["e4", "e5", "Nf3", "Nc6"]
+START_FEN = chess.STARTING_FEN
+
+
+def journal_records(game_id: int, sans=SANS) -> list:
+    """Records as games._journal_move writes them, for moves from the initial position."""
+    board = chess.Board()
+    packed = b""
+    records = []
+    for ply, san in enumerate(sans, start=1):
+        fen_before = board.fen()
+        move = board.parse_san(san)
+        packed = move_codec.append_move(packed, move)
+        board.push(move)
+        records.append({
+            "game_id": game_id, "ply": ply, "player_id": 301 + (ply + 1) % 2, "san": san, "at": time.time(),
+            "fen_before": fen_before, "fen": board.fen(), "key": explorer.position_key(board),
+            "packed": packed.hex(), "clock": None,
+        })
+    return records
+
+
+async def insert_game() -> int:
+    async with database.engine.begin() as conn:
+        # Player ids nobody registers, so the other checks sharing the database don't see these games
+        result = await conn.execute(
+            text("INSERT INTO games (white_player_id, black_player_id, status, fen, moves_packed) VALUES (301, 302, 'active', :fen, :packed)"),
+            {"fen": START_FEN, "packed": b""},
+        )
+        return result.lastrowid
+
+
+async def stored(game_id: int):
+    async with database.engine.connect() as conn:
+        game = (await conn.execute(text("SELECT fen, moves_packed FROM games WHERE id = :id"), {"id": game_id})).first()
+        moves = (await conn.execute(
+            text("SELECT ply, move_san FROM moves WHERE game_id = :id ORDER BY id"), {"id": game_id}
+        )).all()
+    return game.fen, bytes(game.moves_packed or b""), [tuple(move) for move in moves]
+
+
+async def journal_without_flush(directory: str, records: list):
+    # Appended and acknowledged, then the process "dies" before any flush
+    journal = MoveJournal(directory, 3600, 1000, fsync=False)
+    journal.start(games.flush_moves)
+    for record in records:
+        await journal.append(record)
+    journal._timer.cancel()
+    journal._file.close()
+
+
+async def replay(directory: str) -> int:
+    return await MoveJournal(directory, 3600, 1000, fsync=False).replay(games.flush_moves)
+
+
+def expected(records: list):
+    last = records[-1]
+    return last["fen"], bytes.fromhex(last["packed"]), [(record["ply"], record["san"]) for record in records]
+
+
+def test_replay_writes_journaled_moves_once():
+    directory = tempfile.mkdtemp(prefix="segments-")
+    with TestClient(main.app) as client:
+        game_id = client.portal.call(insert_game)
+        records = journal_records(game_id)
+        client.portal.call(journal_without_flush, directory, records)
+        assert client.portal.call(stored, game_id) == (START_FEN, b"", [])
+
+        # Kept aside to replay the same segments a second time
+        segments = [name for name in os.listdir(directory) if name.endswith(".log")]
+        assert segments
+        copies = tempfile.mkdtemp(prefix="segments-copy-")
+        for name in segments:
+            shutil.copy(os.path.join(directory, name), copies)
+
+        assert client.portal.call(replay, directory) == len(records)
+        assert os.listdir(directory) == []
+        assert client.portal.call(stored, game_id) == expected(records)
+
+        for name in segments:
+            shutil.copy(os.path.join(copies, name), directory)
+        client.portal.call(replay, directory)
+        assert client.portal.call(stored, game_id) == expected(records)
+
+
+async def flush_with_callbacks(directory: str, records: list, clobbered_game_id: int) -> tuple:
+    events = []
+    journal = MoveJournal(directory, 3600, 1000, fsync=False)
+    journal.start(games.flush_moves)
+    for record in records:
+        async def committed(record=record):
+            events.append(("committed", record["game_id"], record["ply"]))
+
+        async def dropped(record=record):
+            events.append(("dropped", record["game_id"], record["ply"]))
+
+        await journal.append(record, committed, dropped)
+    # Another worker moves in one of the games before the flush
+    async with database.engine.begin() as conn:
+        await conn.execute(text("UPDATE games SET fen = '8/8/8/8/8/8/8/K6k w - - 0 1' WHERE id = :id"), {"id": clobbered_game_id})
+    await journal.flush()
+    stats = journal.stats()
+    await journal.stop()
+    return events, stats
+
+
+def test_dropped_moves_get_on_dropped_instead_of_the_commit_callback():
+    directory = tempfile.mkdtemp(prefix="segments-")
+    with TestClient(main.app) as client:
+        kept, clobbered = client.portal.call(insert_game), client.portal.call(insert_game)
+        records = journal_records(kept, SANS[:2]) + journal_records(clobbered, SANS[:2])
+        events, stats = client.portal.call(flush_with_callbacks, directory, records, clobbered)
+
+        assert events == [
+            ("committed", kept, 1), ("committed", kept, 2), ("dropped", clobbered, 1), ("dropped", clobbered, 2),
+        ]
+        assert stats["flushed"] == 2 and stats["dropped"] == 2
+        assert client.portal.call(stored, kept) == expected(records[:2])
+        assert client.portal.call(stored, clobbered)[2] == []
+
+
+if __name__ == "__main__":
+    test_replay_writes_journaled_moves_once()
+    test_dropped_moves_get_on_dropped_instead_of_the_commit_callback()
+    print("ok")
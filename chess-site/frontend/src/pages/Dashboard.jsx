@@ -1,22 +1,62 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { gameAPI } from '../services/api';
 import { Link, useNavigate } from 'react-router-dom';
 import toast from 'react-hot-toast';
 import RetroCard from '../components/common/RetroCard';
 import RetroButton from '../components/common/RetroButton';
 
+// Lobby entries shown like the games list (open games are always waiting)
+const fromLobby = (entry) => ({
+    id: entry.id,
+    white_player_id: entry.creator_id,
+    white_player_name: entry.creator_name,
+    white_player_rating: entry.creator_rating,
+    black_player_id: null,
+    status: 'waiting',
+});
+
 const Dashboard = () => {
-    const [games, setGames] = useState([]);
+    const [openGames, setOpenGames] = useState([]);
+    const [activeGames, setActiveGames] = useState([]);
+    const [searching, setSearching] = useState(false);
+    const searchingRef = useRef(false);
     const navigate = useNavigate();
+    const games = [...openGames, ...activeGames];
 
     useEffect(() => {
-        fetchGames();
+        fetchActiveGames();
+
+        // Open games come from the lobby feed: a snapshot, then add/remove deltas
+        const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+        const socket = new WebSocket(`${protocol}//${window.location.host}/ws/lobby`);
+        socket.onmessage = (event) => {
+            let message;
+            try {
+                message = JSON.parse(event.data);
+            } catch (e) {
+                return;
+            }
+            if (message.type === 'snapshot') {
+                setOpenGames(message.games.map(fromLobby));
+            } else if (message.type === 'add') {
+                setOpenGames((current) => [...current.filter((g) => g.id !== message.game.id), fromLobby(message.game)]);
+            } else if (message.type === 'remove') {
+                setOpenGames((current) => current.filter((g) => g.id !== message.id));
+            }
+        };
+        return () => {
+            socket.close(1000);
+            if (searchingRef.current) {
+                searchingRef.current = false;
+                gameAPI.leaveMatch().catch(() => {});
+            }
+        };
     }, []);
 
-    const fetchGames = async () => {
+    const fetchActiveGames = async () => {
         try {
             const { data } = await gameAPI.getGames();
-            setGames(data);
+            setActiveGames(data.filter((game) => game.status === 'active'));
         } catch (error) {
             console.error("Failed to fetch games", error);
         }
@@ -32,6 +72,40 @@ const Dashboard = () => {
         }
     };
 
+    // Long-polls the matchmaking queue until paired or cancelled
+    const findMatch = async () => {
+        searchingRef.current = true;
+        setSearching(true);
+        try {
+            while (searchingRef.current) {
+                const { data } = await gameAPI.findMatch();
+                if (data.status === 'matched') {
+                    searchingRef.current = false;
+                    toast.success('Opponent found');
+                    navigate(`/game/${data.game_id}`);
+                    return;
+                }
+                if (data.status === 'left') {
+                    break;
+                }
+            }
+        } catch (error) {
+            toast.error(error.response?.data?.detail || 'Matchmaking failed');
+        }
+        searchingRef.current = false;
+        setSearching(false);
+    };
+
+    const cancelMatch = async () => {
+        searchingRef.current = false;
+        setSearching(false);
+        try {
+            await gameAPI.leaveMatch();
+        } catch (error) {
+            toast.error(error.response?.data?.detail || 'Failed to leave the queue');
+        }
+    };
+
     const joinGame = async (gameId) => {
         try {
             await gameAPI.joinGame(gameId);
@@ -57,9 +131,14 @@ const Dashboard = () => {
 
                 <div className="flex justify-between items-center" style={{ marginBottom: '1rem', borderBottom: '2px solid black', paddingBottom: '1rem' }}>
                     <div style={{ fontWeight: 'bold' }}>{games.length} ACTIVE PROCESS(ES)</div>
-                    <RetroButton onClick={createGame}>
-                        + NEW_GAME.EXE
-                    </RetroButton>
+                    <div style={{ display: 'flex', gap: '0.5rem' }}>
+                        <RetroButton onClick={searching ? cancelMatch : findMatch}>
+                            {searching ? 'CANCEL_SEARCH' : 'QUICK_MATCH.EXE'}
+                        </RetroButton>
+                        <RetroButton onClick={createGame}>
+                            + NEW_GAME.EXE
+                        </RetroButton>
+                    </div>
                 </div>
 
                 <div style={{ display: 'grid', gap: '1rem' }}>
@@ -80,7 +159,7 @@ const Dashboard = () => {
                                 <div>
                                     <div style={{ fontWeight: 'bold', fontSize: '1.1rem' }}>GAME_ID: {game.id}</div>
                                     <div style={{ fontSize: '0.9rem', marginTop: '0.25rem' }}>
-                                        WHITE: {game.white_player_id} | BLACK: {game.black_player_id || 'Waiting...'}
+                                        WHITE: {game.white_player_name ? `${game.white_player_name} (${game.white_player_rating})` : game.white_player_id} | BLACK: {game.black_player_id || 'Waiting...'}
                                     </div>
                                     <div style={{
                                         marginTop: '0.5rem',
@@ -13,6 +13,11 @@ const customDarkSquareStyle = { backgroundColor: '#B88762' };
 const customLightSquareStyle = { backgroundColor: '#EED2B6' };
 const customBoardStyle = { borderRadius: '0' };
 
+const formatClock = (ms) => {
+    const total = Math.max(0, Math.ceil(ms / 1000));
+    return `${Math.floor(total / 60)}:${String(total % 60).padStart(2, '0')}`;
+};
+
 const Game = () => {
     const { id } = useParams();
     const { user } = useAuth();
@@ -23,6 +28,7 @@ const Game = () => {
     const [isConnected, setIsConnected] = useState(false);
     const [selectedSquare, setSelectedSquare] = useState(null);
     const [legalMoves, setLegalMoves] = useState([]);
+    const [now, setNow] = useState(() => Date.now());
 
     // Refs to hold latest state for stable callbacks
     const gameRef = useRef(game);
@@ -52,49 +58,101 @@ const Game = () => {
         };
     }, [id]);
 
-    const fetchGame = async () => {
-        try {
-            const { data } = await gameAPI.getGame(id);
-            setGameState(data);
+    // Re-render running clocks a few times a second
+    useEffect(() => {
+        if (!gameState?.time_control || gameState.status !== 'active') return undefined;
+        const ticker = setInterval(() => setNow(Date.now()), 250);
+        return () => clearInterval(ticker);
+    }, [gameState?.time_control, gameState?.status]);
 
-            // Reconstruct game object with history
-            const newGame = new Chess();
+    const loadGame = (data) => {
+        setGameState(data);
+        gameStateRef.current = data;
 
-            if (data.moves && data.moves.length > 0) {
-                // Sort moves by ID to ensure chronological order
-                const sortedMoves = [...data.moves].sort((a, b) => a.id - b.id);
+        // Reconstruct game object with history
+        const newGame = new Chess();
 
-                // Replay all moves
-                sortedMoves.forEach(move => {
-                    try {
-                        newGame.move(move.move_san);
-                    } catch (e) {
-                        console.error("Error replaying move:", move.move_san, e);
-                    }
-                });
-            } else if (data.fen) {
-                // Fallback: If no moves but we have FEN (e.g. custom start pos), use it
-                // Note: This won't have history
-                if (data.fen !== newGame.fen()) {
-                    newGame.load(data.fen);
+        if (data.moves && data.moves.length > 0) {
+            // Sort moves by ply to ensure chronological order (the server numbers rows older than ply numbers)
+            const sortedMoves = [...data.moves].sort((a, b) => a.ply - b.ply);
+
+            // Replay all moves
+            sortedMoves.forEach(move => {
+                try {
+                    newGame.move(move.move_san);
+                } catch (e) {
+                    console.error("Error replaying move:", move.move_san, e);
                 }
+            });
+        } else if (data.fen) {
+            // Fallback: If no moves but we have FEN (e.g. custom start pos), use it
+            // Note: This won't have history
+            if (data.fen !== newGame.fen()) {
+                newGame.load(data.fen);
             }
+        }
 
-            setGame(newGame);
+        setGame(newGame);
+        gameRef.current = newGame;
 
-            if (user && data.black_player_id === user.id) {
-                setBoardOrientation('black');
-            }
+        if (user && data.black_player_id === user.id) {
+            setBoardOrientation('black');
+        }
+    };
+
+    const fetchGame = async () => {
+        try {
+            const { data } = await gameAPI.getGame(id);
+            loadGame(data);
         } catch (error) {
             toast.error("Failed to load game");
         }
     };
 
+    // Apply a broadcast move on top of the local game; false if moves are missing before it
+    const applyMove = (message) => {
+        const currentGame = gameRef.current;
+        const known = currentGame.history().length;
+        if (message.ply <= known) {
+            // Our own optimistic move, or one we already have
+            return true;
+        }
+        if (message.ply !== known + 1) {
+            return false;
+        }
+        const nextGame = new Chess();
+        try {
+            nextGame.loadPgn(currentGame.pgn());
+            nextGame.move(message.san);
+        } catch (e) {
+            return false;
+        }
+        setGame(nextGame);
+        gameRef.current = nextGame;
+        setGameState((state) => state && {
+            ...state,
+            fen: message.fen,
+            ...(message.white_ms !== undefined && {
+                white_time_ms: message.white_ms,
+                black_time_ms: message.black_ms,
+                last_move_at: new Date().toISOString(),
+            }),
+        });
+        return true;
+    };
+
     const connectWebSocket = useCallback((retryCount = 0) => {
         // Use relative path so Vite proxy forwards to backend
         const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
         const host = window.location.host;
-        const wsUrl = `${protocol}//${host}/ws/game/${id}`;
+        // The token authenticates the socket once so moves can be sent over it
+        const params = new URLSearchParams();
+        const token = localStorage.getItem('token');
+        if (token) params.set('token', token);
+        // Once the game is loaded, ask only for the moves made since (or a snapshot)
+        if (gameStateRef.current) params.set('last_ply', String(gameRef.current.history().length));
+        const query = params.toString() ? `?${params}` : '';
+        const wsUrl = `${protocol}//${host}/ws/game/${id}${query}`;
 
         try {
             const socket = new WebSocket(wsUrl);
@@ -114,16 +172,54 @@ const Game = () => {
             };
 
             socket.onmessage = (event) => {
-                const message = event.data;
-                if (message.startsWith("move:")) {
+                let message;
+                try {
+                    message = JSON.parse(event.data);
+                } catch (e) {
+                    return;
+                }
+                if (message.type === 'move') {
+                    if (message.ply === undefined) {
+                        fetchGame();
+                    } else if (!applyMove(message)) {
+                        // Missed a move: reconnect with last_ply for the ones in between
+                        socket.close(1000);
+                        connectWebSocket();
+                    } else if (message.result) {
+                        toast(`Game over: ${message.result}`);
+                        fetchGame();
+                    }
+                } else if (message.type === 'snapshot') {
+                    loadGame(message.game);
+                } else if (message.type === 'resync') {
+                    // The server could not tell which moves we missed
                     fetchGame();
-                } else if (message === "player_joined") {
+                } else if (message.type === 'move_dropped') {
+                    // An acknowledged move that never reached the database: resync
+                    if (user && message.player_id === user.id) {
+                        toast.error(message.detail || "Move was not saved");
+                    }
+                    fetchGame();
+                } else if (message.type === 'game_over') {
+                    toast(`Game over: ${message.result}${message.reason === 'timeout' ? ' on time' : ''}`);
+                    fetchGame();
+                } else if (message.type === 'player_joined') {
                     toast.success("Player joined!");
                     fetchGame();
+                } else if (message.type === 'ack') {
+                    if (!message.duplicate) {
+                        toast.success(`Move: ${message.san}`);
+                    }
+                } else if (message.type === 'error') {
+                    // The server rejected our move: resync with its state
+                    toast.error(message.detail || "Move rejected by server");
+                    fetchGame();
                 }
             };
 
             socket.onclose = (event) => {
+                // Replaced by a resync connection
+                if (socketRef.current !== socket) return;
                 setIsConnected(false);
                 // Only retry on abnormal closure (not user-initiated)
                 if (event.code !== 1000 && retryCount < 3) {
@@ -173,7 +269,13 @@ const Game = () => {
         setSelectedSquare(null);
         setLegalMoves([]);
 
-        // Send the move to the backend.
+        // Prefer the already-authenticated socket; fall back to HTTP.
+        const socket = socketRef.current;
+        if (socket && socket.readyState === WebSocket.OPEN) {
+            socket.send(JSON.stringify({ type: 'move', seq: gameCopy.history().length, san: move.san }));
+            return true;
+        }
+
         gameAPI.makeMove(id, move.san)
             .then(() => {
                 // The move was successful.
@@ -263,6 +365,14 @@ const Game = () => {
 
     if (!gameState) return <div className="container"><RetroCard>LOADING_GAME_DATA...</RetroCard></div>;
 
+    // Stored times are as of last_move_at; the side to move's clock is running since then
+    const clockFor = (color) => {
+        const stored = color === 'w' ? gameState.white_time_ms : gameState.black_time_ms;
+        const base = stored ?? gameState.time_control * 1000;
+        if (gameState.status !== 'active' || !gameState.last_move_at || game.turn() !== color) return base;
+        return base - (now - new Date(gameState.last_move_at).getTime());
+    };
+
     return (
         <div className="container" style={{ paddingBottom: '2rem', display: 'flex', flexDirection: 'column', gap: '1rem' }}>
 
@@ -312,6 +422,17 @@ const Game = () => {
                                     </div>
                                 )}
                             </div>
+                            {gameState.time_control && (
+                                <div>
+                                    <div style={{ fontWeight: 'bold', marginBottom: '0.25rem', borderBottom: '2px solid black' }}>
+                                        CLOCK {gameState.time_control / 60}+{gameState.increment}
+                                    </div>
+                                    <div style={{ display: 'flex', flexDirection: 'column' }}>
+                                        <span>WHITE: {formatClock(clockFor('w'))}</span>
+                                        <span>BLACK: {formatClock(clockFor('b'))}</span>
+                                    </div>
+                                </div>
+                            )}
                             <div>
                                 <div style={{ fontWeight: 'bold', marginBottom: '0.25rem', borderBottom: '2px solid black' }}>TURN</div>
                                 <div>{game.turn() === 'w' ? 'WHITE' : 'BLACK'}</div>
@@ -55,6 +55,8 @@ export const gameAPI = {
     getGame: (gameId) => api.get(`/games/${gameId}`),
     makeMove: (gameId, san) => api.post(`/games/${gameId}/move`, { san }),
     getHistory: (gameId) => api.get(`/games/${gameId}/history`),
+    findMatch: () => api.post('/matchmaking'),
+    leaveMatch: () => api.delete('/matchmaking'),
 };
 
 export const userAPI = {